@@ -0,0 +1,45 @@
+"""
+Postir V2 — Shared runtime package for the Vercel API functions
+Every endpoint imports its Supabase, auth, HTTP and table helpers from here
+instead of carrying an inlined copy. Submodules load lazily on first
+attribute access, so a function only pays the import cost of what it uses:
+
+    from _core import supabase, tables
+    from _core.handler import JSONHandler
+
+No external dependencies — stdlib only.
+"""
+import importlib
+
+__all__ = [
+    "asset_store",
+    "breaker",
+    "compression",
+    "deadline",
+    "gen_cache",
+    "handler",
+    "hashtag_index",
+    "hedge",
+    "http_pool",
+    "jobs",
+    "json_stream",
+    "jwt_auth",
+    "model_router",
+    "near_dup",
+    "post_gen",
+    "profile_cache",
+    "supabase",
+    "tables",
+    "template_bank",
+    "token_budget",
+    "workers",
+    "write_behind",
+]
+
+
+def __getattr__(name):
+    if name in __all__:
+        module = importlib.import_module(f".{name}", __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,173 @@
+"""
+Postir V2 — Content-addressed asset store
+Generated images are stored under the SHA-256 of their bytes (plus an
+extension), so identical output is written once and a key always names
+the same immutable content. Two backends behind put()/get()
+(ASSET_STORE_BACKEND): "local" keeps files under ASSET_STORE_DIR (one
+long-lived host or development); "supabase" uploads to a private Supabase
+Storage bucket (the default on Vercel, where /tmp is per instance).
+Assets are served by /api/assets/{key}. Recently stored or fetched assets
+stay in a small in-process LRU, so the fetch that follows a generation on
+the same instance skips the round-trip. No external dependencies —
+stdlib only.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+
+# ===== CONFIG =====
+ASSET_STORE_BACKEND = os.environ.get("ASSET_STORE_BACKEND", "supabase" if os.environ.get("VERCEL") else "local")
+ASSET_STORE_DIR = os.environ.get("ASSET_STORE_DIR", "/tmp/postir-assets")
+ASSET_BUCKET = os.environ.get("ASSET_BUCKET", "generated-assets")
+ASSET_CACHE_BYTES = int(os.environ.get("ASSET_CACHE_BYTES", str(32 * 1024 * 1024)))
+ASSET_URL_PREFIX = "/api/assets/"
+ASSET_TIMEOUT_SECONDS = 15
+
+_EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp"}
+_MIME_TYPES = {ext: mime for mime, ext in _EXTENSIONS.items()}
+_KEY_RE = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]{2,4}$")
+
+_lock = threading.Lock()
+_cache = OrderedDict()              # key -> bytes, most recent last
+_cache_bytes = 0
+
+
+class StoreUnavailable(Exception):
+    """The backend could not be read or written. Callers fall back or answer 503."""
+
+
+def key_for(data, mime="image/png"):
+    return f"{hashlib.sha256(data).hexdigest()}.{_EXTENSIONS.get(mime, 'bin')}"
+
+
+def is_key(key):
+    return bool(_KEY_RE.match(key or ""))
+
+
+def mime_for(key):
+    return _MIME_TYPES.get(key.rpartition(".")[2], "application/octet-stream")
+
+
+def etag_for(key):
+    """Strong ETag: the content hash itself."""
+    return f'"{key.partition(".")[0]}"'
+
+
+def url(key):
+    return f"{ASSET_URL_PREFIX}{key}"
+
+
+def put(data, mime="image/png"):
+    """Store data; returns its key. Raises StoreUnavailable if the backend write fails."""
+    key = key_for(data, mime)
+    with _lock:
+        stored = key in _cache
+    if not stored:
+        if ASSET_STORE_BACKEND == "supabase":
+            _put_supabase(key, data, mime)
+        else:
+            _put_local(key, data)
+    _remember(key, data)
+    return key
+
+
+def get(key):
+    """The asset's bytes, or None if there is no such asset. Raises StoreUnavailable."""
+    if not is_key(key):
+        return None
+    with _lock:
+        data = _cache.get(key)
+        if data is not None:
+            _cache.move_to_end(key)
+            return data
+    data = _get_supabase(key) if ASSET_STORE_BACKEND == "supabase" else _get_local(key)
+    if data is not None:
+        _remember(key, data)
+    return data
+
+
+def _remember(key, data):
+    global _cache_bytes
+    if len(data) > ASSET_CACHE_BYTES // 4:
+        return
+    with _lock:
+        if key not in _cache:
+            _cache[key] = data
+            _cache_bytes += len(data)
+        _cache.move_to_end(key)
+        while _cache_bytes > ASSET_CACHE_BYTES:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted)
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Backends
+# ══════════════════════════════════════════════════════════════════════
+
+def _local_path(key):
+    # Two-level fan-out keeps directories small.
+    return os.path.join(ASSET_STORE_DIR, key[:2], key)
+
+
+def _put_local(key, data):
+    path = _local_path(key)
+    if os.path.exists(path):
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError as exc:
+        raise StoreUnavailable(f"asset write failed: {exc}") from exc
+
+
+def _get_local(key):
+    try:
+        with open(_local_path(key), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+    except OSError as exc:
+        raise StoreUnavailable(f"asset read failed: {exc}") from exc
+
+
+def _storage_request(method, key, body=None, headers=None):
+    import http.client
+
+    from . import deadline, http_pool, supabase
+
+    supabase_url, service_key, _ = supabase.get_supabase_config()
+    if not supabase_url or not service_key:
+        raise StoreUnavailable("Supabase Storage not configured")
+    try:
+        return http_pool.request(
+            method, f"{supabase_url}/storage/v1/object/{ASSET_BUCKET}/{key}", body=body,
+            headers={"apikey": service_key, "Authorization": f"Bearer {service_key}", **(headers or {})},
+            timeout=deadline.timeout(ASSET_TIMEOUT_SECONDS),
+        )
+    except (OSError, http.client.HTTPException, deadline.DeadlineExceeded) as exc:
+        raise StoreUnavailable(f"Supabase Storage unreachable: {exc}") from exc
+
+
+def _put_supabase(key, data, mime):
+    # x-upsert: the same key always carries the same bytes, so overwriting is harmless.
+    status, _, _, body = _storage_request("POST", key, body=data, headers={
+        "Content-Type": mime, "x-upsert": "true", "Cache-Control": "max-age=31536000",
+    })
+    if status >= 300:
+        raise StoreUnavailable(f"Supabase Storage upload failed: {status} {body[:200]!r}")
+
+
+def _get_supabase(key):
+    status, _, _, body = _storage_request("GET", key)
+    if status == 200:
+        return body
+    # Storage reports a missing object as 404, or as 400 with a 404 body.
+    if status == 404 or (status == 400 and b"not_found" in body.lower().replace(b" ", b"_")):
+        return None
+    raise StoreUnavailable(f"Supabase Storage read failed: {status}")
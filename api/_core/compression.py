@@ -0,0 +1,109 @@
+"""
+Postir V2 — Negotiated response compression
+Picks br or gzip from the request's Accept-Encoding (q-values honoured;
+br only when the optional `brotli` module is installed) and compresses
+incrementally: JSON bodies are encoded piece by piece straight into the
+compressor, so the uncompressed body is never held as one more full copy,
+and streamed events are flushed through the same compressor one event at
+a time. Bodies under COMPRESS_MIN_BYTES go out as they are.
+"""
+import json
+import os
+import zlib
+
+
+# ===== CONFIG =====
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "1") in ("1", "true", "yes")
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = 6
+COMPRESS_BROTLI_QUALITY = 5         # dynamic responses: 5 is near gzip -9 size at gzip -6 speed
+COMPRESS_PIECE_BYTES = 64 * 1024    # JSON is fed to the compressor in pieces of about this size
+
+_brotli = None                      # the module once imported, False if it is not installed
+_json_encoder = json.JSONEncoder(ensure_ascii=False)
+
+
+def _brotli_module():
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+            _brotli = brotli
+        except ImportError:
+            _brotli = False
+    return _brotli
+
+
+def negotiate(accept_encoding):
+    """"br", "gzip" or None for an Accept-Encoding value; br wins ties."""
+    if not COMPRESSION_ENABLED or not accept_encoding:
+        return None
+    offered = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        offered[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in ("br", "gzip"):
+        q = offered.get(encoding, offered.get("*", 0.0))
+        if q > best_q and (encoding != "br" or _brotli_module()):
+            best, best_q = encoding, q
+    return best
+
+
+class Encoder:
+    """Incremental compressor: compress() what is written, flush() after each streamed event, finish() once."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "br":
+            compressor = _brotli_module().Compressor(quality=COMPRESS_BROTLI_QUALITY)
+            self.compress, self.flush, self.finish = compressor.process, compressor.flush, compressor.finish
+        else:
+            compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)     # 31: gzip framing
+            self.compress, self.finish = compressor.compress, compressor.flush
+            self.flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def iter_json(data):
+    """UTF-8 JSON of data in pieces of about COMPRESS_PIECE_BYTES."""
+    parts, size = [], 0
+    for fragment in _json_encoder.iterencode(data):
+        parts.append(fragment)
+        size += len(fragment)
+        if size >= COMPRESS_PIECE_BYTES:
+            yield "".join(parts).encode("utf-8")
+            parts, size = [], 0
+    if parts:
+        yield "".join(parts).encode("utf-8")
+
+
+def encode_json(data, encoding=None):
+    """
+    (pieces, length, applied encoding) of data's JSON body. It is
+    compressed with encoding once it reaches COMPRESS_MIN_BYTES; the
+    applied encoding is None when it went out uncompressed.
+    """
+    raw, size, encoder, out = [], 0, None, []
+    for piece in iter_json(data):
+        if encoder is not None:
+            out.append(encoder.compress(piece))
+            continue
+        raw.append(piece)
+        size += len(piece)
+        if encoding and size >= COMPRESS_MIN_BYTES:
+            encoder = Encoder(encoding)
+            out.append(encoder.compress(b"".join(raw)))
+            raw = None
+    if encoder is None:
+        return raw, size, None
+    out.append(encoder.finish())
+    out = [piece for piece in out if piece]
+    return out, sum(len(piece) for piece in out), encoding
@@ -0,0 +1,55 @@
+"""
+Postir V2 — Per-request deadline
+JSONHandler starts one deadline per request (REQUEST_DEADLINE_SECONDS,
+set it a little under the function's maxDuration). Every upstream call
+takes its timeout from timeout(cap): the time remaining minus a reserve
+for writing the response, never more than the call's own cap. The main
+(slow) upstream of an endpoint keeps DEADLINE_TAIL_RESERVE_SECONDS back
+so the fallback, the debit and the write still fit. The deadline lives
+in a contextvar; _core.workers pools carry it into their threads.
+"""
+import contextvars
+import os
+import time
+
+
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("REQUEST_DEADLINE_SECONDS", "60"))
+DEADLINE_RESERVE_SECONDS = float(os.environ.get("DEADLINE_RESERVE_SECONDS", "1"))
+DEADLINE_TAIL_RESERVE_SECONDS = float(os.environ.get("DEADLINE_TAIL_RESERVE_SECONDS", "4"))
+DEADLINE_BILLING_RESERVE_SECONDS = 0.0   # billing RPCs run after the content: nothing left to protect
+DEADLINE_MIN_TIMEOUT = 0.5          # not worth starting a call with less than this
+
+_expires_at = contextvars.ContextVar("postir_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Too little time left to start an upstream call. Callers fall back."""
+
+
+def start(seconds=None):
+    """Begin a request's deadline in the current context."""
+    _expires_at.set(time.monotonic() + (REQUEST_DEADLINE_SECONDS if seconds is None else seconds))
+
+
+def remaining():
+    """Seconds left; infinite outside a request (scripts, warm-up)."""
+    expires_at = _expires_at.get()
+    return float("inf") if expires_at is None else expires_at - time.monotonic()
+
+
+def budget(cap, reserve=DEADLINE_RESERVE_SECONDS):
+    """Time a call may take: at most cap, at most what is left minus reserve (may be 0)."""
+    return max(0.0, min(cap, remaining() - reserve))
+
+
+def timeout(cap, reserve=DEADLINE_RESERVE_SECONDS):
+    """budget(), raising DeadlineExceeded when it is too short to be useful."""
+    seconds = budget(cap, reserve)
+    if seconds < DEADLINE_MIN_TIMEOUT:
+        raise DeadlineExceeded(f"request deadline: {max(0.0, remaining()):.1f}s left")
+    return seconds
+
+
+def near(reserve=DEADLINE_TAIL_RESERVE_SECONDS):
+    """True once a call keeping `reserve` back could no longer be started."""
+    return remaining() - reserve < DEADLINE_MIN_TIMEOUT
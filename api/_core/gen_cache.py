@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Generation result cache
+Two tiers keyed by a canonical hash of the normalized request: an
+in-process LRU shared by warm invocations, and a persistent tier —
+SQLite on local disk (default) or the Supabase generation_cache table
+(GEN_CACHE_BACKEND=supabase). Entries expire after GEN_CACHE_TTL_SECONDS.
+No external dependencies — stdlib only.
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+# ===== CONFIG =====
+GEN_CACHE_TTL_SECONDS = float(os.environ.get("GEN_CACHE_TTL_SECONDS", "21600"))
+GEN_CACHE_MAX_ENTRIES = int(os.environ.get("GEN_CACHE_MAX_ENTRIES", "256"))
+GEN_CACHE_BACKEND = os.environ.get("GEN_CACHE_BACKEND", "sqlite")  # sqlite | supabase | off
+GEN_CACHE_SQLITE_PATH = os.environ.get("GEN_CACHE_SQLITE_PATH", "/tmp/postir_gen_cache.sqlite3")
+
+_lock = threading.Lock()
+_entries = OrderedDict()    # key -> (expires_at wall-clock, value)
+_sqlite = []                # [connection] once opened
+
+# Arabic diacritics (tashkeel), superscript alef and tatweel.
+_TASHKEEL_RE = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+_ALEF_FOLD = str.maketrans({"\u0623": "\u0627", "\u0625": "\u0627", "\u0622": "\u0627", "\u0671": "\u0627"})  # أ إ آ ٱ -> ا
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Fold the spellings of one input onto one key: tashkeel, alef forms, case, spacing."""
+    text = _TASHKEEL_RE.sub("", text or "").translate(_ALEF_FOLD)
+    return _SPACE_RE.sub(" ", text).strip().casefold()
+
+
+def make_key(kind, fields):
+    """Canonical hash of a request. String fields are normalized first."""
+    import hashlib
+
+    canonical = {k: normalize_text(v) if isinstance(v, str) else v for k, v in fields.items()}
+    payload = json.dumps([kind, canonical], sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get(key):
+    """Cached value or None. A persistent-tier hit is promoted into the LRU."""
+    if GEN_CACHE_BACKEND == "off" or GEN_CACHE_TTL_SECONDS <= 0:
+        return None
+    now = time.time()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                _entries.move_to_end(key)
+                return entry[1]
+            del _entries[key]
+
+    try:
+        found = _persistent_get(key, now)
+    except Exception:
+        return None
+    if found is not None:
+        _lru_put(key, found[1], found[0])
+        return found[1]
+    return None
+
+
+def put(key, value):
+    if GEN_CACHE_BACKEND == "off" or GEN_CACHE_TTL_SECONDS <= 0:
+        return
+    expires_at = time.time() + GEN_CACHE_TTL_SECONDS
+    _lru_put(key, value, expires_at)
+    try:
+        _persistent_put(key, value, expires_at)
+    except Exception:
+        pass
+
+
+def _lru_put(key, value, expires_at):
+    with _lock:
+        _entries[key] = (expires_at, value)
+        _entries.move_to_end(key)
+        while len(_entries) > GEN_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Persistent tier
+# ══════════════════════════════════════════════════════════════════════
+
+def _persistent_get(key, now):
+    """(expires_at, value) or None."""
+    if GEN_CACHE_BACKEND == "sqlite":
+        conn = _sqlite_conn()
+        with _lock:
+            row = conn.execute(
+                "SELECT expires_at, value FROM generation_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    if GEN_CACHE_BACKEND == "supabase":
+        from . import supabase
+
+        resp = supabase.supabase_request(
+            "GET", "/rest/v1/generation_cache", use_service_key=True,
+            params={"key": f"eq.{key}", "expires_at": f"gt.{supabase.iso_timestamp(now)}",
+                    "select": "value,expires_at", "limit": "1"},
+        )
+        if isinstance(resp, list) and resp:
+            # Keep the promoted LRU copy no longer than the remaining TTL.
+            expires_at = supabase.parse_timestamp(resp[0]["expires_at"], now)
+            return min(now + GEN_CACHE_TTL_SECONDS, expires_at), resp[0]["value"]
+    return None
+
+
+def _persistent_put(key, value, expires_at):
+    if GEN_CACHE_BACKEND == "sqlite":
+        conn = _sqlite_conn()
+        with _lock:
+            conn.execute(
+                "INSERT OR REPLACE INTO generation_cache (key, expires_at, value) VALUES (?, ?, ?)",
+                (key, expires_at, json.dumps(value, ensure_ascii=False)),
+            )
+            conn.execute("DELETE FROM generation_cache WHERE expires_at <= ?", (time.time(),))
+            conn.commit()
+
+    elif GEN_CACHE_BACKEND == "supabase":
+        from . import supabase
+
+        supabase.supabase_request(
+            "POST", "/rest/v1/generation_cache", use_service_key=True,
+            data={"key": key, "value": value, "expires_at": supabase.iso_timestamp(expires_at)},
+            params={"on_conflict": "key"},
+            prefer="resolution=merge-duplicates,return=minimal",
+        )
+
+
+def _sqlite_conn():
+    if not _sqlite:
+        import sqlite3
+
+        with _lock:
+            if not _sqlite:
+                conn = sqlite3.connect(GEN_CACHE_SQLITE_PATH, check_same_thread=False)
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS generation_cache "
+                    "(key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value TEXT NOT NULL)"
+                )
+                conn.commit()
+                _sqlite.append(conn)
+    return _sqlite[0]
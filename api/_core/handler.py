@@ -0,0 +1,252 @@
+"""
+Postir V2 — Base request handler shared by every endpoint
+CORS preflight, bearer-token extraction, JSON body parsing, JSON
+responses, streamed event responses (SSE or NDJSON) — both compressed as
+negotiated by _core.compression — binary assets with conditional and
+Range requests, and async job hand-off; HEAD answers carry headers only.
+Endpoints subclass JSONHandler as their Vercel `handler`.
+"""
+import json
+from http.server import BaseHTTPRequestHandler
+
+from . import compression, deadline
+
+
+class JSONHandler(BaseHTTPRequestHandler):
+
+    allowed_methods = "POST, GET, OPTIONS"
+    allowed_headers = "Content-Type, Authorization"
+    exposed_headers = None
+    _job = None                     # set while the handler's work runs as an async job
+    _stream_encoder = None          # compressor of a streamed response, finished by _end_stream()
+
+    def parse_request(self):
+        # The request line has been read: the function's clock is running.
+        deadline.start()
+        return super().parse_request()
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', self.allowed_methods)
+        self.send_header('Access-Control-Allow-Headers', self.allowed_headers)
+        self.end_headers()
+
+    def _get_bearer_token(self):
+        auth = self.headers.get("Authorization", "")
+        if auth.startswith("Bearer "):
+            return auth[7:].strip()
+        return None
+
+    def _read_json_body(self):
+        """Parse the request body as JSON; raises on malformed input."""
+        content_length = int(self.headers.get('Content-Length', 0))
+        body_raw = self.rfile.read(content_length) if content_length > 0 else b'{}'
+        return json.loads(body_raw)
+
+    def _send_cors_headers(self):
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Headers', self.allowed_headers)
+        if self.exposed_headers:
+            self.send_header('Access-Control-Expose-Headers', self.exposed_headers)
+
+    def _accepted_encoding(self):
+        return compression.negotiate(self.headers.get('Accept-Encoding', ''))
+
+    def _send_encoding_headers(self, encoding):
+        if compression.COMPRESSION_ENABLED:
+            self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+
+    def _send_json(self, status_code, data, headers=None):
+        if self._job is not None:
+            self._job.finish(status_code, data)
+            return
+        pieces, length, encoding = compression.encode_json(data, self._accepted_encoding())
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self._send_cors_headers()
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self._send_encoding_headers(encoding)
+        self.send_header('Content-Length', str(length))
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        for piece in pieces:
+            self.wfile.write(piece)
+
+    def _send_not_modified(self, etag, headers=None):
+        if self._job is not None:
+            self._job.finish(304, {"etag": etag})
+            return
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self._send_cors_headers()
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self._send_encoding_headers(None)
+        self.end_headers()
+
+    def _send_asset(self, data, content_type, etag, headers=None):
+        """
+        Raw bytes under a strong ETag. For GET/HEAD: 304 when If-None-Match
+        matches, 206 for one satisfiable bytes range (unless If-Range names
+        another version), 416 for an unsatisfiable one; otherwise 200. HEAD
+        gets the headers only. A job records the asset's metadata, not its
+        bytes.
+        """
+        if self._job is not None:
+            self._job.finish(200, {"content_type": content_type, "etag": etag, "size": len(data)})
+            return
+        headers = dict(headers or {})
+        conditional = self.command in ("GET", "HEAD")
+        if conditional and etag_matches(self.headers.get('If-None-Match', ''), etag):
+            self._send_not_modified(etag, headers=headers)
+            return
+        total = len(data)
+        byte_range = None
+        if conditional and self.headers.get('If-Range', etag) == etag:
+            byte_range = _parse_range(self.headers.get('Range', ''), total)
+        if byte_range == ():
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{total}')
+            self._send_cors_headers()
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        start, end = byte_range or (0, total - 1)
+        self.send_response(206 if byte_range else 200)
+        self.send_header('Content-Type', content_type)
+        self._send_cors_headers()
+        self.send_header('ETag', etag)
+        self.send_header('Accept-Ranges', 'bytes')
+        if byte_range:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{total}')
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(memoryview(data)[start:end + 1])
+
+    def _wants_event_stream(self):
+        return "text/event-stream" in self.headers.get("Accept", "")
+
+    def _start_stream(self):
+        """
+        Begin a streamed response: Server-Sent Events when the client sent
+        Accept: text/event-stream, newline-delimited JSON otherwise. No
+        Content-Length — the body ends when the connection closes. With a
+        negotiated encoding every event is flushed through one compressor.
+        """
+        self._stream_sse = self._wants_event_stream()
+        if self._job is not None:
+            return
+        encoding = self._accepted_encoding()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8' if self._stream_sse
+                         else 'application/x-ndjson; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no')
+        self._send_cors_headers()
+        self._send_encoding_headers(encoding)
+        self.end_headers()
+        self.close_connection = True
+        self._stream_encoder = compression.Encoder(encoding) if encoding else None
+
+    def _send_event(self, event, data):
+        """Write one event and flush it; NDJSON lines carry it as "event"."""
+        if self._job is not None:
+            self._job.event(event, data)
+            return
+        if self._stream_sse:
+            payload = json.dumps(data, ensure_ascii=False)
+            chunk = f"event: {event}\ndata: {payload}\n\n"
+        else:
+            chunk = json.dumps({"event": event, **data}, ensure_ascii=False) + "\n"
+        if self._stream_encoder is not None:
+            encoder = self._stream_encoder
+            self.wfile.write(encoder.compress(chunk.encode('utf-8')) + encoder.flush())
+        else:
+            self.wfile.write(chunk.encode('utf-8'))
+        self.wfile.flush()
+
+    def _end_stream(self):
+        """Write the compressed stream's trailer (idempotent; called from finish())."""
+        encoder, self._stream_encoder = self._stream_encoder, None
+        if encoder is not None:
+            self.wfile.write(encoder.finish())
+            self.wfile.flush()
+
+    def finish(self):
+        try:
+            self._end_stream()
+        except OSError:
+            pass            # client already gone
+        super().finish()
+
+    def _run_async(self, kind, user_id, request):
+        """
+        Answer 202 with a job id for request (the JSON the job needs), run
+        later as self._run_job(user_id, request) — see _core.jobs: whatever
+        it sends with _send_json / _send_event becomes the job's state
+        instead of the response. The local backend starts it here; the
+        supabase backend leaves it queued for api/job_worker.py.
+        """
+        from . import jobs
+
+        job = jobs.create(kind, user_id, request)
+        if job is None:
+            self._send_json(503, {"error": "Could not queue the job. Please try again shortly."})
+            return
+        self._send_json(202, {"job_id": job.id, "status": job.status, "status_url": f"/api/jobs/{job.id}"})
+        if jobs.JOBS_BACKEND == "local":
+            self.wfile.flush()
+            self._job = job
+            jobs.run(job, lambda: self._run_job(user_id, request))
+
+    def _run_job(self, user_id, request):
+        raise NotImplementedError(f"{type(self).__module__} has no async jobs")
+
+    @classmethod
+    def for_job(cls, job):
+        """An instance with no connection whose output becomes job's state (api/job_worker.py)."""
+        self = cls.__new__(cls)
+        self._job = job
+        self.command = "POST"
+        self.headers = {}
+        return self
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison, as If-None-Match requires."""
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == bare for tag in if_none_match.split(","))
+
+
+def _parse_range(header, total):
+    """
+    (start, end) inclusive for a single "bytes=" range, () if it cannot be
+    satisfied, None when there is no usable Range (absent, malformed or
+    several ranges — the whole body is sent).
+    """
+    unit, _, spec = header.partition("=")
+    first, dash, last = spec.strip().partition("-")
+    if unit.strip().lower() != "bytes" or not dash or "," in spec:
+        return None
+    try:
+        if not first:
+            length = int(last)
+            return (max(0, total - length), total - 1) if length > 0 and total else ()
+        start = int(first)
+        end = int(last) if last else total - 1
+    except ValueError:
+        return None
+    if last and end < start:
+        return None         # invalid range-spec: ignored
+    if start >= total:
+        return ()
+    return start, min(end, total - 1)
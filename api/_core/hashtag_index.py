@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Ranked hashtag index
+Hashtags per (business_type, platform, language), ranked by relevance and
+held in flat arrays: one tag-id array and one score array for every key
+back to back, plus a span per key. Loaded at import from
+hashtag_index.json (written offline by scripts/refresh_hashtag_index.py
+from the hashtags logged with our own generations); without that file the
+index is built from the seed lists below. top() is a dict lookup and a
+slice. No external dependencies — stdlib only.
+"""
+import json
+import math
+import os
+from array import array
+
+
+# ===== CONFIG =====
+HASHTAG_INDEX_PATH = os.environ.get(
+    "HASHTAG_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "hashtag_index.json"))
+HASHTAG_INDEX_MAX_PER_KEY = 20
+ANY_PLATFORM = "*"
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Seed lists — the prior, and the whole index until a refresh runs
+# ══════════════════════════════════════════════════════════════════════
+
+SEED_HASHTAGS = {
+    "ar": {
+        "restaurant": ("#مطاعم_الرياض", "#اكل", "#مطاعم", "#فود"),
+        "online_store": ("#تسوق_اونلاين", "#متجر_الكتروني", "#عروض", "#تسوق"),
+        "real_estate": ("#عقارات", "#عقار", "#استثمار", "#سكن"),
+        "beauty": ("#تجميل", "#عناية_بالبشرة", "#جمال", "#مكياج"),
+        "fashion": ("#أزياء", "#موضة", "#ستايل", "#عبايات"),
+        "technology": ("#تقنية", "#تحول_رقمي", "#برمجة", "#ابتكار"),
+        "education": ("#تعليم", "#تدريب", "#تطوير_الذات", "#دورات"),
+        "health": ("#صحة", "#عافية", "#لياقة", "#رعاية_صحية"),
+        "tourism": ("#سياحة", "#سفر", "#روح_السعودية", "#رحلات"),
+        "general": ("#خدمات", "#ريادة_اعمال", "#اعمال", "#جودة"),
+    },
+    "en": {
+        "restaurant": ("#RiyadhFood", "#Foodie", "#Restaurants", "#SaudiFood"),
+        "online_store": ("#OnlineShopping", "#ShopOnline", "#Deals", "#Ecommerce"),
+        "real_estate": ("#RealEstate", "#Property", "#Investment", "#Homes"),
+        "beauty": ("#Beauty", "#Skincare", "#SelfCare", "#Makeup"),
+        "fashion": ("#Fashion", "#Style", "#OOTD", "#Abaya"),
+        "technology": ("#Tech", "#DigitalTransformation", "#Innovation", "#Software"),
+        "education": ("#Education", "#Training", "#Learning", "#Courses"),
+        "health": ("#Health", "#Wellness", "#Fitness", "#Healthcare"),
+        "tourism": ("#Tourism", "#Travel", "#VisitSaudi", "#Trips"),
+        "general": ("#Services", "#Entrepreneurship", "#Business", "#Quality"),
+    },
+}
+SEED_GENERAL_HASHTAGS = {
+    "ar": ("#السعودية", "#الرياض", "#جدة", "#رؤية_2030", "#نجاح", "#تميز"),
+    "en": ("#SaudiArabia", "#Riyadh", "#Jeddah", "#Vision2030", "#Success", "#Growth"),
+}
+
+
+def seed_scores():
+    """{(btype, ANY_PLATFORM, lang): {tag: score}} — business tags first, then the general ones."""
+    scores = {}
+    for lang, by_type in SEED_HASHTAGS.items():
+        for btype, tags in by_type.items():
+            ranked = {tag: 1.0 - 0.05 * i for i, tag in enumerate(tags)}
+            for i, tag in enumerate(SEED_GENERAL_HASHTAGS[lang]):
+                ranked.setdefault(tag, 0.5 - 0.05 * i)
+            scores[(btype, ANY_PLATFORM, lang)] = ranked
+    return scores
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Array-backed index
+# ══════════════════════════════════════════════════════════════════════
+
+_tags = []              # tag id -> tag
+_ids = array("H")       # ranked tag ids of every key, back to back
+_scores = array("f")    # relevance score, parallel to _ids
+_spans = {}             # (btype, platform, lang) -> (start, end) into _ids
+
+
+def pack(scores):
+    """{key: {tag: score}} -> the JSON-ready flat form loaded by load()."""
+    tags, tag_ids, ids, flat_scores, spans = [], {}, [], [], {}
+    for key in sorted(scores):
+        ranked = sorted(scores[key].items(), key=lambda item: (-item[1], item[0]))[:HASHTAG_INDEX_MAX_PER_KEY]
+        start = len(ids)
+        for tag, score in ranked:
+            if tag not in tag_ids:
+                tag_ids[tag] = len(tags)
+                tags.append(tag)
+            ids.append(tag_ids[tag])
+            flat_scores.append(round(score, 4))
+        spans["|".join(key)] = [start, len(ids)]
+    return {"version": 1, "tags": tags, "ids": ids, "scores": flat_scores, "spans": spans}
+
+
+def load(packed):
+    """Swap in a packed index (as written by pack())."""
+    global _tags, _ids, _scores, _spans
+    ids, scores = array("H", packed["ids"]), array("f", packed["scores"])
+    spans = {tuple(key.split("|")): (span[0], span[1]) for key, span in packed["spans"].items()}
+    _tags, _ids, _scores, _spans = list(packed["tags"]), ids, scores, spans
+
+
+def _load_at_import():
+    try:
+        with open(HASHTAG_INDEX_PATH, encoding="utf-8") as f:
+            load(json.load(f))
+            return
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    load(pack(seed_scores()))
+
+
+_load_at_import()
+
+
+def _span(btype, platform, lang):
+    for key in ((btype, platform, lang), (btype, ANY_PLATFORM, lang),
+                ("general", platform, lang), ("general", ANY_PLATFORM, lang)):
+        span = _spans.get(key)
+        if span is not None:
+            return span
+    return 0, 0
+
+
+def top(btype, platform, lang, k=5):
+    """The k best hashtags for a business type on a platform, best first."""
+    start, end = _span(btype, platform, lang)
+    return [_tags[i] for i in _ids[start:min(end, start + k)]]
+
+
+def ranked(btype, platform, lang, k=HASHTAG_INDEX_MAX_PER_KEY):
+    """[(tag, score)] best first."""
+    start, end = _span(btype, platform, lang)
+    end = min(end, start + k)
+    return [(_tags[i], score) for i, score in zip(_ids[start:end], _scores[start:end])]
+
+
+def prompt_guidance(btype, platforms, language, k=6):
+    """Prompt line suggesting the top hashtags for the request's first platform."""
+    platform = platforms[0] if platforms else "instagram"
+    langs = [lang for lang in ("ar", "en") if language in (lang, "both")] or ["ar", "en"]
+    parts = [f"{lang.upper()}: {' '.join(top(btype, platform, lang, k))}" for lang in langs]
+    return "; prefer these proven ones where they fit — " + " | ".join(parts)
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Usage log and offline scoring
+# ══════════════════════════════════════════════════════════════════════
+
+def summarize(btype, posts):
+    """
+    Compact record of the hashtags a calendar used, stored with its
+    generations row: {"business_type", "posts": {platform: n},
+    "tags": {"platform|lang": {tag: count}}}. None if there are none.
+    """
+    post_counts, tags = {}, {}
+    for post in posts:
+        if not isinstance(post, dict):
+            continue
+        platform = str(post.get("platform") or "instagram")
+        post_counts[platform] = post_counts.get(platform, 0) + 1
+        for lang in ("ar", "en"):
+            for tag in post.get(f"hashtags_{lang}") or ():
+                if isinstance(tag, str) and tag.startswith("#"):
+                    counts = tags.setdefault(f"{platform}|{lang}", {})
+                    counts[tag] = counts.get(tag, 0) + 1
+    if not tags:
+        return None
+    return {"business_type": btype, "posts": post_counts, "tags": tags}
+
+
+def score_history(summaries, min_count=3, prior_weight=0.2):
+    """
+    Relevance scores from logged summaries: how often a tag is used for a
+    key (share of that key's posts) times how specific it is to the key
+    (inverse key frequency, so tags every business uses rank below
+    business-specific ones), blended with the seed prior. Every key is
+    also aggregated across platforms under ANY_PLATFORM.
+    """
+    usage, posts = {}, {}
+    for summary in summaries:
+        btype = summary.get("business_type") or "general"
+        for platform, n in (summary.get("posts") or {}).items():
+            for plat in (platform, ANY_PLATFORM):
+                for lang in ("ar", "en"):
+                    posts[(btype, plat, lang)] = posts.get((btype, plat, lang), 0) + n
+        for platform_lang, counts in (summary.get("tags") or {}).items():
+            platform, _, lang = platform_lang.partition("|")
+            for plat in (platform, ANY_PLATFORM):
+                bucket = usage.setdefault((btype, plat, lang), {})
+                for tag, count in counts.items():
+                    bucket[tag] = bucket.get(tag, 0) + count
+
+    keys_with_tag = {}
+    for key, counts in usage.items():
+        for tag in counts:
+            keys_with_tag[(key[2], tag)] = keys_with_tag.get((key[2], tag), 0) + 1
+    n_keys = max(1, len(usage))
+
+    scores = {key: {tag: prior_weight * s for tag, s in prior.items()} for key, prior in seed_scores().items()}
+    for key, counts in usage.items():
+        bucket = scores.setdefault(key, {})
+        for tag, count in counts.items():
+            if count < min_count:
+                continue
+            share = min(1.0, count / max(1, posts.get(key, 0)))
+            specificity = math.log(1 + n_keys / keys_with_tag[(key[2], tag)])
+            bucket[tag] = bucket.get(tag, 0.0) + share * specificity
+    # A platform key keeps its own ranking but is topped up from the
+    # business type's cross-platform one, so it never runs short.
+    for (btype, platform, lang), bucket in scores.items():
+        if platform != ANY_PLATFORM:
+            for tag, score in scores.get((btype, ANY_PLATFORM, lang), {}).items():
+                bucket.setdefault(tag, 0.5 * score)
+    return scores
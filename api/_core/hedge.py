@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Hedged upstream calls
+Opt-in (GEMINI_HEDGE_ENABLED=1). A call that has not returned by the
+observed p90 latency for its size bucket gets one duplicate; the first
+valid result wins and the loser is abandoned (its connection goes back
+to the pool when it finishes). Hedges are capped at GEMINI_HEDGE_MAX_RATE
+of calls, and counters show the extra quota spent. No external
+dependencies — stdlib only.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+
+# ===== CONFIG =====
+HEDGE_ENABLED = os.environ.get("GEMINI_HEDGE_ENABLED", "") in ("1", "true", "yes")
+HEDGE_MAX_RATE = float(os.environ.get("GEMINI_HEDGE_MAX_RATE", "0.1"))
+HEDGE_PERCENTILE = 0.9
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 200              # latencies kept per size bucket
+HEDGE_MIN_DELAY = 1.0           # never hedge sooner than this (seconds)
+HEDGE_LOG_EVERY = int(os.environ.get("GEMINI_HEDGE_LOG_EVERY", "100"))
+HEDGE_POOL_WORKERS = 16
+
+_lock = threading.Lock()
+_latencies = {}                 # bucket -> deque of seconds
+_counters = {
+    "calls": 0,                 # hedged-path calls
+    "hedges_sent": 0,           # duplicates sent (= extra upstream requests)
+    "hedge_wins": 0,            # the duplicate answered first
+    "primary_wins": 0,
+    "capped": 0,                # hedge was due but the rate cap refused it
+    "failures": 0,              # both attempts failed
+}
+
+
+def size_bucket(kind, size):
+    """Bucket label for a request size, e.g. ("posts", 1500) -> "posts:2048"."""
+    bucket = 256
+    while bucket < size:
+        bucket *= 2
+    return f"{kind}:{bucket}"
+
+
+def threshold(bucket):
+    """The hedge delay for a bucket, or None until enough samples exist."""
+    with _lock:
+        samples = _latencies.get(bucket)
+        if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+    return max(HEDGE_MIN_DELAY, ordered[int(HEDGE_PERCENTILE * (len(ordered) - 1))])
+
+
+def record(bucket, seconds):
+    with _lock:
+        samples = _latencies.get(bucket)
+        if samples is None:
+            samples = _latencies[bucket] = deque(maxlen=HEDGE_WINDOW)
+        samples.append(seconds)
+
+
+def stats():
+    with _lock:
+        out = dict(_counters)
+        out["p90"] = {}
+        buckets = list(_latencies)
+    for bucket in buckets:
+        out["p90"][bucket] = threshold(bucket)
+    return out
+
+
+def call(fn, bucket):
+    """
+    Run fn() with hedging. fn must raise on an invalid result so that a
+    broken fast answer does not beat a valid slow one. Without hedging
+    enabled this is a plain fn() that still records latency.
+    """
+    if not HEDGE_ENABLED:
+        started = time.monotonic()
+        result = fn()
+        record(bucket, time.monotonic() - started)
+        return result
+
+    from concurrent.futures import FIRST_COMPLETED, wait
+    from . import workers
+
+    pool = workers.get_pool("hedge", max_workers=HEDGE_POOL_WORKERS)
+    with _lock:
+        _counters["calls"] += 1
+        log_due = HEDGE_LOG_EVERY > 0 and _counters["calls"] % HEDGE_LOG_EVERY == 0
+    if log_due:
+        sys.stderr.write(json.dumps({"hedge_stats": stats()}) + "\n")
+
+    primary = pool.submit(_timed, fn, bucket)
+    attempts = {primary: "primary"}
+    delay = threshold(bucket)
+    if delay is not None:
+        done, _ = wait([primary], timeout=delay)
+        if not done:
+            if _claim_hedge():
+                attempts[pool.submit(_timed, fn, bucket)] = "hedge"
+            else:
+                with _lock:
+                    _counters["capped"] += 1
+
+    pending = set(attempts)
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as exc:
+                error = error or exc
+                continue
+            with _lock:
+                _counters[f"{attempts[future]}_wins"] += 1
+            return result
+    with _lock:
+        _counters["failures"] += 1
+    raise error
+
+
+def _timed(fn, bucket):
+    started = time.monotonic()
+    result = fn()
+    # Losers are recorded too, so the p90 is not biased toward fast winners.
+    record(bucket, time.monotonic() - started)
+    return result
+
+
+def _claim_hedge():
+    with _lock:
+        if _counters["hedges_sent"] + 1 > HEDGE_MAX_RATE * _counters["calls"]:
+            return False
+        _counters["hedges_sent"] += 1
+        return True
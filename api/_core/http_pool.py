@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Shared outbound HTTP client
+Per-host pool of keep-alive http.client connections, reused across warm
+Vercel invocations so Supabase / Gemini / Pexels / Airwallex calls skip the
+TCP+TLS handshake. No external dependencies — stdlib only.
+"""
+import http.client
+import io
+import os
+import select
+import threading
+import time
+import urllib.error
+from urllib.parse import urlsplit
+
+
+# ===== CONFIG =====
+POOL_MAX_PER_HOST = int(os.environ.get("HTTP_POOL_MAX_PER_HOST", "8"))
+POOL_MAX_IDLE_SECONDS = float(os.environ.get("HTTP_POOL_MAX_IDLE_SECONDS", "55"))
+POOL_ACQUIRE_TIMEOUT = 10
+
+_RETRYABLE_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+# Safe to send again after the connection dropped mid-response.
+_IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE"))
+
+_lock = threading.Lock()
+_idle = {}        # (scheme, host, port) -> [(conn, last_used), ...]
+_slots = {}       # (scheme, host, port) -> BoundedSemaphore
+_stats = {"created": 0, "reused": 0, "discarded": 0}
+
+
+def _pool_key(url):
+    parts = urlsplit(url)
+    scheme = parts.scheme or "https"
+    port = parts.port or (443 if scheme == "https" else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    return (scheme, parts.hostname, port), path
+
+
+def _slot(key):
+    with _lock:
+        sem = _slots.get(key)
+        if sem is None:
+            sem = _slots[key] = threading.BoundedSemaphore(POOL_MAX_PER_HOST)
+        return sem
+
+
+def _is_healthy(conn, last_used):
+    """An idle connection is reusable if it is young enough and the peer has
+    not closed it (a readable idle socket means EOF or unsolicited data)."""
+    if time.monotonic() - last_used > POOL_MAX_IDLE_SECONDS:
+        return False
+    sock = conn.sock
+    if sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (OSError, ValueError):
+        return False
+    return not readable
+
+
+def _new_connection(key, timeout):
+    scheme, host, port = key
+    cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+    conn = cls(host, port, timeout=timeout)
+    with _lock:
+        _stats["created"] += 1
+    return conn
+
+
+def _checkout(key, timeout):
+    """Return (conn, reused) — an idle healthy connection, or a new one."""
+    while True:
+        with _lock:
+            bucket = _idle.get(key)
+            entry = bucket.pop() if bucket else None
+        if entry is None:
+            return _new_connection(key, timeout), False
+        conn, last_used = entry
+        if _is_healthy(conn, last_used):
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            with _lock:
+                _stats["reused"] += 1
+            return conn, True
+        _discard(conn)
+
+
+def _checkin(key, conn):
+    with _lock:
+        bucket = _idle.setdefault(key, [])
+        if len(bucket) < POOL_MAX_PER_HOST:
+            bucket.append((conn, time.monotonic()))
+            return
+    _discard(conn)
+
+
+def _discard(conn):
+    with _lock:
+        _stats["discarded"] += 1
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def _write(conn, method, path, body, headers):
+    try:
+        conn.request(method, path, body=body, headers=headers)
+    except Exception:
+        _discard(conn)
+        raise
+
+
+def _read(conn):
+    try:
+        resp = conn.getresponse()
+        return resp, resp.read()
+    except Exception:
+        _discard(conn)
+        raise
+
+
+def request(method, url, body=None, headers=None, timeout=15):
+    """
+    Send one request over a pooled connection.
+    Returns (status, reason, response_headers, body_bytes). Never raises for
+    HTTP error statuses; network errors propagate.
+    """
+    key, path = _pool_key(url)
+    headers = dict(headers or {})
+    headers.setdefault("Connection", "keep-alive")
+    if body is not None:
+        headers.setdefault("Content-Length", str(len(body)))
+
+    sem = _slot(key)
+    # Waiting for a slot counts against the caller's timeout.
+    if not sem.acquire(timeout=min(POOL_ACQUIRE_TIMEOUT, timeout)):
+        raise TimeoutError(f"HTTP pool exhausted for {key[1]}")
+    try:
+        conn, reused = _checkout(key, timeout)
+        try:
+            _write(conn, method, path, body, headers)
+        except _RETRYABLE_ERRORS:
+            # A reused keep-alive socket can be closed by the server between
+            # the health check and the write. The request did not go out:
+            # retry once on a fresh connection, whatever the method.
+            if not reused:
+                raise
+            conn, reused = _new_connection(key, timeout), False
+            _write(conn, method, path, body, headers)
+        try:
+            resp, data = _read(conn)
+        except _RETRYABLE_ERRORS:
+            # Dropped after the request was written, so the server may have
+            # acted on it (a payment intent, a Gemini call): only an
+            # idempotent method is sent again.
+            if not reused or method.upper() not in _IDEMPOTENT_METHODS:
+                raise
+            conn = _new_connection(key, timeout)
+            _write(conn, method, path, body, headers)
+            resp, data = _read(conn)
+        if resp.will_close:
+            _discard(conn)
+        else:
+            _checkin(key, conn)
+        return resp.status, resp.reason, resp.headers, data
+    finally:
+        sem.release()
+
+
+def urlopen(method, url, data=None, headers=None, timeout=15):
+    """
+    Drop-in for urllib.request.urlopen(...).read(): returns the body bytes and
+    raises urllib.error.HTTPError on 4xx/5xx so existing handlers keep working.
+    """
+    status, reason, resp_headers, body = request(method, url, body=data, headers=headers, timeout=timeout)
+    if status >= 400:
+        raise urllib.error.HTTPError(url, status, reason, resp_headers, io.BytesIO(body))
+    return body
+
+
+def stream_lines(method, url, data=None, headers=None, timeout=15):
+    """
+    Yield the response body line by line (bytes, newline stripped) as it
+    arrives — for SSE / chunked responses. Raises urllib.error.HTTPError on
+    4xx/5xx. The connection returns to the pool only if fully consumed.
+    """
+    key, path = _pool_key(url)
+    headers = dict(headers or {})
+    headers.setdefault("Connection", "keep-alive")
+    if data is not None:
+        headers.setdefault("Content-Length", str(len(data)))
+
+    sem = _slot(key)
+    if not sem.acquire(timeout=min(POOL_ACQUIRE_TIMEOUT, timeout)):
+        raise TimeoutError(f"HTTP pool exhausted for {key[1]}")
+    conn = None
+    done = False
+    try:
+        conn, _ = _checkout(key, timeout)
+        try:
+            conn.request(method, path, body=data, headers=headers)
+            resp = conn.getresponse()
+        except Exception:
+            # Streams are not retried; callers fall back on their own.
+            _discard(conn)
+            conn = None
+            raise
+        if resp.status >= 400:
+            body = resp.read()
+            done = not resp.will_close
+            raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, io.BytesIO(body))
+        while True:
+            line = resp.readline()
+            if not line:
+                break
+            yield line.rstrip(b"\r\n")
+        done = not resp.will_close
+    finally:
+        if conn is not None:
+            if done:
+                _checkin(key, conn)
+            else:
+                _discard(conn)
+        sem.release()
+
+
+def pool_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["idle"] = {f"{k[1]}:{k[2]}": len(v) for k, v in _idle.items()}
+    return stats
+
+
+def close_all():
+    with _lock:
+        buckets = list(_idle.values())
+        _idle.clear()
+    for bucket in buckets:
+        for conn, _ in bucket:
+            try:
+                conn.close()
+            except Exception:
+                pass
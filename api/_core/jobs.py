@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Asynchronous generation jobs
+A POST with "async": true gets 202 and a job id; the work then runs as a
+job whose _send_json/_send_event output becomes the job state, polled at
+/api/jobs/{id}. Two backends (JOBS_BACKEND): "local" keeps jobs in memory
+and runs them on a thread pool (self-hosted, one long-lived process);
+"supabase" (the default on Vercel) queues them in the generation_jobs
+table with the request that made them, and api/job_worker.py — a cron-
+driven function with its own maxDuration — claims and runs them, so the
+202 goes out at once and no job shares an invocation with its request.
+State is compact — status, progress, partial items while running, the
+final payload once finished — and finished jobs expire after
+JOBS_TTL_SECONDS. No external dependencies — stdlib only.
+"""
+import os
+import threading
+import time
+
+
+# ===== CONFIG =====
+JOBS_BACKEND = os.environ.get("JOBS_BACKEND", "supabase" if os.environ.get("VERCEL") else "local")
+JOBS_TTL_SECONDS = float(os.environ.get("JOBS_TTL_SECONDS", "3600"))
+JOBS_MAX_WORKERS = int(os.environ.get("JOBS_MAX_WORKERS", "4"))
+JOBS_MAX_LOCAL = 500                # local jobs kept before the oldest finished ones go
+JOBS_STALE_SECONDS = 120.0          # running with no update for this long: the worker is gone
+JOBS_QUEUE_SECONDS = float(os.environ.get("JOBS_QUEUE_SECONDS", "300"))     # queued and never claimed: failed
+JOBS_PROGRESS_INTERVAL = 1.0        # min seconds between persisted partial updates
+# Each job's own deadline (_core.deadline). The job worker caps it at what
+# is left of its invocation and only claims a job while at least
+# JOBS_WORKER_MIN_SECONDS remain.
+JOBS_WORKER_MIN_SECONDS = float(os.environ.get("JOBS_WORKER_MIN_SECONDS", "20"))
+JOBS_DEADLINE_SECONDS = float(os.environ.get("JOBS_DEADLINE_SECONDS")
+                              or os.environ.get("REQUEST_DEADLINE_SECONDS", "60"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_lock = threading.Lock()
+_jobs = {}                          # job id -> Job (local backend)
+
+
+class Job:
+
+    def __init__(self, kind, user_id):
+        import secrets
+
+        now = time.time()
+        self.id = secrets.token_hex(8)
+        self.kind = kind
+        self.user_id = user_id
+        self.status = QUEUED
+        self.progress = None        # {"done", "total"} for itemized work
+        self.partial = []           # items produced so far, dropped once finished
+        self.item_name = "item"     # event name of the partial items ("post")
+        self.result = None
+        self.error = None
+        self.http_status = None
+        self.request = None         # what the worker needs to run it (supabase backend)
+        self.created_at = self.updated_at = now
+        self.expires_at = now + JOBS_QUEUE_SECONDS + JOBS_TTL_SECONDS
+        self._persisted_at = 0.0
+
+    def event(self, event, data):
+        """
+        A streamed event from the work: "<item>" events add to the partial
+        items (or, with "replaced", swap the item for the same day), "done"
+        finishes with {"<item>s": items, **data}, "error" fails with its body.
+        """
+        if event == "error":
+            self.finish(data.get("status", 500), data)
+        elif event == "done":
+            items = sorted(self.partial, key=lambda item: item.get("day", 0) if isinstance(item, dict) else 0)
+            self.finish(200, {self.item_name + "s": items, **data})
+        else:
+            with _lock:
+                self.item_name = event
+                item = data.get(event)
+                if data.get("replaced") and isinstance(item, dict):
+                    self.partial = [item if isinstance(p, dict) and p.get("day") == item.get("day") else p
+                                    for p in self.partial]
+                else:
+                    self.partial.append(item)
+                self.progress = {"done": len(self.partial), "total": data.get("total")}
+                self.status = RUNNING
+                self.updated_at = time.time()
+            if self.updated_at - self._persisted_at >= JOBS_PROGRESS_INTERVAL:
+                _save(self)
+
+    def finish(self, status_code, data):
+        with _lock:
+            now = time.time()
+            self.status = DONE if status_code < 400 else FAILED
+            self.http_status = status_code
+            self.result = data
+            self.error = data.get("error") if status_code >= 400 and isinstance(data, dict) else None
+            self.partial = []
+            self.updated_at = now
+            self.expires_at = now + JOBS_TTL_SECONDS
+        _save(self)
+
+    def fail(self, message, status_code=500):
+        self.finish(status_code, {"error": message})
+
+    def view(self):
+        with _lock:
+            return _view({
+                "id": self.id, "kind": self.kind, "status": self.status, "progress": self.progress,
+                "partial": list(self.partial), "result": self.result, "error": self.error,
+                "http_status": self.http_status, "created_at": self.created_at,
+                "updated_at": self.updated_at, "expires_at": self.expires_at,
+            })
+
+
+def create(kind, user_id, request=None):
+    """A new queued job for request (a JSON object), or None when it could not be stored."""
+    job = Job(kind, user_id)
+    job.request = request
+    if JOBS_BACKEND == "local":
+        with _lock:
+            _jobs[job.id] = job
+            _prune_local()
+        return job
+    return job if _save(job) else None
+
+
+def run(job, work, seconds=JOBS_DEADLINE_SECONDS):
+    """
+    Run work() as the job under a deadline of `seconds`. Local: on the
+    "jobs" pool, returning at once. Supabase: inline — the job worker calls
+    it for each job it claims, with no more than its invocation has left.
+    """
+    if JOBS_BACKEND == "local":
+        from . import workers
+
+        workers.get_pool("jobs", max_workers=JOBS_MAX_WORKERS).submit(_execute, job, work, seconds)
+    else:
+        _execute(job, work, seconds)
+
+
+def claim():
+    """
+    The oldest queued job (supabase backend), already marked running, or
+    None when nothing is queued or the store is unreachable. Concurrent
+    workers never claim the same job (FOR UPDATE SKIP LOCKED).
+    """
+    from . import supabase
+
+    resp = supabase.supabase_request(
+        "POST", "/rest/v1/rpc/claim_generation_job", data={"p_max_age_seconds": int(JOBS_QUEUE_SECONDS)},
+        use_service_key=True,
+    )
+    if not isinstance(resp, list) or not resp:
+        return None
+    row = resp[0]
+    job = Job(row["kind"], row["user_id"])
+    job.id = row["id"]
+    job.status = RUNNING
+    job.request = row.get("request") or {}
+    job.created_at = supabase.parse_timestamp(row.get("created_at"), job.created_at)
+    job.expires_at = supabase.parse_timestamp(row.get("expires_at"), job.expires_at)
+    return job
+
+
+def get(job_id, user_id):
+    """The job's public state for its owner, or None (unknown, expired, not theirs)."""
+    if JOBS_BACKEND == "local":
+        with _lock:
+            job = _jobs.get(job_id)
+        if job is None or job.user_id != user_id or job.expires_at <= time.time():
+            return None
+        return job.view()
+
+    from . import supabase
+
+    resp = supabase.supabase_request(
+        "GET", "/rest/v1/generation_jobs", use_service_key=True,
+        params={"id": f"eq.{job_id}", "user_id": f"eq.{user_id}",
+                "expires_at": f"gt.{supabase.iso_timestamp(time.time())}",
+                "select": "id,kind,status,progress,partial,result,error,http_status,created_at,updated_at,expires_at",
+                "limit": "1"},
+    )
+    if isinstance(resp, dict) and resp.get("_error"):
+        return resp
+    if not isinstance(resp, list) or not resp:
+        return None
+    row = resp[0]
+    for key in ("created_at", "updated_at", "expires_at"):
+        row[key] = supabase.parse_timestamp(row[key], 0.0)
+    return _view(row)
+
+
+def _execute(job, work, seconds):
+    from . import deadline
+
+    # The job runs on its own clock, not on what is left of the 202's.
+    deadline.start(seconds)
+    with _lock:
+        job.status = RUNNING
+        job.updated_at = time.time()
+    _save(job)
+    try:
+        work()
+    except Exception as e:
+        job.fail(f"Job failed: {e}")
+    if job.status not in (DONE, FAILED):
+        job.fail("Job ended without a result")
+    _purge_expired()
+
+
+def _view(state):
+    from . import supabase
+
+    status = state["status"]
+    idle = time.time() - state["updated_at"]
+    if (status == QUEUED and idle > JOBS_QUEUE_SECONDS) or (status == RUNNING and idle > JOBS_STALE_SECONDS):
+        status = FAILED
+        state = {**state, "error": "Job stopped before finishing. Please retry.", "partial": []}
+    out = {
+        "job_id": state["id"], "kind": state["kind"], "status": status,
+        "created_at": supabase.iso_timestamp(state["created_at"]),
+        "updated_at": supabase.iso_timestamp(state["updated_at"]),
+        "expires_at": supabase.iso_timestamp(state["expires_at"]),
+    }
+    if state.get("progress"):
+        out["progress"] = state["progress"]
+    if status in (QUEUED, RUNNING):
+        out["partial"] = state.get("partial") or []
+    else:
+        out["result"] = state.get("result")
+        out["http_status"] = state.get("http_status")
+        if state.get("error"):
+            out["error"] = state["error"]
+    return out
+
+
+def _prune_local():
+    """Drop expired jobs; past JOBS_MAX_LOCAL, the oldest finished ones too. Caller holds _lock."""
+    now = time.time()
+    for job_id in [j for j, job in _jobs.items() if job.expires_at <= now]:
+        del _jobs[job_id]
+    if len(_jobs) > JOBS_MAX_LOCAL:
+        finished = sorted((job.updated_at, j) for j, job in _jobs.items() if job.status in (DONE, FAILED))
+        for _, job_id in finished[:len(_jobs) - JOBS_MAX_LOCAL]:
+            del _jobs[job_id]
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Supabase backend
+# ══════════════════════════════════════════════════════════════════════
+
+def _save(job):
+    """Persist the job row (supabase backend). Returns False if the write failed."""
+    if JOBS_BACKEND == "local":
+        return True
+    from . import supabase
+
+    with _lock:
+        row = {
+            "id": job.id, "user_id": job.user_id, "kind": job.kind, "status": job.status,
+            "progress": job.progress, "partial": list(job.partial), "result": job.result,
+            "error": job.error, "http_status": job.http_status, "request": job.request,
+            "created_at": supabase.iso_timestamp(job.created_at),
+            "updated_at": supabase.iso_timestamp(job.updated_at),
+            "expires_at": supabase.iso_timestamp(job.expires_at),
+        }
+        job._persisted_at = time.time()
+    try:
+        resp = supabase.supabase_request(
+            "POST", "/rest/v1/generation_jobs", data=row, use_service_key=True,
+            params={"on_conflict": "id"}, prefer="resolution=merge-duplicates,return=minimal",
+        )
+    except Exception:
+        return False
+    return not (isinstance(resp, dict) and resp.get("_error"))
+
+
+def _purge_expired():
+    if JOBS_BACKEND == "local":
+        return
+    from . import supabase
+
+    try:
+        supabase.supabase_request(
+            "DELETE", "/rest/v1/generation_jobs", use_service_key=True,
+            params={"expires_at": f"lt.{supabase.iso_timestamp(time.time())}"}, prefer="return=minimal",
+        )
+    except Exception:
+        pass
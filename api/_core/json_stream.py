@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Incremental JSON item parser
+Feeds model output in arbitrary text fragments and yields each item
+object of the top-level array (or of the array under a top-level key,
+e.g. {"posts": [...]}) as soon as its closing brace arrives. Code fences
+and other text outside the JSON are skipped. decode_items() applies the
+same parser to a whole (possibly truncated or slightly malformed)
+response. No external dependencies.
+"""
+import json
+
+
+class ItemStreamParser:
+    """
+    parser = ItemStreamParser()
+    for fragment in fragments:
+        for item in parser.feed(fragment):
+            ...
+    """
+
+    def __init__(self):
+        self._buf = []          # characters of the item being collected
+        self._stack = []        # open containers: "{" / "["
+        self._in_string = False
+        self._escape = False
+        self._item_depth = None  # stack depth at which the current item opened
+        self.items_emitted = 0
+
+    def _is_item_parent(self):
+        # An item is an object directly inside the top-level array, or inside
+        # an array that is a value of the top-level object.
+        return (self._stack and self._stack[-1] == "["
+                and (len(self._stack) == 1 or (len(self._stack) == 2 and self._stack[0] == "{")))
+
+    def feed(self, text):
+        items = []
+        for ch in text:
+            collecting = self._item_depth is not None
+            if self._in_string:
+                if collecting:
+                    self._buf.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if not collecting and self._is_item_parent():
+                    self._item_depth = len(self._stack)
+                    collecting = True
+                self._stack.append("{")
+            elif ch == "[":
+                self._stack.append("[")
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if collecting and ch == "}" and len(self._stack) == self._item_depth:
+                    self._buf.append(ch)
+                    item = self._decode()
+                    if item is not None:
+                        items.append(item)
+                    continue
+            if collecting:
+                self._buf.append(ch)
+        return items
+
+    def _decode(self):
+        raw = "".join(self._buf)
+        self._buf = []
+        self._item_depth = None
+        try:
+            item = json.loads(raw)
+        except ValueError:
+            try:
+                item = json.loads(_repair(raw))
+            except ValueError:
+                return None
+        if not isinstance(item, dict):
+            return None
+        self.items_emitted += 1
+        return item
+
+
+def decode_items(text, keys=("posts", "slides")):
+    """
+    Recover the item objects from a model response. Returns
+    (items, complete): complete is True when the whole document parsed
+    (as-is or after repairing trailing commas / unclosed arrays); False
+    means items is what could be salvaged from a truncated or malformed
+    buffer — every complete object before the damage.
+    """
+    text = _strip_fences(text)
+    for candidate in (text, _repair(text)):
+        try:
+            parsed = json.loads(candidate)
+        except ValueError:
+            continue
+        items = _items_of(parsed, keys)
+        if items is not None:
+            return items, True
+    return ItemStreamParser().feed(text), False
+
+
+def _strip_fences(text):
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+
+def _items_of(parsed, keys):
+    if isinstance(parsed, dict):
+        lists = [parsed[k] for k in keys if isinstance(parsed.get(k), list)]
+        lists += [v for v in parsed.values() if isinstance(v, list)]
+        parsed = lists[0] if lists else None
+    if not isinstance(parsed, list):
+        return None
+    return [item for item in parsed if isinstance(item, dict)]
+
+
+def _repair(text):
+    """
+    Drop trailing commas before } / ] and, when the text stops between
+    items of an array, close the containers left open. Text cut inside a
+    string or inside an object is left for ItemStreamParser to salvage.
+    """
+    out = []
+    stack = []
+    in_string = escape = False
+    for ch in text:
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch in "}]":
+            while out and out[-1] in " \t\r\n,":
+                out.pop()
+            if stack:
+                stack.pop()
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch == '"':
+            in_string = True
+        out.append(ch)
+    if stack and not in_string and stack[-1] == "]":
+        while out and out[-1] in " \t\r\n,":
+            out.pop()
+        out.extend(reversed(stack))
+    return "".join(out)
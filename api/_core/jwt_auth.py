@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Local Supabase JWT verification
+Verifies access tokens in-process (HS256 with the project JWT secret, or
+RS256 / ES256 against the project's cached JWKS) so authenticated requests
+skip the /auth/v1/user round-trip. Verified tokens are kept in a bounded LRU
+keyed by token hash until they expire. No external dependencies — stdlib only.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from . import deadline, http_pool
+
+
+# ===== CONFIG =====
+JWT_AUDIENCE = os.environ.get("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWT_LEEWAY_SECONDS = 30
+JWKS_TTL_SECONDS = 600
+JWKS_MIN_REFRESH_SECONDS = 30
+VERIFIED_CACHE_SIZE = 2048
+
+
+class LocalVerifyUnavailable(Exception):
+    """Raised when a token cannot be checked locally (no secret, JWKS down)."""
+
+
+_cache_lock = threading.Lock()
+_verified = OrderedDict()   # sha256(token) -> (expires_at, user)
+
+_jwks_lock = threading.Lock()
+_jwks = {"keys": {}, "fetched_at": 0.0}
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Verified-token LRU
+# ══════════════════════════════════════════════════════════════════════
+
+def _token_key(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def cache_get(token):
+    key = _token_key(token)
+    now = time.time()
+    with _cache_lock:
+        entry = _verified.get(key)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at <= now:
+            del _verified[key]
+            return None
+        _verified.move_to_end(key)
+        return user
+
+
+def cache_put(token, user, expires_at):
+    if not expires_at or expires_at <= time.time():
+        return
+    key = _token_key(token)
+    with _cache_lock:
+        _verified[key] = (expires_at, user)
+        _verified.move_to_end(key)
+        while len(_verified) > VERIFIED_CACHE_SIZE:
+            _verified.popitem(last=False)
+
+
+def forget(token):
+    with _cache_lock:
+        _verified.pop(_token_key(token), None)
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Token parsing
+# ══════════════════════════════════════════════════════════════════════
+
+def _b64url_decode(segment):
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _b64url_int(segment):
+    return int.from_bytes(_b64url_decode(segment), "big")
+
+
+def decode_unverified(token):
+    """Returns (header, claims, signing_input, signature) or None if malformed."""
+    try:
+        header_b64, payload_b64, sig_b64 = token.split(".")
+        header = json.loads(_b64url_decode(header_b64))
+        claims = json.loads(_b64url_decode(payload_b64))
+        signature = _b64url_decode(sig_b64)
+    except Exception:
+        return None
+    if not isinstance(header, dict) or not isinstance(claims, dict):
+        return None
+    return header, claims, f"{header_b64}.{payload_b64}".encode("ascii"), signature
+
+
+def unverified_subject(token):
+    """The `sub` claim without checking the signature — for speculation only."""
+    decoded = decode_unverified(token)
+    if not decoded:
+        return None
+    sub = decoded[1].get("sub")
+    return sub if isinstance(sub, str) and sub else None
+
+
+def unverified_expiry(token):
+    decoded = decode_unverified(token)
+    if not decoded:
+        return None
+    exp = decoded[1].get("exp")
+    return exp if isinstance(exp, (int, float)) else None
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Signature algorithms
+# ══════════════════════════════════════════════════════════════════════
+
+_SHA256_DIGEST_INFO = bytes.fromhex("3031300d060960864801650304020105000420")
+
+
+def _verify_rs256(jwk, signing_input, signature):
+    n = _b64url_int(jwk["n"])
+    e = _b64url_int(jwk["e"])
+    k = (n.bit_length() + 7) // 8
+    if len(signature) != k:
+        return False
+    em = pow(int.from_bytes(signature, "big"), e, n).to_bytes(k, "big")
+    t = _SHA256_DIGEST_INFO + hashlib.sha256(signing_input).digest()
+    if k < len(t) + 11:
+        return False
+    expected = b"\x00\x01" + b"\xff" * (k - len(t) - 3) + b"\x00" + t
+    return hmac.compare_digest(em, expected)
+
+
+# NIST P-256 domain parameters
+_P = 0xffffffff00000001000000000000000000000000ffffffffffffffffffffffff
+_A = _P - 3
+_B = 0x5ac635d8aa3a93e7b3ebbd55769886bc651d06b0cc53b0f63bce3c3e27d2604b
+_N = 0xffffffff00000000ffffffffffffffffbce6faada7179e84f3b9cac2fc632551
+_G = (0x6b17d1f2e12c4247f8bce6e563a440f277037d812deb33a0f4a13945d898c296,
+      0x4fe342e2fe1a7f9b8ee7eb4a7c0f9e162bce33576b315ececbb6406837bf51f5)
+
+
+def _ec_add(p1, p2):
+    if p1 is None:
+        return p2
+    if p2 is None:
+        return p1
+    x1, y1 = p1
+    x2, y2 = p2
+    if x1 == x2:
+        if (y1 + y2) % _P == 0:
+            return None
+        m = (3 * x1 * x1 + _A) * pow(2 * y1, -1, _P) % _P
+    else:
+        m = (y2 - y1) * pow(x2 - x1, -1, _P) % _P
+    x3 = (m * m - x1 - x2) % _P
+    return x3, (m * (x1 - x3) - y1) % _P
+
+
+def _ec_mul2(u1, p1, u2, p2):
+    """u1*p1 + u2*p2 via Shamir's trick."""
+    both = _ec_add(p1, p2)
+    result = None
+    for i in range(max(u1.bit_length(), u2.bit_length()) - 1, -1, -1):
+        result = _ec_add(result, result)
+        b1, b2 = (u1 >> i) & 1, (u2 >> i) & 1
+        if b1 and b2:
+            result = _ec_add(result, both)
+        elif b1:
+            result = _ec_add(result, p1)
+        elif b2:
+            result = _ec_add(result, p2)
+    return result
+
+
+def _verify_es256(jwk, signing_input, signature):
+    if jwk.get("crv", "P-256") != "P-256" or len(signature) != 64:
+        return False
+    q = (_b64url_int(jwk["x"]), _b64url_int(jwk["y"]))
+    if (q[1] * q[1] - (q[0] ** 3 + _A * q[0] + _B)) % _P != 0:
+        return False
+    r = int.from_bytes(signature[:32], "big")
+    s = int.from_bytes(signature[32:], "big")
+    if not (0 < r < _N and 0 < s < _N):
+        return False
+    z = int.from_bytes(hashlib.sha256(signing_input).digest(), "big")
+    w = pow(s, -1, _N)
+    point = _ec_mul2(z * w % _N, _G, r * w % _N, q)
+    return point is not None and point[0] % _N == r
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  JWKS
+# ══════════════════════════════════════════════════════════════════════
+
+def _fetch_jwks():
+    sb_url = os.environ.get("SUPABASE_URL", "").rstrip("/")
+    if not sb_url:
+        raise LocalVerifyUnavailable("SUPABASE_URL not configured")
+    ak = os.environ.get("SUPABASE_ANON_KEY", "")
+    try:
+        raw = http_pool.urlopen("GET", f"{sb_url}/auth/v1/.well-known/jwks.json",
+                            headers={"apikey": ak, "Accept": "application/json"}, timeout=deadline.timeout(5))
+        keys = json.loads(raw.decode("utf-8")).get("keys", [])
+    except Exception as e:
+        raise LocalVerifyUnavailable(f"JWKS fetch failed: {e}")
+    return {k["kid"]: k for k in keys if isinstance(k, dict) and k.get("kid")}
+
+
+def _get_jwk(kid):
+    now = time.time()
+    with _jwks_lock:
+        age = now - _jwks["fetched_at"]
+        jwk = _jwks["keys"].get(kid)
+        if jwk and age < JWKS_TTL_SECONDS:
+            return jwk
+        # Unknown kid (key rotation) forces a refresh, but not more often than
+        # JWKS_MIN_REFRESH_SECONDS so forged kids cannot hammer the endpoint.
+        if age >= JWKS_MIN_REFRESH_SECONDS or not _jwks["fetched_at"]:
+            _jwks["keys"] = _fetch_jwks()
+            _jwks["fetched_at"] = now
+        return _jwks["keys"].get(kid)
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Public API
+# ══════════════════════════════════════════════════════════════════════
+
+def _check_signature(header, signing_input, signature):
+    alg = header.get("alg")
+    if alg == "HS256":
+        secret = os.environ.get("SUPABASE_JWT_SECRET", "")
+        if not secret:
+            raise LocalVerifyUnavailable("SUPABASE_JWT_SECRET not configured")
+        expected = hmac.new(secret.encode("utf-8"), signing_input, hashlib.sha256).digest()
+        return hmac.compare_digest(expected, signature)
+    if alg in ("RS256", "ES256"):
+        jwk = _get_jwk(header.get("kid"))
+        if not jwk:
+            return False
+        if alg == "RS256":
+            return jwk.get("kty") == "RSA" and _verify_rs256(jwk, signing_input, signature)
+        return jwk.get("kty") == "EC" and _verify_es256(jwk, signing_input, signature)
+    return False
+
+
+def _check_claims(claims, now):
+    exp = claims.get("exp")
+    if not isinstance(exp, (int, float)) or exp + JWT_LEEWAY_SECONDS <= now:
+        return False
+    nbf = claims.get("nbf")
+    if isinstance(nbf, (int, float)) and nbf - JWT_LEEWAY_SECONDS > now:
+        return False
+    aud = claims.get("aud")
+    auds = aud if isinstance(aud, list) else [aud]
+    if JWT_AUDIENCE and JWT_AUDIENCE not in auds:
+        return False
+    return bool(claims.get("sub"))
+
+
+def user_from_claims(claims):
+    """Shape claims like the /auth/v1/user fields the endpoints read."""
+    return {
+        "id": claims["sub"],
+        "email": claims.get("email", ""),
+        "role": claims.get("role"),
+        "aud": claims.get("aud"),
+        "app_metadata": claims.get("app_metadata", {}),
+        "user_metadata": claims.get("user_metadata", {}),
+    }
+
+
+def verify_token(token):
+    """
+    Verify a Supabase access token locally.
+    Returns the user dict, None if the token is invalid, or raises
+    LocalVerifyUnavailable when the caller should fall back to /auth/v1/user.
+    """
+    cached = cache_get(token)
+    if cached is not None:
+        return cached
+
+    decoded = decode_unverified(token)
+    if not decoded:
+        return None
+    header, claims, signing_input, signature = decoded
+
+    if not _check_signature(header, signing_input, signature):
+        return None
+    if not _check_claims(claims, time.time()):
+        return None
+
+    user = user_from_claims(claims)
+    cache_put(token, user, claims["exp"])
+    return user
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Latency-aware Gemini model router
+One routing policy for generate, video and image: per task, an ordered
+list of candidate models, each optionally limited to request sizes and
+plan tiers. Every call updates an EWMA of latency and error rate per
+model; candidates are ranked by that health (plus a small penalty for
+lower policy preference) and a model answering 429/5xx or timing out is
+failed over to the next one. Set GEMINI_MODEL_POLICY to a JSON object of
+the same shape as DEFAULT_POLICY to override it. No external dependencies.
+"""
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.error
+
+from . import breaker
+
+
+# ===== CONFIG =====
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta/models"
+
+DEFAULT_POLICY = {
+    # task -> candidates in order of preference. Optional per candidate:
+    # "max_output_tokens" (largest request it takes), "tiers" (plans it serves).
+    "text": [
+        {"model": "gemini-2.0-flash"},
+        {"model": "gemini-2.0-flash-lite", "max_output_tokens": 4096},
+    ],
+    "video": [
+        {"model": "gemini-2.0-flash"},
+        {"model": "gemini-2.0-flash-lite"},
+    ],
+    "image": [
+        {"model": "gemini-2.0-flash-exp"},
+        {"model": "gemini-2.0-flash-preview-image-generation"},
+    ],
+}
+
+ROUTER_EWMA_ALPHA = 0.2
+ROUTER_PRIOR_LATENCY = 5.0          # seconds assumed before a model is observed
+ROUTER_ERROR_WEIGHT = 4.0           # score = latency * (1 + weight * error_rate) + rank penalty
+ROUTER_RANK_PENALTY = float(os.environ.get("GEMINI_ROUTER_RANK_PENALTY", "2.0"))
+ROUTER_ERROR_HALF_LIFE = 60.0       # an idle model's error rate halves this often, so it gets retried
+
+_FAILOVER_ERRORS = (urllib.error.URLError, http.client.HTTPException, OSError, ValueError, KeyError)
+
+_lock = threading.Lock()
+_health = {}                        # model -> {"latency", "error_rate", "calls", "updated_at"}
+_policy = []                        # [policy dict] once loaded
+
+
+class NoModelAvailable(Exception):
+    pass
+
+
+def policy():
+    if not _policy:
+        loaded = DEFAULT_POLICY
+        raw = os.environ.get("GEMINI_MODEL_POLICY", "")
+        if raw:
+            try:
+                loaded = {**DEFAULT_POLICY, **json.loads(raw)}
+            except ValueError:
+                pass
+        _policy.append(loaded)
+    return _policy[0]
+
+
+def url(model, method="generateContent"):
+    return f"{GEMINI_API_BASE}/{model}:{method}"
+
+
+def candidates(task, size=0, tier=None):
+    """Eligible models for a request, best first."""
+    eligible = []
+    for rank, entry in enumerate(policy().get(task, [])):
+        if size and entry.get("max_output_tokens") and size > entry["max_output_tokens"]:
+            continue
+        if entry.get("tiers") and (tier or "free") not in entry["tiers"]:
+            continue
+        eligible.append((rank, entry["model"]))
+    if not eligible:
+        # Nothing matches the size/tier limits; fall back to the first choice.
+        first = policy().get(task) or [{"model": "gemini-2.0-flash"}]
+        eligible = [(0, first[0]["model"])]
+
+    now = time.monotonic()
+    with _lock:
+        scored = []
+        for rank, model in eligible:
+            health = _health.get(model)
+            if health is None:
+                latency, error_rate = ROUTER_PRIOR_LATENCY, 0.0
+            else:
+                latency = health["latency"]
+                error_rate = health["error_rate"] * 0.5 ** ((now - health["updated_at"]) / ROUTER_ERROR_HALF_LIFE)
+            score = latency * (1 + ROUTER_ERROR_WEIGHT * error_rate) + rank * ROUTER_RANK_PENALTY
+            scored.append((score, rank, model))
+    scored.sort()
+    # Models whose breaker is open go last rather than vanishing, so a
+    # request still has somewhere to go when every model is struggling.
+    return ([m for _, _, m in scored if not breaker.get(f"gemini:{m}").is_open()]
+            + [m for _, _, m in scored if breaker.get(f"gemini:{m}").is_open()])
+
+
+def choose(task, size=0, tier=None):
+    return candidates(task, size, tier)[0]
+
+
+def record(model, seconds, ok):
+    now = time.monotonic()
+    with _lock:
+        health = _health.get(model)
+        if health is None:
+            health = _health[model] = {
+                "latency": seconds if ok else ROUTER_PRIOR_LATENCY, "error_rate": 0.0, "calls": 0, "updated_at": now,
+            }
+        if ok:
+            health["latency"] += ROUTER_EWMA_ALPHA * (seconds - health["latency"])
+        decayed = health["error_rate"] * 0.5 ** ((now - health["updated_at"]) / ROUTER_ERROR_HALF_LIFE)
+        health["error_rate"] = decayed + ROUTER_EWMA_ALPHA * ((0.0 if ok else 1.0) - decayed)
+        health["calls"] += 1
+        health["updated_at"] = now
+    circuit = breaker.get(f"gemini:{model}")
+    if ok:
+        circuit.record_success()
+    else:
+        circuit.record_failure()
+
+
+def call(task, fn, size=0, tier=None):
+    """
+    Run fn(model) on the best candidate, failing over on 429/5xx, network
+    errors, timeouts and unusable responses. Other HTTP errors (a bad
+    request) are raised at once. Returns fn's result.
+    """
+    last_error = None
+    for model in candidates(task, size, tier):
+        started = time.monotonic()
+        try:
+            result = fn(model)
+        except urllib.error.HTTPError as e:
+            if e.code != 429 and e.code < 500:
+                raise
+            record(model, time.monotonic() - started, ok=False)
+            last_error = e
+            continue
+        except _FAILOVER_ERRORS as e:
+            record(model, time.monotonic() - started, ok=False)
+            last_error = e
+            continue
+        record(model, time.monotonic() - started, ok=True)
+        return result
+    raise last_error or NoModelAvailable(task)
+
+
+def health():
+    with _lock:
+        return {model: dict(h) for model, h in _health.items()}
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Near-duplicate detection against a user's past posts
+Every delivered model-written post gets a MinHash sketch per language
+(word 3-shingles of the normalized text, 60 hash functions, low 16 bits
+kept — 120 bytes). Sketches are stored one row per generation in
+generation_sketches and loaded per user into an in-process LSH index
+(20 bands x 3 rows), so a lookup hashes the new post once and compares
+it only with the few past posts sharing a band. A post whose estimated
+similarity reaches NEAR_DUP_THRESHOLD is a near-duplicate; the caller
+regenerates just those days. No external dependencies — stdlib only.
+"""
+import base64
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+
+
+# ===== CONFIG =====
+NEAR_DUP_ENABLED = os.environ.get("NEAR_DUP_ENABLED", "1") in ("1", "true", "yes")
+NEAR_DUP_THRESHOLD = float(os.environ.get("NEAR_DUP_THRESHOLD", "0.5"))
+NEAR_DUP_HISTORY_DAYS = int(os.environ.get("NEAR_DUP_HISTORY_DAYS", "90"))
+NEAR_DUP_MAX_ROWS = 500             # most recent generations loaded per user
+NEAR_DUP_CACHE_SECONDS = 600.0
+NEAR_DUP_CACHE_USERS = 256
+
+NUM_HASHES = 60
+BANDS, ROWS = 20, 3                 # BANDS * ROWS == NUM_HASHES
+SHINGLE_WORDS = 3
+_MERSENNE = (1 << 61) - 1
+_MASK = 0xFFFF
+
+# Fixed coefficients (Mersenne Twister output for a fixed int seed is stable
+# across Python versions): stored sketches stay comparable across deploys.
+_rng = random.Random(0x5EED)
+_COEFFS = tuple((_rng.getrandbits(61) % (_MERSENNE - 1) + 1, _rng.getrandbits(61) % _MERSENNE)
+                for _ in range(NUM_HASHES))
+del _rng
+
+_lock = threading.Lock()
+_users = OrderedDict()              # user_id -> (loaded_at, SketchIndex)
+_loading = {}                       # user_id -> Future of the history load
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Sketches
+# ══════════════════════════════════════════════════════════════════════
+
+def _shingles(text):
+    from .gen_cache import normalize_text
+
+    words = normalize_text(text).split()
+    if len(words) <= SHINGLE_WORDS:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))} if words else set()
+    return {zlib.crc32(" ".join(words[i:i + SHINGLE_WORDS]).encode("utf-8"))
+            for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def sketch(text):
+    """MinHash signature of a text (array of NUM_HASHES uint16), or None if it is empty."""
+    hashes = _shingles(text)
+    if not hashes:
+        return None
+    return array("H", [min((a * h + b) % _MERSENNE for h in hashes) & _MASK for a, b in _COEFFS])
+
+
+def sketch_post(post):
+    """{lang: signature} for the post's text_ar / text_en."""
+    out = {}
+    for lang in ("ar", "en"):
+        text = post.get(f"text_{lang}") if isinstance(post, dict) else None
+        if isinstance(text, str):
+            signature = sketch(text)
+            if signature is not None:
+                out[lang] = signature
+    return out
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_HASHES
+
+
+def _band_keys(signature):
+    raw = signature.tobytes()
+    width = ROWS * signature.itemsize
+    return [(band << 32) | zlib.crc32(raw[band * width:(band + 1) * width]) for band in range(BANDS)]
+
+
+class SketchIndex:
+    """LSH index over one user's signatures: a flat signature array and band buckets per language."""
+
+    def __init__(self):
+        self._sigs = {"ar": array("H"), "en": array("H")}
+        self._buckets = {"ar": {}, "en": {}}
+
+    def __len__(self):
+        return sum(len(sigs) for sigs in self._sigs.values()) // NUM_HASHES
+
+    def add(self, lang, signature):
+        sigs = self._sigs[lang]
+        position = len(sigs) // NUM_HASHES
+        sigs.extend(signature)
+        buckets = self._buckets[lang]
+        for key in _band_keys(signature):
+            buckets.setdefault(key, []).append(position)
+
+    def best(self, lang, signature):
+        """Highest similarity to any indexed signature (0.0 when nothing shares a band)."""
+        sigs, buckets = self._sigs[lang], self._buckets[lang]
+        seen, best = set(), 0.0
+        for key in _band_keys(signature):
+            for position in buckets.get(key, ()):
+                if position in seen:
+                    continue
+                seen.add(position)
+                start = position * NUM_HASHES
+                best = max(best, similarity(signature, sigs[start:start + NUM_HASHES]))
+        return best
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Per-user history
+# ══════════════════════════════════════════════════════════════════════
+
+def prefetch(user_id):
+    """Start loading the user's history on the "supabase" pool; find() waits for it."""
+    if not NEAR_DUP_ENABLED or not user_id:
+        return
+    with _lock:
+        entry = _users.get(user_id)
+        if entry is not None and time.monotonic() - entry[0] < NEAR_DUP_CACHE_SECONDS:
+            return
+        if user_id in _loading:
+            return
+        from . import workers
+
+        _loading[user_id] = workers.submit("supabase", _load, user_id)
+
+
+def _index_for(user_id):
+    prefetch(user_id)
+    with _lock:
+        entry = _users.get(user_id)
+        if entry is not None and time.monotonic() - entry[0] < NEAR_DUP_CACHE_SECONDS:
+            _users.move_to_end(user_id)
+            return entry[1]
+        future = _loading.get(user_id)
+    if future is None:
+        return SketchIndex()
+    try:
+        return future.result()
+    except Exception:
+        return SketchIndex()
+
+
+def _load(user_id):
+    from . import supabase
+
+    index = SketchIndex()
+    try:
+        since = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - NEAR_DUP_HISTORY_DAYS * 86400))
+        rows = supabase.supabase_request(
+            "GET", "/rest/v1/generation_sketches", use_service_key=True,
+            params={"user_id": f"eq.{user_id}", "created_at": f"gte.{since}", "select": "signatures",
+                    "order": "created_at.desc", "limit": str(NEAR_DUP_MAX_ROWS)},
+        )
+        for row in rows if isinstance(rows, list) else ():
+            for lang, packed in (row.get("signatures") or {}).items():
+                if lang in ("ar", "en"):
+                    for signature in _unpack(packed):
+                        index.add(lang, signature)
+        loaded = isinstance(rows, list)
+    except Exception:
+        loaded = False
+    with _lock:
+        _loading.pop(user_id, None)
+        if loaded:
+            _users[user_id] = (time.monotonic(), index)
+            _users.move_to_end(user_id)
+            while len(_users) > NEAR_DUP_CACHE_USERS:
+                _users.popitem(last=False)
+    return index
+
+
+def _pack(signatures):
+    flat = array("H")
+    for signature in signatures:
+        flat.extend(signature)
+    if sys.byteorder != "little":
+        flat.byteswap()
+    return base64.b64encode(flat.tobytes()).decode("ascii")
+
+
+def _unpack(packed):
+    flat = array("H")
+    try:
+        flat.frombytes(base64.b64decode(packed))
+    except (ValueError, TypeError):
+        return []
+    if sys.byteorder != "little":
+        flat.byteswap()
+    return [flat[i:i + NUM_HASHES] for i in range(0, len(flat) - NUM_HASHES + 1, NUM_HASHES)]
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Checking and recording a calendar
+# ══════════════════════════════════════════════════════════════════════
+
+def find(user_id, posts):
+    """
+    Sketch the posts and check each against the user's history and the
+    posts before it in the same calendar. Returns (duplicate positions,
+    sketches) — sketches[i] is posts[i]'s {lang: signature} for record().
+    """
+    sketches = [sketch_post(post) for post in posts]
+    if not NEAR_DUP_ENABLED or not user_id:
+        return [], sketches
+    history = _index_for(user_id)
+    current = SketchIndex()
+    duplicates = []
+    for position, langs in enumerate(sketches):
+        if any(max(history.best(lang, sig), current.best(lang, sig)) >= NEAR_DUP_THRESHOLD
+               for lang, sig in langs.items()):
+            duplicates.append(position)
+        for lang, sig in langs.items():
+            current.add(lang, sig)
+    return duplicates, sketches
+
+
+def record(user_id, sketches):
+    """Add delivered posts' sketches to the user's index and store them (one generation_sketches row)."""
+    if not NEAR_DUP_ENABLED or not user_id or not sketches:
+        return
+    by_lang = {}
+    for langs in sketches:
+        for lang, sig in langs.items():
+            by_lang.setdefault(lang, []).append(sig)
+    if not by_lang:
+        return
+    with _lock:
+        entry = _users.get(user_id)
+    if entry is not None:
+        for lang, sigs in by_lang.items():
+            for sig in sigs:
+                entry[1].add(lang, sig)
+
+    from . import supabase, write_behind
+
+    row = {"user_id": user_id, "posts": len(sketches),
+           "signatures": {lang: _pack(sigs) for lang, sigs in by_lang.items()}}
+    if write_behind.enqueue("generation_sketches", row):
+        return
+    try:
+        supabase.supabase_request("POST", "/rest/v1/generation_sketches", data=row,
+                                  use_service_key=True, prefer="return=minimal")
+    except Exception:
+        pass
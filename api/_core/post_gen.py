@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Post calendar generation
+Gemini calls (routed, hedged, token-budgeted), streaming, chunked fan-out
+for large calendars, partial-output recovery and the template fallback.
+Shared by /api/generate and /api/batch; the endpoints own HTTP, auth and
+token accounting. No external dependencies — stdlib only.
+"""
+import json
+import os
+
+from . import deadline, hashtag_index, hedge, http_pool, json_stream, model_router, tables, token_budget
+
+
+# ===== CONFIG =====
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
+# Calendars longer than one chunk are split by week and generated
+# concurrently; the whole fan-out is bounded by GENERATE_SLO_SECONDS.
+GENERATE_CHUNK_SIZE = int(os.environ.get("GENERATE_CHUNK_SIZE", "7"))
+GENERATE_MAX_PARALLEL = int(os.environ.get("GENERATE_MAX_PARALLEL", "5"))
+GENERATE_SLO_SECONDS = float(os.environ.get("GENERATE_SLO_SECONDS", "30"))
+
+# Field names of gen_args, in order; also the generation cache key fields.
+GEN_ARG_NAMES = ("business_name", "business_type", "target_audience", "platforms", "tone", "language", "num_posts")
+
+
+def parse_spec(body):
+    """gen_args tuple (in GEN_ARG_NAMES order) from a request body / brand spec."""
+    return (
+        (body.get("business_name") or "").strip() or "My Business",
+        body.get("business_type", "general"),
+        (body.get("target_audience") or "").strip(),
+        body.get("platforms") or ["instagram"],
+        body.get("tone", "friendly"),
+        body.get("language", "both"),
+        min(max(int(body.get("num_posts", 7)), 1), 30),
+    )
+
+
+def cache_key(gen_args):
+    from . import gen_cache
+
+    return gen_cache.make_key("posts", dict(zip(GEN_ARG_NAMES, gen_args)))
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Gemini generation
+# ══════════════════════════════════════════════════════════════════════
+
+def build_posts_request(name, btype, audience, platforms, tone, language, num_posts):
+    tone_ar, tone_en = tables.TONE_MAP.get(tone, tables.DEFAULT_TONE)
+    prompt = tables.POSTS_PROMPT_TEMPLATE.format(
+        num_posts=num_posts, name=name,
+        btype_label=tables.BUSINESS_TYPE_LABELS.get(btype, btype),
+        audience=audience or 'General Saudi audience',
+        platform_str=", ".join(platforms),
+        tone_ar=tone_ar, tone_en=tone_en,
+        lang_instruction=tables.LANGUAGE_INSTRUCTIONS.get(language, tables.DEFAULT_LANGUAGE_INSTRUCTION),
+        length_guidance=token_budget.length_guidance(platforms),
+        hashtag_guidance=hashtag_index.prompt_guidance(btype, platforms, language),
+    )
+    return _posts_request_body(prompt, token_budget.max_output_tokens(num_posts, language, platforms))
+
+
+def _posts_request_body(prompt, max_output_tokens):
+    return {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "generationConfig": {"temperature": 0.95, "topP": 0.95, "maxOutputTokens": max_output_tokens, "responseMimeType": "application/json"}
+    }
+
+
+def generate_with_gemini(name, btype, audience, platforms, tone, language, num_posts, tier=None):
+    request_body = build_posts_request(name, btype, audience, platforms, tone, language, num_posts)
+    return _call_gemini(request_body, budget=(num_posts, language, platforms), tier=tier)
+
+
+def _call_gemini(request_body, timeout=55, budget=None, tier=None):
+    """
+    POST to generateContent on the model the router picks (failing over on
+    429/5xx) and parse the posts, hedged when enabled (see _core.hedge).
+    budget=(num_posts, language, platforms) calibrates token_budget from
+    the winning response.
+    """
+    size = request_body["generationConfig"]["maxOutputTokens"]
+
+    def attempt(model):
+        bucket = hedge.size_bucket(f"posts:{model}", size)
+        return hedge.call(lambda: _gemini_posts_once(model, request_body, timeout), bucket)
+
+    result, posts = model_router.call("text", attempt, size=size, tier=tier)
+    if budget:
+        token_budget.observe(*budget, result)
+    return posts
+
+
+def _gemini_posts_once(model, request_body, timeout):
+    url = f"{model_router.url(model)}?key={GEMINI_API_KEY}"
+    # Keep the tail reserve back so a late failure still leaves time for
+    # the template fill, the debit and the write.
+    timeout = deadline.timeout(timeout, reserve=deadline.DEADLINE_TAIL_RESERVE_SECONDS)
+    raw = http_pool.urlopen("POST", url, data=json.dumps(request_body).encode("utf-8"),
+                            headers={"Content-Type": "application/json"}, timeout=timeout)
+    result = json.loads(raw.decode("utf-8"))
+
+    # A truncated or slightly malformed response still yields every
+    # complete post; callers re-request whatever days are missing.
+    posts, _ = json_stream.decode_items(result["candidates"][0]["content"]["parts"][0]["text"])
+    if not posts:
+        raise ValueError("No complete posts in Gemini response")
+    return result, posts
+
+
+def stream_with_gemini(name, btype, audience, platforms, tone, language, num_posts, tier=None):
+    """
+    Yield each post dict as soon as Gemini's streamed JSON closes it. The
+    model is routed like any other call, but a stream is not failed over
+    once started — the caller's template fill covers a broken stream.
+    """
+    import time
+
+    request_body = build_posts_request(name, btype, audience, platforms, tone, language, num_posts)
+    timeout = deadline.timeout(55, reserve=deadline.DEADLINE_TAIL_RESERVE_SECONDS)
+    model = model_router.choose("text", request_body["generationConfig"]["maxOutputTokens"], tier)
+    url = f"{model_router.url(model, 'streamGenerateContent')}?alt=sse&key={GEMINI_API_KEY}"
+    parser = json_stream.ItemStreamParser()
+    started = time.monotonic()
+    ok = False
+    try:
+        lines = http_pool.stream_lines("POST", url, data=json.dumps(request_body).encode("utf-8"),
+                                       headers={"Content-Type": "application/json"}, timeout=timeout)
+        last = {}
+        for line in lines:
+            if not line.startswith(b"data:"):
+                continue
+            chunk = json.loads(line[5:].decode("utf-8"))
+            for candidate in chunk.get("candidates", [])[:1]:
+                for part in candidate.get("content", {}).get("parts", []):
+                    yield from parser.feed(part.get("text", ""))
+            if "usageMetadata" in chunk:
+                last = chunk
+        ok = True
+    finally:
+        if ok or parser.items_emitted == 0:
+            # A stream the consumer abandoned part-way says nothing about health.
+            model_router.record(model, time.monotonic() - started, ok)
+    # The final SSE chunk carries usageMetadata and the finishReason.
+    token_budget.observe(num_posts, language, platforms, last)
+
+
+def get_demo_posts(name, language, platforms):
+    name = name or "نشاطك التجاري"
+    p1 = platforms[0] if platforms else "instagram"
+    p2 = platforms[1] if len(platforms) > 1 else p1
+    p3 = platforms[2] if len(platforms) > 2 else p1
+    posts = [
+        {"day": 1, "platform": p1, "text_ar": f"في {name}، نؤمن بأن التميز مو مجرد كلام — هو أسلوب حياة.", "text_en": f"At {name}, we believe excellence isn't just a word — it's how we operate.", "hashtags_ar": ["#السعودية", "#تميز", "#جودة", "#الرياض", "#رؤية_2030"], "hashtags_en": ["#SaudiArabia", "#Excellence", "#Quality", "#Riyadh", "#Vision2030"]},
+        {"day": 2, "platform": p2, "text_ar": f"عملاؤنا الكرام هم سر نجاحنا. شكراً لثقتكم في {name}.", "text_en": f"Our valued customers are the secret to our success. Thank you for trusting {name}.", "hashtags_ar": ["#عملاء", "#ثقة", "#نجاح", "#الرياض", "#خدمات"], "hashtags_en": ["#CustomerFirst", "#Trust", "#Success", "#Riyadh", "#Services"]},
+        {"day": 3, "platform": p3, "text_ar": f"تبي جودة واحترافية؟ {name} وجهتك الأولى.", "text_en": f"Looking for quality and professionalism? {name} is your go-to.", "hashtags_ar": ["#جودة", "#احترافية", "#السعودية", "#تسوق", "#اعمال"], "hashtags_en": ["#Quality", "#Professional", "#SaudiArabia", "#Business", "#Growth"]},
+    ]
+    if language == "ar":
+        for p in posts:
+            p.pop("text_en", None); p.pop("hashtags_en", None)
+    elif language == "en":
+        for p in posts:
+            p.pop("text_ar", None); p.pop("hashtags_ar", None)
+    return posts
+
+
+def generate_with_templates(name, btype, platforms, tone, language, num_posts):
+    from . import template_bank
+
+    return template_bank.render_calendar(name, btype, platforms, tone, language, num_posts)
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Chunked fan-out for large calendars
+# ══════════════════════════════════════════════════════════════════════
+
+def generate_calendar(gen_args, tier=None):
+    """
+    Generate the whole calendar. Returns (posts, mode, debug_error); mode is
+    "ai", "partial" (some chunks fell back to templates) or "template".
+    """
+    name, btype, audience, platforms, tone, language, num_posts = gen_args
+    if num_posts <= GENERATE_CHUNK_SIZE:
+        try:
+            posts = generate_with_gemini(*gen_args, tier=tier)[:num_posts]
+        except Exception as exc:
+            return generate_with_templates(name, btype, platforms, tone, language, num_posts), "template", str(exc)
+        if len(posts) == num_posts:
+            return posts, "ai", None
+        # Truncated: keep what was recovered and ask only for the rest.
+        for day, post in enumerate(posts, 1):
+            post["day"] = day
+        plan = plan_chunks(platforms, num_posts)[0]
+        posts = posts + rerequest_days(gen_args, plan[len(posts):], tier=tier)
+        posts, error = fill_from_templates(gen_args, plan, posts, [])
+        return posts, "partial" if error else "ai", error
+
+    posts = []
+    errors = []
+    chunks = 0
+    for chunk_posts, error in iter_calendar_chunks(gen_args, tier=tier):
+        chunks += 1
+        posts.extend(chunk_posts)
+        if error:
+            errors.append(error)
+    posts.sort(key=lambda p: p["day"])
+    return posts, chunked_mode(len(errors), chunks), "; ".join(errors) or None
+
+
+def chunked_mode(failed, chunks):
+    if not failed:
+        return "ai"
+    return "template" if failed == chunks else "partial"
+
+
+def plan_chunks(platforms, num_posts):
+    """
+    Split days 1..num_posts into week-sized chunks of (day, platform,
+    content_type). Content types rotate across the whole calendar, so
+    consecutive chunks start on different types instead of repeating.
+    """
+    platforms = platforms or ["instagram"]
+    types = tables.CONTENT_TYPES
+    plan = [(day, platforms[(day - 1) % len(platforms)], types[(day - 1) % len(types)])
+            for day in range(1, num_posts + 1)]
+    return [plan[i:i + GENERATE_CHUNK_SIZE] for i in range(0, num_posts, GENERATE_CHUNK_SIZE)]
+
+
+def iter_calendar_chunks(gen_args, tier=None):
+    """
+    Run every chunk on the bounded "gemini" pool and yield (posts, error)
+    per chunk in completion order. Chunks that fail, come back short or
+    miss the SLO deadline are filled from templates, so every day is
+    yielded exactly once with its planned day number.
+    """
+    from concurrent.futures import TimeoutError as FuturesTimeout, as_completed
+    from . import workers
+
+    name, btype, audience, platforms, tone, language, num_posts = gen_args
+    pool = workers.get_pool("gemini", max_workers=GENERATE_MAX_PARALLEL)
+    futures = {
+        pool.submit(generate_chunk, name, btype, audience, tone, language, num_posts, chunk,
+                    GENERATE_SLO_SECONDS, tier=tier): chunk
+        for chunk in plan_chunks(platforms, num_posts)
+    }
+    templates = []
+
+    def fill(chunk, posts, error):
+        posts, short = fill_from_templates(gen_args, chunk, posts, templates)
+        return posts, error or short
+
+    pending = set(futures)
+    try:
+        # The SLO, cut short by the request deadline (templates fill the rest).
+        wait = deadline.budget(GENERATE_SLO_SECONDS, reserve=deadline.DEADLINE_TAIL_RESERVE_SECONDS)
+        for future in as_completed(futures, timeout=wait):
+            pending.discard(future)
+            try:
+                posts, error = future.result(), None
+            except Exception as exc:
+                posts, error = [], str(exc)
+            yield fill(futures[future], posts, error)
+    except FuturesTimeout:
+        for future in pending:
+            future.cancel()
+            yield fill(futures[future], [], f"days {futures[future][0][0]}-{futures[future][-1][0]}: timed out")
+
+
+def fill_from_templates(gen_args, plan, posts, templates):
+    """
+    Fill the plan's days missing from posts with template posts. templates
+    is a list reused across calls (filled on first need). Returns
+    (posts sorted by day, error or None).
+    """
+    if len(posts) >= len(plan):
+        return sorted(posts, key=lambda p: p["day"]), None
+    name, btype, _, platforms, tone, language, num_posts = gen_args
+    if not templates:
+        templates.extend(generate_with_templates(name, btype, platforms, tone, language, num_posts))
+    have = {p["day"] for p in posts}
+    filled = posts + [templates[day - 1] for day, _, _ in plan if day not in have]
+    error = f"days {plan[0][0]}-{plan[-1][0]}: {len(have)} of {len(plan)} posts returned"
+    return sorted(filled, key=lambda p: p["day"]), error
+
+
+def rerequest_days(gen_args, plan, timeout=GENERATE_SLO_SECONDS, tier=None, avoid=()):
+    """Generate only the given (day, platform, type) entries; [] on failure."""
+    if not plan:
+        return []
+    name, btype, audience, _, tone, language, num_posts = gen_args
+    try:
+        return generate_chunk(name, btype, audience, tone, language, num_posts, plan, timeout,
+                              retry_missing=False, tier=tier, avoid=avoid)
+    except Exception:
+        return []
+
+
+def generate_chunk(name, btype, audience, tone, language, total_posts, chunk, timeout, retry_missing=True, tier=None,
+                   avoid=()):
+    """
+    Generate the posts for one chunk plan; day numbers are taken from the
+    plan. If the response comes back truncated, the missing days are asked
+    for once more before giving up on them. avoid: texts the new posts
+    must not resemble (near-duplicate regeneration).
+    """
+    avoid_note = ""
+    if avoid:
+        avoid_note = tables.AVOID_NOTE_TEMPLATE.format(examples="\n".join(f'  "{text[:160]}"' for text in avoid))
+    tone_ar, tone_en = tables.TONE_MAP.get(tone, tables.DEFAULT_TONE)
+    chunk_platforms = [platform for _, platform, _ in chunk]
+    prompt = tables.POSTS_CHUNK_PROMPT_TEMPLATE.format(
+        total_posts=total_posts, num_posts=len(chunk), name=name,
+        btype_label=tables.BUSINESS_TYPE_LABELS.get(btype, btype),
+        audience=audience or 'General Saudi audience',
+        tone_ar=tone_ar, tone_en=tone_en,
+        lang_instruction=tables.LANGUAGE_INSTRUCTIONS.get(language, tables.DEFAULT_LANGUAGE_INSTRUCTION),
+        plan="\n".join(f"- Day {day} — {platform} — {ctype}" for day, platform, ctype in chunk),
+        first_day=chunk[0][0],
+        length_guidance=token_budget.length_guidance(chunk_platforms),
+        hashtag_guidance=hashtag_index.prompt_guidance(btype, chunk_platforms, language),
+        avoid_note=avoid_note,
+    )
+    request_body = _posts_request_body(prompt, token_budget.max_output_tokens(len(chunk), language, chunk_platforms))
+    budget = (len(chunk), language, chunk_platforms)
+    posts = [p for p in _call_gemini(request_body, timeout=timeout, budget=budget, tier=tier) if isinstance(p, dict)]
+    for (day, platform, _), post in zip(chunk, posts):
+        post["day"] = day
+        post.setdefault("platform", platform)
+    posts = posts[:len(chunk)]
+    if retry_missing and len(posts) < len(chunk):
+        gen_args = (name, btype, audience, None, tone, language, total_posts)
+        posts += rerequest_days(gen_args, chunk[len(posts):], timeout, tier=tier)
+    return posts
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Near-duplicates of the user's past posts
+# ══════════════════════════════════════════════════════════════════════
+
+def dedupe(user_id, gen_args, posts, tier=None):
+    """
+    Regenerate, once, only the days whose post is a near-duplicate of one
+    the user already has (see _core.near_dup). Returns (posts, regenerated
+    days, sketches of the returned posts for near_dup.record()).
+    """
+    from . import near_dup
+
+    duplicates, sketches = near_dup.find(user_id, posts)
+    if not duplicates or deadline.near():
+        return posts, [], sketches
+    plan = {entry[0]: entry for chunk in plan_chunks(gen_args[3], gen_args[-1]) for entry in chunk}
+    redo = [plan[posts[i]["day"]] for i in duplicates if posts[i].get("day") in plan]
+    avoid = [posts[i].get("text_en") or posts[i].get("text_ar") or "" for i in duplicates]
+    fresh = {post["day"]: post for post in rerequest_days(gen_args, redo, tier=tier, avoid=avoid)}
+    if not fresh:
+        return posts, [], sketches
+    posts = [fresh.get(post.get("day"), post) for post in posts]
+    for i, post in enumerate(posts):
+        if post.get("day") in fresh:
+            sketches[i] = near_dup.sketch_post(post)
+    return posts, sorted(fresh), sketches
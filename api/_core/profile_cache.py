@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Read-through profile cache
+Two tiers: a per-process TTL cache shared by warm invocations, and a
+per-request memo so one request never reads the same profile twice. The
+memo lives in a contextvar, so _core.workers pool tasks share their
+request's memo and never keep one across requests. Writers (token
+debits, plan changes, signup) update entries in place.
+No external dependencies — stdlib only.
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+# ===== CONFIG =====
+PROFILE_CACHE_TTL_SECONDS = float(os.environ.get("PROFILE_CACHE_TTL_SECONDS", "15"))
+PROFILE_CACHE_MAX_ENTRIES = 1024
+
+_lock = threading.Lock()
+_entries = OrderedDict()    # user_id -> (stored_at, profile)
+_request_memo = contextvars.ContextVar("postir_profile_memo", default=None)
+
+
+def _memo():
+    # Outside a request (scripts, warm-up) nothing is memoized.
+    memo = _request_memo.get()
+    return memo if memo is not None else {}
+
+
+def begin_request():
+    """Start a fresh per-request memo. Call at the top of each do_GET/do_POST."""
+    _request_memo.set({})
+
+
+def get(user_id, fresh=False):
+    """
+    Return a cached profile copy or None. The request memo always wins; the
+    TTL tier is skipped when fresh=True (e.g. re-checking before a 402).
+    """
+    memo = _memo()
+    if user_id in memo:
+        return dict(memo[user_id])
+    if fresh or PROFILE_CACHE_TTL_SECONDS <= 0:
+        return None
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry is None:
+            return None
+        stored_at, profile = entry
+        # Expired entries stay put (LRU-bounded) for get_stale().
+        if time.monotonic() - stored_at > PROFILE_CACHE_TTL_SECONDS:
+            return None
+        _entries.move_to_end(user_id)
+        return dict(profile)
+
+
+def get_stale(user_id):
+    """Last known profile regardless of age, for degraded mode. None if never seen."""
+    with _lock:
+        entry = _entries.get(user_id)
+        return dict(entry[1]) if entry is not None else None
+
+
+def put(user_id, profile):
+    """Store a profile read from (or just written to) Supabase."""
+    profile = dict(profile)
+    _memo()[user_id] = profile
+    with _lock:
+        _entries[user_id] = (time.monotonic(), profile)
+        _entries.move_to_end(user_id)
+        while len(_entries) > PROFILE_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+
+def update(user_id, fields):
+    """
+    Merge written fields into any cached copy without a re-read. The
+    entry keeps its age: only a full read (put) makes a profile fresh.
+    """
+    memo = _memo()
+    if user_id in memo:
+        memo[user_id] = {**memo[user_id], **fields}
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry is not None:
+            _entries[user_id] = (entry[0], {**entry[1], **fields})
+
+
+def invalidate(user_id):
+    _memo().pop(user_id, None)
+    with _lock:
+        _entries.pop(user_id, None)
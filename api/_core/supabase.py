@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Shared Supabase helper module
+Used by all API endpoints. JWT verification and the write-behind buffer are
+imported on first use so paths that never touch them skip the import.
+No external dependencies — stdlib only.
+"""
+import http.client
+import json
+import os
+import random
+import time
+import urllib.error
+from urllib.parse import urlencode
+
+from . import breaker
+from . import deadline
+from . import http_pool
+from . import profile_cache
+
+
+# ===== CONFIG =====
+SUPABASE_TIMEOUT_SECONDS = float(os.environ.get("SUPABASE_TIMEOUT_SECONDS", "8"))
+SUPABASE_RETRY_BUDGET_SECONDS = float(os.environ.get("SUPABASE_RETRY_BUDGET_SECONDS", "12"))
+SUPABASE_GET_RETRIES = int(os.environ.get("SUPABASE_GET_RETRIES", "2"))
+# While the Supabase breaker is open (or a read fails), admit generation on
+# the last cached entitlement and queue debits for later reconciliation.
+DEGRADED_MODE = os.environ.get("SUPABASE_DEGRADED_MODE", "") in ("1", "true", "yes")
+
+_IDEMPOTENT_METHODS = ("GET", "HEAD")
+_NETWORK_ERRORS = (urllib.error.URLError, http.client.HTTPException, OSError)
+
+
+def get_supabase_config():
+    """Returns (supabase_url, service_key, anon_key)."""
+    url = os.environ.get("SUPABASE_URL", "").rstrip("/")
+    service_key = os.environ.get("SUPABASE_SERVICE_KEY", "")
+    anon_key = os.environ.get("SUPABASE_ANON_KEY", "")
+    return url, service_key, anon_key
+
+
+def supabase_request(method, path, data=None, token=None, use_service_key=False, params=None, prefer=None,
+                     reserve=None):
+    """
+    Make an HTTP request to Supabase REST or Auth API. reserve is the time
+    kept back from the request deadline (DEADLINE_RESERVE_SECONDS unless
+    given; billing RPCs pass DEADLINE_BILLING_RESERVE_SECONDS).
+    """
+    supabase_url, service_key, anon_key = get_supabase_config()
+
+    if not supabase_url:
+        raise ValueError("SUPABASE_URL not configured")
+
+    full_url = f"{supabase_url}{path}"
+    if params:
+        full_url += "?" + urlencode(params)
+
+    headers = {
+        "Content-Type": "application/json",
+        "apikey": anon_key,
+        "Accept": "application/json",
+    }
+
+    if use_service_key and service_key:
+        headers["Authorization"] = f"Bearer {service_key}"
+        headers["apikey"] = service_key
+    elif token:
+        headers["Authorization"] = f"Bearer {token}"
+
+    if prefer:
+        headers["Prefer"] = prefer
+
+    body = json.dumps(data).encode("utf-8") if data is not None else None
+
+    if reserve is None:
+        reserve = deadline.DEADLINE_RESERVE_SECONDS
+    if deadline.near(reserve):
+        # Not enough time left to make the call; callers treat it like a 5xx.
+        return {"_error": True, "_status": 504, "_body": "Request deadline exceeded", "_deadline": True}
+
+    circuit = breaker.get("supabase")
+    if not circuit.allow():
+        return {"_error": True, "_status": 503, "_body": "Supabase circuit open", "_circuit_open": True}
+
+    # Only idempotent reads are retried; writes and RPCs get one attempt.
+    attempts = 1 + (SUPABASE_GET_RETRIES if method in _IDEMPOTENT_METHODS else 0)
+    give_up_at = time.monotonic() + deadline.budget(SUPABASE_RETRY_BUDGET_SECONDS, reserve)
+    for attempt in range(attempts):
+        timeout = max(0.5, min(SUPABASE_TIMEOUT_SECONDS, give_up_at - time.monotonic()))
+        last_attempt = attempt == attempts - 1 or time.monotonic() >= give_up_at
+        try:
+            raw = http_pool.urlopen(method, full_url, data=body, headers=headers, timeout=timeout).decode("utf-8")
+        except urllib.error.HTTPError as e:
+            raw = e.read().decode("utf-8") if e.fp else ""
+            if e.code >= 500 or e.code == 429:
+                circuit.record_failure()
+                if not last_attempt:
+                    _backoff(attempt)
+                    continue
+            else:
+                circuit.record_success()
+            try:
+                return {"_error": True, "_status": e.code, "_body": json.loads(raw)}
+            except Exception:
+                return {"_error": True, "_status": e.code, "_body": raw}
+        except _NETWORK_ERRORS:
+            circuit.record_failure()
+            if last_attempt:
+                raise
+            _backoff(attempt)
+            continue
+        except BaseException:
+            circuit.record_failure()
+            raise
+
+        circuit.record_success()
+        if raw.strip():
+            return json.loads(raw)
+        return {}
+
+
+def _backoff(attempt):
+    """Full-jitter exponential backoff: 0-100ms, 0-200ms, 0-400ms..."""
+    time.sleep(random.uniform(0, 0.1 * (2 ** attempt)))
+
+
+def iso_timestamp(epoch):
+    """A timestamptz value for PostgREST rows and filters (UTC, second precision)."""
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(epoch))
+
+
+def parse_timestamp(iso, default):
+    """Epoch seconds of a timestamptz PostgREST returned, or default."""
+    from datetime import datetime
+
+    try:
+        return datetime.fromisoformat(iso.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return default
+
+
+def upstream_unavailable(resp):
+    """
+    True for a failed-fast or 5xx response — the cases degraded mode covers.
+    A call skipped for the request deadline says nothing about Supabase.
+    """
+    return isinstance(resp, dict) and bool(resp.get("_error")) and not resp.get("_deadline") and bool(
+        resp.get("_circuit_open") or resp.get("_status", 0) >= 500)
+
+
+def verify_token(token):
+    from . import jwt_auth
+
+    if not token:
+        return None
+    try:
+        return jwt_auth.verify_token(token)
+    except jwt_auth.LocalVerifyUnavailable:
+        pass
+    resp = supabase_request("GET", "/auth/v1/user", token=token)
+    if resp and not resp.get("_error") and resp.get("id"):
+        jwt_auth.cache_put(token, resp, jwt_auth.unverified_expiry(token))
+        return resp
+    return None
+
+
+def verify_and_check_tokens(token, required=1):
+    """
+    Verify the token and check the caller's balance, overlapping the two.
+    The profile read starts from the unverified `sub` claim while the token
+    is verified on a worker; if verification fails or names another user
+    the profile is discarded. Returns (user, has_tokens, profile).
+    """
+    from . import jwt_auth
+    from . import workers
+
+    if not token:
+        return None, False, None
+
+    user = jwt_auth.cache_get(token)
+    if user is None:
+        sub = jwt_auth.unverified_subject(token)
+        if not sub:
+            return None, False, None
+        future = workers.submit("supabase", verify_token, token)
+        has_tokens, profile = check_tokens(sub, required)
+        user = future.result()
+        if not user or user.get("id") != sub:
+            return None, False, None
+        return user, has_tokens, profile
+
+    has_tokens, profile = check_tokens(user["id"], required)
+    return user, has_tokens, profile
+
+
+def get_user_profile(user_id, fresh=False):
+    cached = profile_cache.get(user_id, fresh=fresh)
+    if cached is not None:
+        return cached
+    try:
+        resp = supabase_request(
+            "GET",
+            "/rest/v1/profiles",
+            use_service_key=True,
+            params={"id": f"eq.{user_id}", "limit": "1"},
+        )
+    except Exception:
+        if not DEGRADED_MODE:
+            raise
+        resp = {"_error": True, "_status": 503, "_body": "Supabase unreachable"}
+    if DEGRADED_MODE and upstream_unavailable(resp):
+        stale = profile_cache.get_stale(user_id)
+        if stale is not None:
+            stale["_degraded"] = True
+            return stale
+    if isinstance(resp, list) and len(resp) > 0:
+        profile_cache.put(user_id, resp[0])
+        return resp[0]
+    if isinstance(resp, dict) and resp and not resp.get("_error"):
+        profile_cache.put(user_id, resp)
+        return resp
+    return None
+
+
+def has_tokens(profile, required=1):
+    plan = profile.get("plan", "free")
+    tokens_total = profile.get("tokens_total", 0)
+    tokens_used = profile.get("tokens_used", 0)
+
+    if plan == "pro":
+        return True
+
+    return (tokens_total - tokens_used) >= required
+
+
+def check_tokens(user_id, required=1):
+    profile = get_user_profile(user_id)
+    if not profile:
+        return False, None
+
+    if has_tokens(profile, required):
+        return True, profile
+
+    # Never refuse on a cached copy — the plan may have just been upgraded.
+    profile = get_user_profile(user_id, fresh=True) or profile
+    return has_tokens(profile, required), profile
+
+
+def update_user_tokens(user_id, tokens_used_increment):
+    """
+    Debit tokens with a PATCH conditional on the tokens_used we read, so a
+    stale cached profile can never overwrite a newer debit. A miss re-reads
+    the profile fresh and retries.
+    """
+    for _ in range(3):
+        profile = get_user_profile(user_id)
+        if not profile:
+            return False
+
+        current_used = profile.get("tokens_used", 0)
+        new_used = current_used + tokens_used_increment
+
+        resp = supabase_request(
+            "PATCH",
+            "/rest/v1/profiles",
+            data={"tokens_used": new_used, "updated_at": "now()"},
+            use_service_key=True,
+            params={"id": f"eq.{user_id}", "tokens_used": f"eq.{current_used}"},
+            prefer="return=representation",
+        )
+
+        if isinstance(resp, list) and resp:
+            profile_cache.put(user_id, resp[0])
+            return True
+        if isinstance(resp, dict) and resp.get("_error"):
+            return False
+        profile_cache.invalidate(user_id)
+    return False
+
+
+def log_generation(user_id, gen_type, platform=None, prompt_summary=None, tokens_consumed=1):
+    from . import write_behind
+
+    data = {
+        "user_id": user_id,
+        "type": gen_type,
+        "tokens_consumed": tokens_consumed,
+        "platform": platform,
+        "prompt_summary": prompt_summary,
+    }
+    data = {k: v for k, v in data.items() if v is not None}
+
+    if write_behind.enqueue("generations", data):
+        return True
+
+    resp = supabase_request(
+        "POST",
+        "/rest/v1/generations",
+        data=data,
+        use_service_key=True,
+    )
+
+    if resp and resp.get("_error"):
+        return False
+    return True
+
+
+def billing_request_id():
+    """Idempotency key for one billing RPC call (the RPCs ignore a repeated id)."""
+    import secrets
+
+    return secrets.token_hex(16)
+
+
+def debit_tokens_and_log(user_id, tokens, gen_type, platform=None, prompt_summary=None, hashtags=None):
+    """
+    Atomically debit tokens and log the generation through the
+    debit_tokens_and_log RPC (supabase/migrations). One round-trip, no lost
+    debits under concurrency. Returns the RPC result
+    ({"ok", "plan", "tokens_total", "tokens_used", "tokens_remaining"}).
+    In degraded mode (SUPABASE_DEGRADED_MODE) a debit that could not reach
+    Supabase (down, or skipped for the deadline) is queued for
+    reconciliation (write_behind.enqueue_rpc — best effort, see there); the
+    result then has "queued": True and the balance from the cached profile.
+    Without degraded mode it fails like any other error. Any other
+    failure (a 4xx, an unexpected reply) would fail again on replay, so it
+    is returned as {"ok": False, "error": "billing_failed"} and the caller
+    withholds the content.
+    hashtags is the _core.hashtag_index.summarize() record for the row.
+    Every call carries a fresh p_request_id, kept when it is queued, so a
+    replay of a debit that had in fact committed is not applied twice.
+    """
+    params = {
+        "p_request_id": billing_request_id(),
+        "p_user_id": user_id,
+        "p_tokens": tokens,
+        "p_type": gen_type,
+        "p_platform": platform,
+        "p_prompt_summary": prompt_summary,
+    }
+    if hashtags:
+        params["p_hashtags"] = hashtags
+    try:
+        resp = supabase_request("POST", "/rest/v1/rpc/debit_tokens_and_log", data=params, use_service_key=True,
+                                reserve=deadline.DEADLINE_BILLING_RESERVE_SECONDS)
+    except Exception:
+        resp = {"_error": True, "_status": 503, "_body": "Supabase unreachable"}
+
+    unreached = upstream_unavailable(resp) or (isinstance(resp, dict) and resp.get("_deadline"))
+    if unreached and DEGRADED_MODE:
+        return _queue_debit(user_id, tokens, params)
+    if not isinstance(resp, dict) or resp.get("_error") or "ok" not in resp:
+        return {"ok": False, "error": "billing_failed"}
+
+    if "tokens_used" in resp:
+        profile_cache.update(user_id, {k: resp[k] for k in ("plan", "tokens_total", "tokens_used") if k in resp})
+    return resp
+
+
+def _queue_debit(user_id, tokens, params):
+    """Defer a debit and reflect it in the cached entitlement meanwhile."""
+    from . import write_behind
+
+    write_behind.enqueue_rpc("debit_tokens_and_log", params)
+    profile = profile_cache.get_stale(user_id) or {}
+    tokens_used = profile.get("tokens_used", 0) + tokens
+    if profile:
+        profile_cache.update(user_id, {"tokens_used": tokens_used})
+    tokens_total = profile.get("tokens_total", 0)
+    return {
+        "ok": True, "queued": True, "plan": profile.get("plan", "free"),
+        "tokens_total": tokens_total, "tokens_used": tokens_used,
+        "tokens_remaining": max(0, tokens_total - tokens_used),
+    }
+
+
+def reserve_tokens(user_id, tokens):
+    """
+    Hold tokens for a bulk generation through the reserve_tokens RPC.
+    Returns the RPC result (same shape as debit_tokens_and_log's), or None
+    when the call failed. Nothing is queued in degraded mode: without a
+    confirmed balance the batch is refused rather than run on credit. Like
+    debits it carries a p_request_id, so a retried call holds tokens once.
+    """
+    params = {"p_request_id": billing_request_id(), "p_user_id": user_id, "p_tokens": tokens}
+    try:
+        resp = supabase_request("POST", "/rest/v1/rpc/reserve_tokens", data=params, use_service_key=True)
+    except Exception:
+        return None
+    if not isinstance(resp, dict) or resp.get("_error") or "ok" not in resp:
+        return None
+    if "tokens_used" in resp:
+        profile_cache.update(user_id, {k: resp[k] for k in ("plan", "tokens_total", "tokens_used") if k in resp})
+    return resp
+
+
+def settle_reservation(user_id, reserved, items):
+    """
+    Close a reservation: refund the unused part and log one generations
+    row per item ({"type", "platform", "prompt_summary", "tokens_consumed"})
+    in one transaction. An unreachable Supabase gets the settlement queued
+    (write_behind) whether or not degraded mode is on: the tokens are
+    already held, and failing would keep the refund from the user. Returns
+    "queued": True then.
+    Like debits, settlements carry a p_request_id and are applied once.
+    """
+    params = {
+        "p_request_id": billing_request_id(),
+        "p_user_id": user_id, "p_reserved": reserved, "p_items": items,
+    }
+    try:
+        resp = supabase_request("POST", "/rest/v1/rpc/settle_token_reservation", data=params, use_service_key=True,
+                                reserve=deadline.DEADLINE_BILLING_RESERVE_SECONDS)
+    except Exception:
+        resp = {"_error": True, "_status": 503, "_body": "Supabase unreachable"}
+
+    # Queued on a deadline skip too: the refund must not be lost, and the
+    # request id makes a replay of a settlement that did commit a no-op.
+    if upstream_unavailable(resp) or (isinstance(resp, dict) and resp.get("_deadline")):
+        from . import write_behind
+
+        write_behind.enqueue_rpc("settle_token_reservation", params)
+        refund = reserved - sum(item.get("tokens_consumed", 0) for item in items)
+        profile = profile_cache.get_stale(user_id) or {}
+        tokens_used = max(0, profile.get("tokens_used", 0) - refund)
+        if profile:
+            profile_cache.update(user_id, {"tokens_used": tokens_used})
+        tokens_total = profile.get("tokens_total", 0)
+        return {
+            "ok": True, "queued": True, "plan": profile.get("plan", "free"),
+            "tokens_total": tokens_total, "tokens_used": tokens_used,
+            "tokens_remaining": max(0, tokens_total - tokens_used),
+        }
+    if not isinstance(resp, dict) or resp.get("_error") or "ok" not in resp:
+        return None
+
+    if "tokens_used" in resp:
+        profile_cache.update(user_id, {k: resp[k] for k in ("plan", "tokens_total", "tokens_used") if k in resp})
+    return resp
+
+
+def update_user_plan(user_id, plan, tokens_total, tokens_used=0, plan_expires_at=None, airwallex_customer_id=None):
+    data = {
+        "plan": plan,
+        "tokens_total": tokens_total,
+        "tokens_used": tokens_used,
+        "updated_at": "now()",
+    }
+
+    if plan_expires_at:
+        data["plan_expires_at"] = plan_expires_at
+
+    if airwallex_customer_id:
+        data["airwallex_customer_id"] = airwallex_customer_id
+
+    resp = supabase_request(
+        "PATCH",
+        "/rest/v1/profiles",
+        data=data,
+        use_service_key=True,
+        params={"id": f"eq.{user_id}"},
+        prefer="return=representation",
+    )
+
+    if resp and isinstance(resp, dict) and resp.get("_error"):
+        return False
+    if isinstance(resp, list) and resp:
+        profile_cache.put(user_id, resp[0])
+    else:
+        profile_cache.invalidate(user_id)
+    return True
+
+
+def log_payment(user_id, plan, amount_sar, airwallex_intent_id=None, status="completed"):
+    from . import write_behind
+
+    data = {
+        "user_id": user_id,
+        "plan": plan,
+        "amount_sar": amount_sar,
+        "status": status,
+    }
+
+    if airwallex_intent_id:
+        data["airwallex_intent_id"] = airwallex_intent_id
+
+    if status != "completed" and write_behind.enqueue("payments", data):
+        return True
+
+    resp = supabase_request(
+        "POST",
+        "/rest/v1/payments",
+        data=data,
+        use_service_key=True,
+    )
+
+    if resp and resp.get("_error"):
+        return False
+    return True
+
+
+def create_profile(user_id, email):
+    data = {
+        "id": user_id,
+        "email": email,
+        "plan": "free",
+        "tokens_total": 3,
+        "tokens_used": 0,
+    }
+
+    resp = supabase_request(
+        "POST",
+        "/rest/v1/profiles",
+        data=data,
+        use_service_key=True,
+        prefer="return=representation",
+    )
+
+    if resp and isinstance(resp, dict) and resp.get("_error"):
+        return False
+    profile_cache.put(user_id, resp[0] if isinstance(resp, list) and resp else data)
+    return True
@@ -0,0 +1,192 @@
+"""
+Postir V2 — Static prompt and plan tables
+Built once at import (i.e. once per warm instance) instead of being
+re-created as dict literals on every request.
+"""
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Post generation (api/generate.py)
+# ══════════════════════════════════════════════════════════════════════
+
+TONE_MAP = {
+    "professional": ("احترافي ومصقول", "professional and polished"),
+    "friendly": ("ودّي وقريب", "warm and approachable"),
+    "formal": ("رسمي", "formal and corporate"),
+    "inspirational": ("ملهم وتحفيزي", "inspirational and motivational"),
+    "playful": ("مرح وخفيف", "fun and lighthearted"),
+}
+DEFAULT_TONE = ("ودّي", "friendly")
+
+BUSINESS_TYPE_LABELS = {
+    "restaurant": "مطعم / Restaurant", "online_store": "متجر إلكتروني / Online Store",
+    "real_estate": "عقارات / Real Estate", "beauty": "تجميل / Beauty & Skincare",
+    "fashion": "أزياء / Fashion", "technology": "تقنية / Technology",
+    "education": "تعليم / Education", "health": "صحة / Health",
+    "tourism": "سياحة / Tourism", "general": "عام / General Business",
+}
+
+LANGUAGE_INSTRUCTIONS = {
+    "both": 'For EACH post provide BOTH "text_ar" (Gulf Saudi dialect, NOT formal MSA) and "text_en" (professional English). Also provide "hashtags_ar" and "hashtags_en".',
+    "ar": 'Write all posts in Arabic ONLY using Gulf/Saudi dialect. Provide "text_ar" and "hashtags_ar" only.',
+    "en": 'Write all posts in English ONLY. Provide "text_en" and "hashtags_en" only.',
+}
+DEFAULT_LANGUAGE_INSTRUCTION = 'Provide both Arabic and English.'
+
+POSTS_PROMPT_TEMPLATE = """You are an expert Saudi social media content strategist. Generate exactly {num_posts} social media posts.
+
+BUSINESS: {name}
+TYPE: {btype_label}
+AUDIENCE: {audience}
+PLATFORMS: {platform_str}
+TONE: {tone_ar} / {tone_en}
+
+{lang_instruction}
+
+RULES:
+- Each post MUST be unique, creative, and engaging
+- 3-5 relevant hashtags per post{hashtag_guidance}
+- Mix content types: promotional, educational, behind-the-scenes, testimonial-style, engagement questions, seasonal content
+- Lengths (words per language version): {length_guidance}
+- Reference Saudi culture: Ramadan, Eid, National Day, Founding Day, Riyadh Season, coffee culture
+- NO emojis — clean text only
+- Distribute posts evenly across platforms
+- Arabic MUST be Gulf/Saudi dialect — natural and conversational, NOT formal MSA
+
+Return ONLY valid JSON:
+{{"posts":[{{"day":1,"platform":"instagram","text_ar":"...","text_en":"...","hashtags_ar":["#..."],"hashtags_en":["#..."]}}]}}
+
+Generate exactly {num_posts} posts, days 1 through {num_posts}."""
+
+# Target post length per platform, in words per language version. Drives the
+# prompt's length guidance and the output-token budget (_core/token_budget.py).
+PLATFORM_LENGTH_NORMS = {
+    "instagram": 90, "x": 40, "linkedin": 140, "facebook": 100,
+    "snapchat": 30, "tiktok": 50,
+}
+DEFAULT_LENGTH_NORM = 90
+
+# Large calendars are generated as concurrent chunks (api/generate.py); each
+# chunk gets its own day/platform/content-type plan so chunks don't repeat
+# one another.
+CONTENT_TYPES = (
+    "promotional", "educational", "behind-the-scenes",
+    "testimonial-style", "engagement question", "seasonal",
+)
+
+POSTS_CHUNK_PROMPT_TEMPLATE = """You are an expert Saudi social media content strategist. This is part of a {total_posts}-day content calendar; generate exactly {num_posts} posts, one for each day in the plan below.
+
+BUSINESS: {name}
+TYPE: {btype_label}
+AUDIENCE: {audience}
+TONE: {tone_ar} / {tone_en}
+
+{lang_instruction}
+
+PLAN (day — platform — content type):
+{plan}
+
+RULES:
+- Follow the plan exactly: same day numbers, platforms and content types
+- Each post MUST be unique, creative, and engaging
+- 3-5 relevant hashtags per post{hashtag_guidance}
+- Lengths (words per language version): {length_guidance}
+- Reference Saudi culture: Ramadan, Eid, National Day, Founding Day, Riyadh Season, coffee culture
+- NO emojis — clean text only
+- Arabic MUST be Gulf/Saudi dialect — natural and conversational, NOT formal MSA{avoid_note}
+
+Return ONLY valid JSON:
+{{"posts":[{{"day":{first_day},"platform":"instagram","text_ar":"...","text_en":"...","hashtags_ar":["#..."],"hashtags_en":["#..."]}}]}}"""
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Video reel scripts (api/video.py)
+# ══════════════════════════════════════════════════════════════════════
+
+VIDEO_TONE_MAP = {
+    "professional": ("احترافي", "professional"), "friendly": ("ودّي", "friendly"),
+    "formal": ("رسمي", "formal"), "inspirational": ("ملهم", "inspirational"),
+    "playful": ("مرح", "playful"),
+}
+
+VIDEO_BUSINESS_TYPE_LABELS = {
+    "restaurant": "restaurant/food", "online_store": "e-commerce/retail",
+    "real_estate": "real estate/property", "beauty": "beauty/skincare",
+    "fashion": "fashion/clothing", "technology": "technology/software",
+    "education": "education/training", "health": "health/wellness",
+    "tourism": "tourism/travel", "general": "business/services",
+}
+
+VIDEO_LANGUAGE_NOTES = {
+    "both": "provide BOTH text_ar (Gulf/Saudi Arabic dialect) and text_en (English)",
+    "ar": "provide text_ar (Gulf/Saudi Arabic dialect) only, set text_en to empty string",
+    "en": "provide text_en (English) only, set text_ar to empty string",
+}
+DEFAULT_VIDEO_LANGUAGE_NOTE = "provide both Arabic and English"
+
+VIDEO_SCRIPT_PROMPT_TEMPLATE = """Create a short video reel script for social media ({platform}) for this business:
+
+Business: {name}
+Type: {btype_label}
+Target Audience: {audience}
+Tone: {tone_ar} / {tone_en}
+
+Generate 6-8 caption slides for a 15-30 second vertical video reel.
+Each slide should be displayed for 2-4 seconds.
+
+Requirements:
+- Short, punchy text (max 8 words per slide in Arabic, 10 in English)
+- First slide is a hook (grabs attention instantly)
+- Last slide has a clear call-to-action
+- Reference Saudi culture where appropriate
+- visual_keyword: 1-2 English words for Pexels stock video search
+- {lang_note}
+- duration_seconds: 2, 3, or 4
+
+Return ONLY valid JSON array:
+[{{"slide": 1, "text_ar": "...", "text_en": "...", "visual_keyword": "...", "duration_seconds": 3}}]"""
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Image generation (api/image.py)
+# ══════════════════════════════════════════════════════════════════════
+
+PLATFORM_SPECS = {
+    "instagram": {"aspect": "square (1:1, 1080x1080px)", "style": "vibrant, lifestyle-focused"},
+    "instagram_story": {"aspect": "portrait (9:16, 1080x1920px)", "style": "bold, full-bleed visual"},
+    "x": {"aspect": "landscape (16:9, 1200x675px)", "style": "clean, minimal, high contrast"},
+    "linkedin": {"aspect": "landscape (1.91:1, 1200x627px)", "style": "professional, corporate"},
+    "snapchat": {"aspect": "portrait (9:16, 1080x1920px)", "style": "playful, colorful, casual"},
+    "tiktok": {"aspect": "portrait (9:16, 1080x1920px)", "style": "trendy, dynamic, eye-catching"},
+    "facebook": {"aspect": "landscape (16:9, 1200x630px)", "style": "engaging, clear message"},
+}
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Plans (api/payment.py)
+# ══════════════════════════════════════════════════════════════════════
+
+PLANS = {
+    "starter": {
+        "amount": 10.00, "currency": "SAR",
+        "description": "Postir - Starter Plan (10 Posts)", "order_prefix": "STR",
+        "tokens_total": 10, "plan_name": "starter", "expires_days": None,
+    },
+    "pro": {
+        "amount": 99.00, "currency": "SAR",
+        "description": "Postir - Pro Plan (Monthly Unlimited)", "order_prefix": "PRO",
+        "tokens_total": 999999, "plan_name": "pro", "expires_days": 30,
+    },
+    "ppu": {
+        "amount": 10.00, "currency": "SAR",
+        "description": "Postir - Pay Per Use (10 Posts)", "order_prefix": "PPU",
+        "tokens_total": 10, "plan_name": "starter", "expires_days": None,
+    },
+}
+PLAN_NAMES = ", ".join(PLANS.keys())
+
+# Appended to the chunk prompt's rules when days are regenerated because
+# they came out too close to posts the user already has.
+AVOID_NOTE_TEMPLATE = """
+- These posts are too close to ones this business already published; write something clearly different in angle, wording and hook:
+{examples}"""
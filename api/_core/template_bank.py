@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Indexed template bank for fallback posts
+Bilingual post fragments (tone openers, content-type bodies, business-type
+offers, calls to action) compiled once at import into an index
+keyed by (business_type, tone, platform, language, content_type). A
+calendar is rendered by deterministic seeded selection: the same request
+always yields the same posts, and no two days of a 30-day calendar share
+a body. Rendering 30 posts takes well under a millisecond, so this is a
+real low-latency tier, not just a last resort. Hashtags come from the
+ranked _core.hashtag_index. No external dependencies.
+"""
+import zlib
+
+from . import hashtag_index, tables
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Fragments
+# ══════════════════════════════════════════════════════════════════════
+
+OPENERS = {
+    "ar": {
+        "professional": ("الجودة عندنا التزام مو شعار.", "خبرتنا واهتمامنا بالتفاصيل يفرقون.", "التميز هو معيارنا."),
+        "friendly": ("هلا والله!", "عندنا لكم خبر حلو!", "جهزنا لكم شي بيعجبكم."),
+        "formal": ("يسرنا أن نعلن لكم:", "عملاءنا الكرام،", "يشرفنا خدمتكم دائماً."),
+        "inspirational": ("كل إنجاز كبير يبدأ بخطوة.", "احلم كبير وابدأ اليوم.", "النجاح يُبنى يوم بعد يوم."),
+        "playful": ("تخيلوا وش صار؟", "مفاجأة!", "خلونا نستانس شوي:"),
+    },
+    "en": {
+        "professional": ("Quality is a commitment, not a slogan.", "Built on expertise and attention to detail.", "Excellence is our standard."),
+        "friendly": ("Hey friends!", "Good news for you!", "We've got something you'll love."),
+        "formal": ("We are pleased to announce:", "Dear valued customers,", "It is our privilege to serve you."),
+        "inspirational": ("Every great journey starts with one step.", "Dream big, start today.", "Greatness is built day by day."),
+        "playful": ("Guess what?", "Plot twist:", "Okay, this is fun:"),
+    },
+}
+
+CALLS_TO_ACTION = {
+    "ar": {
+        "professional": ("تواصلوا معنا اليوم.", "اطلبوا الآن عبر الرابط في البايو."),
+        "friendly": ("مرّوا علينا، ننتظركم!", "شاركونا رأيكم في التعليقات."),
+        "formal": ("للاستفسار يسعدنا تواصلكم.", "نتشرف بزيارتكم."),
+        "inspirational": ("ابدأ رحلتك معنا اليوم.", "خلّ اليوم بداية الفرق."),
+        "playful": ("لا يفوتكم!", "منشن أحد لازم يشوف هذا!"),
+    },
+    "en": {
+        "professional": ("Contact us today.", "Order now via the link in bio."),
+        "friendly": ("Drop by, we'd love to see you!", "Tell us what you think in the comments."),
+        "formal": ("We welcome your inquiries.", "We look forward to your visit."),
+        "inspirational": ("Start your journey with us today.", "Make today the day it changes."),
+        "playful": ("Don't miss out!", "Tag someone who needs to see this!"),
+    },
+}
+
+OFFERS = {
+    "ar": {
+        "restaurant": ("أطباقنا الطازجة", "قائمتنا الجديدة", "أطباق الشيف المميزة"),
+        "online_store": ("تشكيلتنا الجديدة", "عروض المتجر", "منتجاتنا الأكثر مبيعاً"),
+        "real_estate": ("مشاريعنا السكنية", "وحداتنا الجاهزة", "فرصنا الاستثمارية"),
+        "beauty": ("جلسات العناية", "منتجات البشرة", "باقات الجمال"),
+        "fashion": ("تشكيلة الموسم", "قطعنا الجديدة", "إطلالات الأسبوع"),
+        "technology": ("حلولنا التقنية", "خدماتنا الرقمية", "منصتنا الذكية"),
+        "education": ("دوراتنا التدريبية", "برامجنا التعليمية", "ورش العمل"),
+        "health": ("خدماتنا الصحية", "برامج العافية", "استشاراتنا"),
+        "tourism": ("رحلاتنا المميزة", "باقات السفر", "تجاربنا السياحية"),
+        "general": ("خدماتنا", "حلولنا المتكاملة", "عروضنا"),
+    },
+    "en": {
+        "restaurant": ("our fresh dishes", "our new menu", "the chef's signature plates"),
+        "online_store": ("our new collection", "our store deals", "our best-sellers"),
+        "real_estate": ("our residential projects", "our move-in-ready units", "our investment opportunities"),
+        "beauty": ("our care sessions", "our skincare range", "our beauty packages"),
+        "fashion": ("this season's collection", "our new pieces", "the looks of the week"),
+        "technology": ("our tech solutions", "our digital services", "our smart platform"),
+        "education": ("our training courses", "our learning programs", "our workshops"),
+        "health": ("our health services", "our wellness programs", "our consultations"),
+        "tourism": ("our signature trips", "our travel packages", "our local experiences"),
+        "general": ("our services", "our complete solutions", "our offers"),
+    },
+}
+
+# One body per occurrence of a content type: five bodies cover a 30-day
+# calendar (6 content types x 5) without repeating.
+BODIES = {
+    "ar": {
+        "promotional": (
+            "عرض خاص على {offer} في {name} لفترة محدودة.",
+            "الحين في {name}: {offer} بأسعار تناسبك.",
+            "هذا الأسبوع في {name}: {offer} بقيمة ما تتفوت.",
+            "اكتشف {offer} من {name} واستمتع بتجربة تستاهلها.",
+            "ليش تنتظر؟ {offer} من {name} متوفرة الحين.",
+        ),
+        "educational": (
+            "نصيحة من {name}: اختيارك الصح يبدأ بمعرفة احتياجك بالضبط.",
+            "هل تعرف؟ {offer} في {name} مصممة بعناية عشان تناسبك.",
+            "من خبرتنا في {name}: التفاصيل الصغيرة تصنع الفرق الكبير.",
+            "سؤال يتكرر علينا في {name}: كيف أختار الأنسب لي؟ الجواب في التجربة.",
+            "معلومة سريعة من {name} عن {offer} تساعدك تختار صح.",
+        ),
+        "behind-the-scenes": (
+            "من ورا الكواليس في {name}: هنا يبدأ الشغل الحقيقي.",
+            "فريق {name} يشتغل بشغف كل يوم عشان يقدم لكم {offer}.",
+            "كيف نجهز {offer}؟ خذوا نظرة على يومنا في {name}.",
+            "صباح جديد في {name} — القهوة جاهزة والفريق متحمس.",
+            "التفاصيل اللي ما تشوفونها هي سر جودة {name}.",
+        ),
+        "testimonial-style": (
+            "\"تجربة ولا أروع!\" — هذا اللي قاله لنا أحد عملاء {name}.",
+            "ثقة عملائنا هي أكبر إنجازاتنا. شكراً لكل من اختار {name}.",
+            "عميلتنا قالت: {offer} من {name} غيرت تجربتها بالكامل.",
+            "أجمل شي نسمعه: \"برجع لـ{name} مرة ثانية أكيد.\"",
+            "تقييماتكم لـ{offer} تفرحنا وتحمسنا نقدم أكثر.",
+        ),
+        "engagement question": (
+            "سؤال لكم: وش أكثر شي يعجبكم في {name}؟",
+            "لو تختارون واحد من {offer}، وش بيكون اختياركم؟",
+            "صوّتوا: تفضلون تزورون {name} الصبح ولا المساء؟",
+            "كمّل الجملة: أفضل شي في {name} هو ...",
+            "وش تبون نضيف في {name} الفترة الجاية؟ نسمع منكم.",
+        ),
+        "seasonal": (
+            "رمضان كريم من {name} — جهزنا لكم {offer} تناسب أجواء الشهر.",
+            "كل عام وأنتم بخير! احتفلوا بالعيد مع {name}.",
+            "في اليوم الوطني نفخر بوطننا — و{name} يحتفل معكم.",
+            "موسم الرياض بدأ، و{name} جاهز بـ{offer}.",
+            "فنجال قهوة وأجواء حلوة — هذا الموسم مع {name}.",
+        ),
+    },
+    "en": {
+        "promotional": (
+            "Special offer on {offer} at {name}, for a limited time.",
+            "Now at {name}: {offer} at prices that work for you.",
+            "This week at {name}: {offer}, too good to miss.",
+            "Discover {offer} at {name} — the experience you deserve.",
+            "Why wait? Get {offer} at {name} today.",
+        ),
+        "educational": (
+            "Tip from {name}: the right choice starts with knowing exactly what you need.",
+            "Did you know? At {name}, {offer} are designed with you in mind.",
+            "From our experience at {name}: small details make the biggest difference.",
+            "A question we hear a lot at {name}: how do I pick what's right for me? Start by trying.",
+            "A quick fact from {name} about {offer} to help you choose well.",
+        ),
+        "behind-the-scenes": (
+            "Behind the scenes at {name}: this is where the real work begins.",
+            "The {name} team works with passion every day to bring you {offer}.",
+            "How do we prepare {offer}? Take a look at a day at {name}.",
+            "A new morning at {name} — coffee's ready and the team is fired up.",
+            "The details you don't see are the secret behind {name}'s quality.",
+        ),
+        "testimonial-style": (
+            "\"An amazing experience!\" — what one of {name}'s customers told us.",
+            "Our clients' trust is our greatest achievement. Thank you for choosing {name}.",
+            "One customer told us {offer} from {name} completely changed her experience.",
+            "The best thing we hear: \"I'll definitely be back at {name}.\"",
+            "Your reviews of {offer} make our day and push us to do more.",
+        ),
+        "engagement question": (
+            "Question for you: what do you love most about {name}?",
+            "If you could pick just one of {offer}, what would it be?",
+            "Vote: do you prefer visiting {name} in the morning or the evening?",
+            "Finish the sentence: the best thing about {name} is...",
+            "What should {name} add next? We're listening.",
+        ),
+        "seasonal": (
+            "Ramadan Kareem from {name} — we've prepared {offer} for the holy month.",
+            "Eid Mubarak! Celebrate with {name}.",
+            "On National Day we're proud of our country — and {name} celebrates with you.",
+            "Riyadh Season is here, and {name} is ready with {offer}.",
+            "A cup of Saudi coffee and good vibes — this season with {name}.",
+        ),
+    },
+}
+
+# Which fragments a post carries on each platform: short-form platforms get
+# the body alone, long-form ones opener + body + call to action.
+PLATFORM_SHAPES = {
+    "x": (False, False), "snapchat": (False, False), "tiktok": (False, False),
+    "instagram": (False, True), "instagram_story": (False, True),
+    "facebook": (True, True), "linkedin": (True, True),
+}
+DEFAULT_PLATFORM_SHAPE = (False, True)
+TEMPLATE_TAG_POOL = 10
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Index — built once at import
+# ══════════════════════════════════════════════════════════════════════
+
+def _build_index():
+    """(business_type, tone, platform, language, content_type) -> (openers, bodies, offers, ctas)."""
+    index = {}
+    for lang in ("ar", "en"):
+        for btype, offers in OFFERS[lang].items():
+            for tone in OPENERS[lang]:
+                for platform, (with_opener, with_cta) in PLATFORM_SHAPES.items():
+                    openers = OPENERS[lang][tone] if with_opener else ("",)
+                    ctas = CALLS_TO_ACTION[lang][tone] if with_cta else ("",)
+                    for ctype in tables.CONTENT_TYPES:
+                        index[(btype, tone, platform, lang, ctype)] = (openers, BODIES[lang][ctype], offers, ctas)
+    return index
+
+
+_INDEX = _build_index()
+
+
+def _slots(btype, tone, platform, lang, ctype):
+    btype = btype if btype in OFFERS[lang] else "general"
+    tone = tone if tone in OPENERS[lang] else "friendly"
+    platform = platform if platform in PLATFORM_SHAPES else "instagram"
+    return _INDEX[(btype, tone, platform, lang, ctype)]
+
+
+def request_seed(name, btype, tone, language):
+    return zlib.crc32(f"{name.strip().casefold()}|{btype}|{tone}|{language}".encode("utf-8"))
+
+
+def render_calendar(name, btype, platforms, tone, language, num_posts):
+    """
+    Fallback posts for days 1..num_posts. Day d uses platform
+    platforms[(d-1) % n] and content type CONTENT_TYPES[(d-1) % 6] — the
+    same plan the AI chunks follow — and occurrence r of a content type
+    uses body r (offset by the seed), so bodies never repeat within 30 days.
+    """
+    platforms = platforms or ["instagram"]
+    langs = [lang for lang in ("ar", "en") if language in (lang, "both")] or ["ar", "en"]
+    types = tables.CONTENT_TYPES
+    seed = request_seed(name, btype, tone, language)
+
+    posts = []
+    for i in range(num_posts):
+        platform = platforms[i % len(platforms)]
+        post = {"day": i + 1, "platform": platform}
+        ctype = types[i % len(types)]
+        occurrence = i // len(types)
+        for lang in langs:
+            openers, bodies, offers, ctas = _slots(btype, tone, platform, lang, ctype)
+            body = bodies[(seed + occurrence) % len(bodies)].format(
+                name=name, offer=offers[(seed // 7 + i) % len(offers)])
+            opener = openers[(seed // 11 + i) % len(openers)]
+            cta = ctas[(seed // 13 + i) % len(ctas)]
+            post[f"text_{lang}"] = " ".join(part for part in (opener, body, cta) if part)
+            # The two best-ranked tags on every post, three more rotating
+            # through the rest of the top ten.
+            tags = hashtag_index.top(btype, platform, lang, TEMPLATE_TAG_POOL)
+            rest = tags[2:] or tags
+            start = (seed // 17 + 3 * i) % len(rest)
+            post[f"hashtags_{lang}"] = tags[:2] + [rest[(start + j) % len(rest)] for j in range(min(3, len(rest)))]
+        posts.append(post)
+    return posts
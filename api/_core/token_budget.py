@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Adaptive output-token budgets for post generation
+maxOutputTokens is sized from the number of posts, the language setting
+and each platform's length norm instead of a flat 8192. The tokens-per-
+post figures start from priors and are calibrated from the usageMetadata
+Gemini returns (an EWMA of mean and deviation per language); truncated
+responses push the estimate up. The calibration table is persisted as
+JSON and reloaded by the next cold start. No external dependencies.
+"""
+import json
+import os
+import threading
+import time
+
+from . import tables
+
+
+# ===== CONFIG =====
+TOKEN_BUDGET_CALIBRATION_PATH = os.environ.get("TOKEN_BUDGET_CALIBRATION_PATH", "/tmp/postir_token_calibration.json")
+TOKEN_BUDGET_MIN = 512
+TOKEN_BUDGET_MAX = 8192
+TOKEN_BUDGET_OVERHEAD = 64          # JSON envelope: {"posts":[...]}
+TOKEN_BUDGET_HEADROOM = 1.15
+TOKEN_BUDGET_ALPHA = 0.1            # EWMA weight of each observation
+TOKEN_BUDGET_TRUNCATION_BUMP = 1.25
+TOKEN_BUDGET_TRUNCATION_CAP = 2.0    # truncations never push the mean past this multiple of the prior
+TOKEN_BUDGET_SAVE_INTERVAL = 30.0
+
+# Output tokens per "unit" — one post at a 100-word platform norm, JSON keys
+# and hashtags included — before any calibration. Arabic tokenizes longer.
+_PRIORS = {
+    "ar": {"mean": 230.0, "dev": 40.0, "n": 0},
+    "en": {"mean": 170.0, "dev": 30.0, "n": 0},
+    "both": {"mean": 420.0, "dev": 70.0, "n": 0},
+}
+
+_lock = threading.Lock()
+_table = {}
+_saved_at = [0.0]
+
+
+def length_units(platforms, num_posts):
+    """Sum of platform length norms over the calendar, in 100-word units."""
+    platforms = platforms or ["instagram"]
+    norms = tables.PLATFORM_LENGTH_NORMS
+    total = sum(norms.get(platforms[i % len(platforms)], tables.DEFAULT_LENGTH_NORM) for i in range(num_posts))
+    return total / 100.0
+
+
+def length_guidance(platforms):
+    """Prompt text for the platforms in the request, e.g. "instagram ~90, x ~40"."""
+    norms = tables.PLATFORM_LENGTH_NORMS
+    seen = dict.fromkeys(platforms or ["instagram"])
+    return ", ".join(f"{p} ~{norms.get(p, tables.DEFAULT_LENGTH_NORM)}" for p in seen)
+
+
+def max_output_tokens(num_posts, language, platforms):
+    cal = _calibration(language)
+    per_unit = cal["mean"] + 2 * cal["dev"]
+    budget = TOKEN_BUDGET_OVERHEAD + length_units(platforms, num_posts) * per_unit * TOKEN_BUDGET_HEADROOM
+    budget = -(-int(budget) // 64) * 64
+    return max(TOKEN_BUDGET_MIN, min(TOKEN_BUDGET_MAX, budget))
+
+
+def observe(num_posts, language, platforms, result):
+    """Fold one Gemini response's usageMetadata into the calibration table."""
+    usage = (result or {}).get("usageMetadata") or {}
+    out_tokens = usage.get("candidatesTokenCount")
+    units = length_units(platforms, num_posts)
+    if not out_tokens or units <= 0:
+        return
+    candidates = result.get("candidates") or [{}]
+    truncated = candidates[0].get("finishReason") == "MAX_TOKENS"
+    key = language if language in _PRIORS else "both"
+
+    with _lock:
+        cal = _load().setdefault(key, dict(_PRIORS[key]))
+        if truncated:
+            # Only a lower bound was observed; grow the estimate instead, but
+            # not without bound, so a run of truncations cannot pin every
+            # budget at the maximum long after the cause has gone.
+            ceiling = _PRIORS[key]["mean"] * TOKEN_BUDGET_TRUNCATION_CAP
+            cal["mean"] = max(cal["mean"], min(ceiling, cal["mean"] * TOKEN_BUDGET_TRUNCATION_BUMP))
+        else:
+            sample = max(0, out_tokens - TOKEN_BUDGET_OVERHEAD) / units
+            cal["dev"] += TOKEN_BUDGET_ALPHA * (abs(sample - cal["mean"]) - cal["dev"])
+            cal["mean"] += TOKEN_BUDGET_ALPHA * (sample - cal["mean"])
+        cal["n"] += 1
+        due = truncated or time.monotonic() - _saved_at[0] >= TOKEN_BUDGET_SAVE_INTERVAL
+        snapshot = json.dumps(_table) if due else None
+    if snapshot:
+        _save(snapshot)
+
+
+def calibration_table():
+    with _lock:
+        return json.loads(json.dumps(_load()))
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Persistence
+# ══════════════════════════════════════════════════════════════════════
+
+def _calibration(language):
+    key = language if language in _PRIORS else "both"
+    with _lock:
+        return dict(_load().get(key) or _PRIORS[key])
+
+
+def _load():
+    """The calibration table, read from disk on first use. Call under _lock."""
+    if not _table:
+        _table.update({k: dict(v) for k, v in _PRIORS.items()})
+        try:
+            with open(TOKEN_BUDGET_CALIBRATION_PATH, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            for key, cal in stored.items():
+                if key in _PRIORS and all(isinstance(cal.get(f), (int, float)) for f in ("mean", "dev", "n")):
+                    _table[key] = {"mean": float(cal["mean"]), "dev": float(cal["dev"]), "n": int(cal["n"])}
+        except (OSError, ValueError, AttributeError):
+            pass
+        _saved_at[0] = time.monotonic()
+    return _table
+
+
+def _save(snapshot):
+    tmp = f"{TOKEN_BUDGET_CALIBRATION_PATH}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(snapshot)
+        os.replace(tmp, TOKEN_BUDGET_CALIBRATION_PATH)
+        _saved_at[0] = time.monotonic()
+    except OSError:
+        pass
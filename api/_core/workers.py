@@ -0,0 +1,38 @@
+"""
+Postir V2 — Shared bounded thread pools
+Named pools created on first use, so functions that never fan out do not
+import concurrent.futures or start threads during a cold start. Tasks run
+in the submitter's contextvars context, so the request deadline
+(_core.deadline) follows the work into the pool.
+"""
+import threading
+
+_lock = threading.Lock()
+_pools = {}
+
+
+def get_pool(name, max_workers=4):
+    pool = _pools.get(name)
+    if pool is None:
+        with _lock:
+            pool = _pools.get(name)
+            if pool is None:
+                pool = _pools[name] = _context_pool_class()(max_workers=max_workers, thread_name_prefix=name)
+    return pool
+
+
+def submit(name, fn, *args, **kwargs):
+    """Run fn on the named pool (default size 4). Returns a Future."""
+    return get_pool(name).submit(fn, *args, **kwargs)
+
+
+def _context_pool_class():
+    import contextvars
+    from concurrent.futures import ThreadPoolExecutor
+
+    class ContextPool(ThreadPoolExecutor):
+
+        def submit(self, fn, /, *args, **kwargs):
+            return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+    return ContextPool
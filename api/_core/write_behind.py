@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Write-behind buffer for non-critical audit rows
+Opt-in (WRITE_BEHIND_ENABLED=1). Audit inserts (pending payments,
+generations logged outside the debit RPC) are queued in memory and flushed
+as one PostgREST array insert per table — after the response is written,
+or inline once a size/age threshold is hit. Failed flushes and rows over
+the memory cap are spilled to a JSONL file and replayed on the next flush
+by the same instance (on Vercel /tmp does not outlive it); batches
+PostgREST rejects outright go to a .rejected file. RPC calls deferred in Supabase degraded
+mode (enqueue_rpc) ride the same spill file, replayed one call at a time.
+No external dependencies.
+"""
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import urlencode
+
+from . import deadline, http_pool
+
+
+# ===== CONFIG =====
+WRITE_BEHIND_ENABLED = os.environ.get("WRITE_BEHIND_ENABLED", "") in ("1", "true", "yes")
+WRITE_BEHIND_MAX_BATCH = int(os.environ.get("WRITE_BEHIND_MAX_BATCH", "50"))
+WRITE_BEHIND_MAX_AGE_SECONDS = float(os.environ.get("WRITE_BEHIND_MAX_AGE_SECONDS", "5"))
+WRITE_BEHIND_MAX_ROWS = int(os.environ.get("WRITE_BEHIND_MAX_ROWS", "1000"))
+WRITE_BEHIND_SPILL_PATH = os.environ.get("WRITE_BEHIND_SPILL_PATH", "/tmp/postir_write_behind.jsonl")
+WRITE_BEHIND_RETRIES = 3
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_spill_lock = threading.Lock()      # serializes appends to the spill file with taking it
+_pending = []           # [(table, row), ...] in arrival order
+_oldest_at = [0.0]
+
+RPC_PREFIX = "rpc/"
+
+
+def enabled():
+    return WRITE_BEHIND_ENABLED
+
+
+def enqueue(table, row):
+    """
+    Queue a row for a later bulk insert. Returns False when write-behind is
+    disabled so the caller writes synchronously as before.
+    """
+    if not WRITE_BEHIND_ENABLED:
+        return False
+    overflow = []
+    with _lock:
+        if not _pending:
+            _oldest_at[0] = time.monotonic()
+        _pending.append((table, row))
+        if len(_pending) > WRITE_BEHIND_MAX_ROWS:
+            cut = len(_pending) - WRITE_BEHIND_MAX_ROWS
+            overflow = _pending[:cut]
+            del _pending[:cut]
+        due = (len(_pending) >= WRITE_BEHIND_MAX_BATCH
+               or time.monotonic() - _oldest_at[0] >= WRITE_BEHIND_MAX_AGE_SECONDS)
+    if overflow:
+        _spill(overflow)
+    if due:
+        flush()
+    return True
+
+
+def enqueue_rpc(function, params):
+    """
+    Defer an RPC call (e.g. a token debit made while Supabase is down) for
+    reconciliation. Always queues, whether or not write-behind is enabled,
+    and goes straight to the spill file so the instance keeps it across
+    invocations. Best effort only: the spill file lives on local disk
+    (/tmp on Vercel) and is lost with the instance if it is recycled
+    before a replay gets through.
+    """
+    item = (RPC_PREFIX + function, params)
+    if not _spill([item]):
+        with _lock:
+            _pending.append(item)
+    return True
+
+
+def after_response():
+    """Flush everything queued; call once the response has been written."""
+    if (WRITE_BEHIND_ENABLED or pending_count() or os.path.exists(WRITE_BEHIND_SPILL_PATH)
+            or os.path.exists(WRITE_BEHIND_SPILL_PATH + ".taking")):
+        flush()
+
+
+def pending_count():
+    with _lock:
+        return len(_pending)
+
+
+# ══════════════════════════════════════════════════════════════════════
+#  Flush / spill
+# ══════════════════════════════════════════════════════════════════════
+
+def _spill(items, path=None):
+    lines = "".join(json.dumps({"table": table, "row": row}, ensure_ascii=False) + "\n" for table, row in items)
+    try:
+        with _spill_lock, open(path or WRITE_BEHIND_SPILL_PATH, "a", encoding="utf-8") as f:
+            f.write(lines)
+        return True
+    except OSError:
+        return False
+
+
+def _take_spilled():
+    # The file is moved to a private name under the append lock, so later
+    # appends start a fresh file and none can land between read and delete.
+    # A leftover private file (a flush that died mid-way) is taken first;
+    # the live file then waits for the next flush.
+    taking = WRITE_BEHIND_SPILL_PATH + ".taking"
+    with _spill_lock:
+        try:
+            if not os.path.exists(taking):
+                os.replace(WRITE_BEHIND_SPILL_PATH, taking)
+        except OSError:
+            return []
+    try:
+        with open(taking, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        os.remove(taking)
+    except OSError:
+        return []
+    items = []
+    for line in lines:
+        try:
+            entry = json.loads(line)
+            items.append((entry["table"], entry["row"]))
+        except (ValueError, KeyError, TypeError):
+            continue
+    return items
+
+
+def _bulk_insert(table, rows):
+    sb_url = os.environ.get("SUPABASE_URL", "").rstrip("/")
+    sk = os.environ.get("SUPABASE_SERVICE_KEY", "")
+    if not sb_url:
+        return False
+    headers = {
+        "Content-Type": "application/json", "Accept": "application/json",
+        "apikey": sk, "Authorization": f"Bearer {sk}",
+        "Prefer": "return=minimal,missing=default",
+    }
+    # Rows may carry different optional keys; ?columns= plus missing=default
+    # lets PostgREST fill the gaps with column defaults in one array insert.
+    columns = sorted({key for row in rows for key in row})
+    url = f"{sb_url}/rest/v1/{table}?" + urlencode({"columns": ",".join(columns)})
+    body = json.dumps(rows, ensure_ascii=False).encode("utf-8")
+    for attempt in range(WRITE_BEHIND_RETRIES):
+        try:
+            status, _, _, _ = http_pool.request("POST", url, body=body, headers=headers, timeout=deadline.timeout(10))
+        except deadline.DeadlineExceeded:
+            return "retry"
+        except Exception:
+            status = 0
+        if 200 <= status < 300:
+            return "ok"
+        if 400 <= status < 500 and status not in (408, 429):
+            # The batch itself is bad; retrying will not help.
+            return "rejected"
+        time.sleep(min(2.0, 0.1 * (2 ** attempt)) * random.uniform(0.5, 1.5))
+    return "retry"
+
+
+def _call_rpc(function, params):
+    sb_url = os.environ.get("SUPABASE_URL", "").rstrip("/")
+    sk = os.environ.get("SUPABASE_SERVICE_KEY", "")
+    if not sb_url:
+        return "retry"
+    headers = {
+        "Content-Type": "application/json", "Accept": "application/json",
+        "apikey": sk, "Authorization": f"Bearer {sk}",
+    }
+    body = json.dumps(params, ensure_ascii=False).encode("utf-8")
+    try:
+        status, _, _, raw = http_pool.request(
+            "POST", f"{sb_url}/rest/v1/rpc/{function}", body=body, headers=headers, timeout=deadline.timeout(10))
+    except Exception:
+        return "retry"
+    if 200 <= status < 300:
+        try:
+            result = json.loads(raw) if raw.strip() else {}
+        except ValueError:
+            result = {}
+        # The call ran but the function refused it (e.g. insufficient tokens).
+        if isinstance(result, dict) and result.get("ok") is False:
+            return "rejected"
+        return "ok"
+    if 400 <= status < 500 and status not in (408, 429):
+        return "rejected"
+    return "retry"
+
+
+def flush():
+    """Send queued and spilled rows. Returns the number of rows written."""
+    from . import breaker
+
+    # Replaying into an open circuit only burns the spill file's retries.
+    if breaker.get("supabase").is_open():
+        return 0
+    if not _flush_lock.acquire(blocking=False):
+        return 0
+    try:
+        with _lock:
+            items = list(_pending)
+            del _pending[:]
+        items = _take_spilled() + items
+        if not items:
+            return 0
+
+        by_table = {}
+        for table, row in items:
+            by_table.setdefault(table, []).append(row)
+
+        written = 0
+        failed = []
+        for table in [t for t in by_table if t.startswith(RPC_PREFIX)]:
+            function = table[len(RPC_PREFIX):]
+            for params in by_table.pop(table):
+                outcome = _call_rpc(function, params)
+                if outcome == "ok":
+                    written += 1
+                elif outcome == "rejected":
+                    _spill([(table, params)], WRITE_BEHIND_SPILL_PATH + ".rejected")
+                else:
+                    failed.append((table, params))
+
+        for table, rows in by_table.items():
+            for i in range(0, len(rows), WRITE_BEHIND_MAX_BATCH):
+                batch = rows[i:i + WRITE_BEHIND_MAX_BATCH]
+                outcome = _bulk_insert(table, batch)
+                if outcome == "ok":
+                    written += len(batch)
+                elif outcome == "rejected":
+                    # Park poison batches aside so they are not replayed forever.
+                    _spill([(table, row) for row in batch], WRITE_BEHIND_SPILL_PATH + ".rejected")
+                else:
+                    failed.extend((table, row) for row in batch)
+
+        if failed and not _spill(failed):
+            with _lock:
+                room = max(0, WRITE_BEHIND_MAX_ROWS - len(_pending))
+                _pending[:0] = failed[:room]
+        return written
+    finally:
+        _flush_lock.release()
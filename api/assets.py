@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Generated Asset Endpoint
+GET/HEAD /api/assets/{sha256}.{ext} serves an image from the
+content-addressed store (_core.asset_store) as raw bytes. A key names
+immutable content, so responses are cacheable for a year at the browser
+and the edge, carry the content hash as a strong ETag and answer
+If-None-Match with 304 and single bytes Ranges with 206. No bearer token:
+the 256-bit key is the capability, which lets <img src> use the URL.
+Vercel serverless function. Shared helpers live in api/_core.
+"""
+import os
+import sys
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _core import asset_store  # noqa: E402
+from _core.handler import JSONHandler  # noqa: E402
+
+
+IMMUTABLE_CACHE = "public, max-age=31536000, s-maxage=31536000, immutable"
+
+
+class handler(JSONHandler):
+
+    allowed_methods = "GET, HEAD, OPTIONS"
+    allowed_headers = "Content-Type, Authorization, Range, If-Range, If-None-Match"
+    exposed_headers = "ETag, Accept-Ranges, Content-Range, Content-Length"
+
+    def do_GET(self):
+        key = urlparse(self.path).path.replace("/api/assets", "").strip("/")
+        if not asset_store.is_key(key):
+            self._send_json(404, {"error": "Not found"})
+            return
+        try:
+            data = asset_store.get(key)
+        except asset_store.StoreUnavailable:
+            self._send_json(503, {"error": "Asset store unavailable. Please retry."}, headers={"Retry-After": "2"})
+            return
+        if data is None:
+            self._send_json(404, {"error": "Not found"})
+            return
+        self._send_asset(data, asset_store.mime_for(key), asset_store.etag_for(key),
+                         headers={"Cache-Control": IMMUTABLE_CACHE})
+
+    def do_HEAD(self):
+        self.do_GET()
@@ -3,93 +3,25 @@
 Postir V2 — Authentication endpoints
 Handles user signup, login, logout, token refresh, and profile retrieval.
 Vercel serverless function (BaseHTTPRequestHandler format).
-No external dependencies — stdlib only. Supabase helpers inlined.
+No external dependencies — stdlib only. Shared helpers live in api/_core.
 """
-import json
 import os
-import urllib.request
-import urllib.error
-from http.server import BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs, urlencode
+import sys
+from urllib.parse import urlparse
 
-
-# ══════════════════════════════════════════════════════════════════════
-#  Inlined Supabase helpers (avoid cross-module import on Vercel)
-# ══════════════════════════════════════════════════════════════════════
-
-def _sb_config():
-    url = os.environ.get("SUPABASE_URL", "").rstrip("/")
-    sk = os.environ.get("SUPABASE_SERVICE_KEY", "")
-    ak = os.environ.get("SUPABASE_ANON_KEY", "")
-    return url, sk, ak
-
-
-def _sb_request(method, path, data=None, token=None, use_service_key=False, params=None):
-    sb_url, sk, ak = _sb_config()
-    if not sb_url:
-        raise ValueError("SUPABASE_URL not configured")
-    full_url = f"{sb_url}{path}"
-    if params:
-        full_url += "?" + urlencode(params)
-    headers = {"Content-Type": "application/json", "apikey": ak, "Accept": "application/json"}
-    if use_service_key and sk:
-        headers["Authorization"] = f"Bearer {sk}"
-        headers["apikey"] = sk
-    elif token:
-        headers["Authorization"] = f"Bearer {token}"
-    body = json.dumps(data).encode("utf-8") if data is not None else None
-    req = urllib.request.Request(full_url, data=body, headers=headers, method=method)
-    try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            raw = resp.read().decode("utf-8")
-            return json.loads(raw) if raw.strip() else {}
-    except urllib.error.HTTPError as e:
-        raw = e.read().decode("utf-8") if e.fp else ""
-        try:
-            return {"_error": True, "_status": e.code, "_body": json.loads(raw)}
-        except Exception:
-            return {"_error": True, "_status": e.code, "_body": raw}
-
-
-def _verify_token(token):
-    if not token:
-        return None
-    resp = _sb_request("GET", "/auth/v1/user", token=token)
-    if resp and not resp.get("_error") and resp.get("id"):
-        return resp
-    return None
-
-
-def _get_user_profile(user_id):
-    resp = _sb_request("GET", "/rest/v1/profiles", use_service_key=True,
-                       params={"id": f"eq.{user_id}", "limit": "1"})
-    if isinstance(resp, list) and len(resp) > 0:
-        return resp[0]
-    if isinstance(resp, dict) and not resp.get("_error"):
-        return resp
-    return None
-
-
-def _create_profile(user_id, email):
-    data = {"id": user_id, "email": email, "plan": "free", "tokens_total": 3, "tokens_used": 0}
-    resp = _sb_request("POST", "/rest/v1/profiles", data=data, use_service_key=True)
-    return not (resp and resp.get("_error"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _core import profile_cache, supabase  # noqa: E402
+from _core.handler import JSONHandler  # noqa: E402
 
 
 # ══════════════════════════════════════════════════════════════════════
 #  Handler
 # ══════════════════════════════════════════════════════════════════════
 
-class handler(BaseHTTPRequestHandler):
-
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.end_headers()
+class handler(JSONHandler):
 
     def do_GET(self):
+        profile_cache.begin_request()
         parsed = urlparse(self.path)
         sub = parsed.path.replace("/api/auth", "").strip("/")
         if sub == "me":
@@ -98,12 +30,11 @@ class handler(BaseHTTPRequestHandler):
             self._send_json(404, {"error": "Not found"})
 
     def do_POST(self):
+        profile_cache.begin_request()
         parsed = urlparse(self.path)
         sub = parsed.path.replace("/api/auth", "").strip("/")
         try:
-            content_length = int(self.headers.get('Content-Length', 0))
-            body_raw = self.rfile.read(content_length) if content_length > 0 else b'{}'
-            body = json.loads(body_raw)
+            body = self._read_json_body()
         except Exception as e:
             self._send_json(400, {"error": f"Invalid JSON: {str(e)}"})
             return
@@ -131,7 +62,7 @@ class handler(BaseHTTPRequestHandler):
             self._send_json(400, {"error": "Password must be at least 6 characters"})
             return
 
-        resp = _sb_request("POST", "/auth/v1/signup", data={"email": email, "password": password})
+        resp = supabase.supabase_request("POST", "/auth/v1/signup", data={"email": email, "password": password})
         if resp and resp.get("_error"):
             status = resp.get("_status", 400)
             err_body = resp.get("_body", {})
@@ -147,7 +78,7 @@ class handler(BaseHTTPRequestHandler):
         user_email = user.get("email") if isinstance(user, dict) else email
 
         if user_id:
-            _create_profile(user_id, user_email)
+            supabase.create_profile(user_id, user_email)
 
         self._send_json(200, {
             "access_token": access_token,
@@ -163,8 +94,8 @@ class handler(BaseHTTPRequestHandler):
             self._send_json(400, {"error": "email and password are required"})
             return
 
-        resp = _sb_request("POST", "/auth/v1/token", data={"email": email, "password": password},
-                           params={"grant_type": "password"})
+        resp = supabase.supabase_request("POST", "/auth/v1/token", data={"email": email, "password": password},
+                                         params={"grant_type": "password"})
         if resp and resp.get("_error"):
             status = resp.get("_status", 401)
             err_body = resp.get("_body", {})
@@ -183,15 +114,15 @@ class handler(BaseHTTPRequestHandler):
         if not token:
             self._send_json(401, {"error": "Authorization header required"})
             return
-        user = _verify_token(token)
+        user = supabase.verify_token(token)
         if not user:
             self._send_json(401, {"error": "Invalid or expired token"})
             return
 
         user_id = user.get("id")
-        profile = _get_user_profile(user_id)
+        profile = supabase.get_user_profile(user_id)
         if not profile:
-            _create_profile(user_id, user.get("email", ""))
+            supabase.create_profile(user_id, user.get("email", ""))
             profile = {"id": user_id, "email": user.get("email", ""), "plan": "free",
                        "tokens_total": 3, "tokens_used": 0}
 
@@ -212,7 +143,9 @@ class handler(BaseHTTPRequestHandler):
         if not token:
             self._send_json(400, {"error": "Authorization header required"})
             return
-        _sb_request("POST", "/auth/v1/logout", token=token)
+        supabase.supabase_request("POST", "/auth/v1/logout", token=token)
+        from _core import jwt_auth
+        jwt_auth.forget(token)
         self._send_json(200, {"message": "Logged out successfully"})
 
     def _handle_refresh(self, body):
@@ -221,9 +154,9 @@ class handler(BaseHTTPRequestHandler):
             self._send_json(400, {"error": "refresh_token is required"})
             return
 
-        resp = _sb_request("POST", "/auth/v1/token",
-                           data={"refresh_token": refresh_token},
-                           params={"grant_type": "refresh_token"})
+        resp = supabase.supabase_request("POST", "/auth/v1/token",
+                                         data={"refresh_token": refresh_token},
+                                         params={"grant_type": "refresh_token"})
         if resp and resp.get("_error"):
             self._send_json(resp.get("_status", 401), {"error": "Token refresh failed. Please log in again."})
             return
@@ -233,21 +166,3 @@ class handler(BaseHTTPRequestHandler):
             "refresh_token": resp.get("refresh_token"),
             "user": {"id": resp.get("user", {}).get("id"), "email": resp.get("user", {}).get("email")},
         })
-
-    # ─────────────────────────── Helpers ─────────────────────────────
-
-    def _get_bearer_token(self):
-        auth = self.headers.get("Authorization", "")
-        if auth.startswith("Bearer "):
-            return auth[7:].strip()
-        return None
-
-    def _send_json(self, status_code, data):
-        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
-        self.send_response(status_code)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.send_header('Content-Length', str(len(body)))
-        self.end_headers()
-        self.wfile.write(body)
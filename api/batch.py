@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Bulk multi-brand generation (agency accounts)
+POST {"brands": [spec, ...]} where each spec takes the /api/generate body
+fields. Authenticates and reserves the tokens for every brand once,
+generates the calendars with bounded concurrency, and streams one
+"brand" event per brand as it finishes (NDJSON, or SSE with
+Accept: text/event-stream), then "done". A failed brand is reported in
+its own event and its token refunded; brands that cannot start (or
+finish) before the request deadline are reported as "skipped" and
+refunded too. The debit and the generations log rows are written in one
+settlement call at the end.
+Vercel serverless function. Shared helpers live in api/_core.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _core import (  # noqa: E402
+    deadline, gen_cache, hashtag_index, near_dup, post_gen, profile_cache, supabase, workers, write_behind,
+)
+from _core.handler import JSONHandler  # noqa: E402
+
+
+# ===== CONFIG =====
+BATCH_MAX_BRANDS = int(os.environ.get("BATCH_MAX_BRANDS", "20"))
+BATCH_MAX_PARALLEL = int(os.environ.get("BATCH_MAX_PARALLEL", "4"))
+BATCH_MIN_BRAND_SECONDS = float(os.environ.get("BATCH_MIN_BRAND_SECONDS", "15"))   # left to start a brand
+TOKENS_PER_BRAND = 1
+
+
+class handler(JSONHandler):
+
+    allowed_methods = "POST, OPTIONS"
+
+    def do_POST(self):
+        profile_cache.begin_request()
+        token = self._get_bearer_token()
+        if not token:
+            self._send_json(401, {"error": "Authentication required. Please log in."})
+            return
+
+        # Profile read overlaps token verification; see verify_and_check_tokens.
+        user, _, profile = supabase.verify_and_check_tokens(token)
+        if not user:
+            self._send_json(401, {"error": "Invalid or expired token. Please log in again."})
+            return
+        user_id = user["id"]
+        tier = (profile or {}).get("plan", "free")
+
+        try:
+            body = self._read_json_body()
+            brands = body.get("brands")
+            if not isinstance(brands, list) or not brands:
+                raise ValueError("brands must be a non-empty list")
+        except Exception as e:
+            self._send_json(400, {"error": f"Invalid request: {str(e)}"})
+            return
+        if len(brands) > BATCH_MAX_BRANDS:
+            self._send_json(400, {"error": f"At most {BATCH_MAX_BRANDS} brands per batch."})
+            return
+
+        # Invalid specs are reported per item and not charged for.
+        jobs, rejected = [], []
+        for index, spec in enumerate(brands):
+            try:
+                if not isinstance(spec, dict):
+                    raise ValueError("brand spec must be an object")
+                jobs.append((index, post_gen.parse_spec(spec)))
+            except (TypeError, ValueError) as e:
+                rejected.append((index, spec, str(e)))
+        required = len(jobs) * TOKENS_PER_BRAND
+        has_tokens, profile = supabase.check_tokens(user_id, required=max(required, 1))
+
+        reservation = None
+        if required:
+            reservation = supabase.reserve_tokens(user_id, required) if has_tokens else {"ok": False}
+            if reservation is None:
+                self._send_json(503, {"error": "Token service unavailable. Please try again shortly."})
+                return
+            if not reservation.get("ok"):
+                self._send_json(402, {
+                    "error": f"This batch needs {required} tokens. Upgrade your plan to continue.",
+                    "plan": reservation.get("plan", (profile or {}).get("plan", "free")),
+                    "tokens_used": reservation.get("tokens_used", (profile or {}).get("tokens_used", 0)),
+                    "tokens_total": reservation.get("tokens_total", (profile or {}).get("tokens_total", 0)),
+                    "tokens_required": required,
+                    "upgrade_required": True,
+                })
+                return
+
+        self._start_stream()
+        settled_items, skipped = [], []
+        disconnected = False
+        try:
+            for index, spec, error in rejected:
+                name = spec.get("business_name") if isinstance(spec, dict) else None
+                self._send_event("brand", {"index": index, "business_name": name, "status": "error", "error": error})
+            disconnected = not self._stream_brands(user_id, jobs, tier, settled_items, skipped)
+        except (BrokenPipeError, ConnectionResetError):
+            disconnected = True
+
+        settlement = supabase.settle_reservation(user_id, required, settled_items) if required else None
+        if not disconnected:
+            if settlement:
+                tokens_remaining = settlement["tokens_remaining"]
+            elif reservation:
+                tokens_remaining = reservation["tokens_remaining"] + required - len(settled_items) * TOKENS_PER_BRAND
+            else:
+                tokens_remaining = max(0, (profile or {}).get("tokens_total", 3) - (profile or {}).get("tokens_used", 0))
+            try:
+                self._send_event("done", {
+                    "succeeded": len(settled_items),
+                    "skipped": len(skipped),
+                    "failed": len(brands) - len(settled_items) - len(skipped),
+                    "tokens_remaining": tokens_remaining,
+                })
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        write_behind.after_response()
+
+    def _stream_brands(self, user_id, jobs, tier, settled_items, skipped):
+        """
+        Generate every job on the "batch" pool and send each result as it
+        completes. Delivered successes are appended to settled_items, the
+        indexes of brands skipped for the deadline to skipped. Returns
+        False if the client went away (pending brands are dropped and only
+        what was delivered gets charged).
+        """
+        from concurrent.futures import TimeoutError as FuturesTimeout, as_completed
+
+        near_dup.prefetch(user_id)
+        pool = workers.get_pool("batch", max_workers=BATCH_MAX_PARALLEL)
+        futures = {pool.submit(_generate_brand, user_id, gen_args, tier): (index, gen_args) for index, gen_args in jobs}
+        pending = set(futures)
+        # Wait no longer than the deadline allows, keeping the tail reserve
+        # for the settlement and the "done" event.
+        left = deadline.remaining()
+        timeout = None if left == float("inf") else max(0.0, left - deadline.DEADLINE_TAIL_RESERVE_SECONDS)
+        try:
+            try:
+                for future in as_completed(futures, timeout=timeout):
+                    pending.discard(future)
+                    index, gen_args = futures[future]
+                    event = {"index": index, "business_name": gen_args[0]}
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        event.update(status="error", error=str(e))
+                        self._send_event("brand", event)
+                        continue
+                    if result is None:
+                        pending.add(future)
+                        continue
+                    posts, used_mode, debug_err, regenerated, sketches = result
+                    event.update(status="ok", mode=used_mode, debug_error=debug_err, regenerated_days=regenerated,
+                                 posts=posts)
+                    self._send_event("brand", event)
+                    near_dup.record(user_id, sketches)
+                    settled_items.append(_log_item(gen_args, posts if used_mode == "ai" else None))
+            except FuturesTimeout:
+                pass
+            # Out of time: queued brands are cancelled and running ones
+            # abandoned rather than delivered late as templates; none is charged.
+            for future in sorted(pending, key=lambda f: futures[f][0]):
+                future.cancel()
+                index, gen_args = futures[future]
+                skipped.append(index)
+                self._send_event("brand", {
+                    "index": index, "business_name": gen_args[0], "status": "skipped",
+                    "error": "Not generated before the request deadline; not charged.",
+                })
+        except (BrokenPipeError, ConnectionResetError):
+            for future in futures:
+                future.cancel()
+            return False
+        return True
+
+
+def _generate_brand(user_id, gen_args, tier):
+    """
+    (posts, mode, debug_error, regenerated days, near-dup sketches), or
+    None when too little of the deadline is left to generate the brand.
+    """
+    key = post_gen.cache_key(gen_args)
+    cached = gen_cache.get(key)
+    if cached is not None:
+        posts, used_mode, debug_err = cached, "cache", None
+    elif deadline.near(BATCH_MIN_BRAND_SECONDS):
+        return None
+    else:
+        posts, used_mode, debug_err = post_gen.generate_calendar(gen_args, tier=tier)
+    regenerated, sketches = [], None
+    if used_mode == "ai":
+        posts, regenerated, sketches = post_gen.dedupe(user_id, gen_args, posts, tier=tier)
+        gen_cache.put(key, posts)
+    return posts, used_mode, debug_err, regenerated, sketches
+
+
+def _log_item(gen_args, ai_posts=None):
+    """One generations row for settle_token_reservation, as /api/generate logs it."""
+    business_name, business_type, _, platforms, _, _, num_posts = gen_args
+    item = {
+        "type": "text",
+        "platform": platforms[0] if platforms else "instagram",
+        "prompt_summary": f"{business_name} | {business_type} | {num_posts} posts",
+        "tokens_consumed": TOKENS_PER_BRAND,
+    }
+    hashtags = hashtag_index.summarize(business_type, ai_posts) if ai_posts else None
+    if hashtags:
+        item["hashtags"] = hashtags
+    return item
@@ -2,131 +2,32 @@
 """
 Postir V2 — AI Social Media Content Generator Backend
 Uses Google Gemini API to generate social media posts.
-Falls back to templates if API fails.
-Vercel serverless function. Supabase helpers inlined.
+Falls back to templates if API fails. With "stream": true (or
+Accept: text/event-stream) posts are sent one by one as NDJSON / SSE
+events as soon as Gemini finishes each of them. Identical requests are
+served from _core.gen_cache unless the body sets "fresh": true. With
+"async": true the reply is 202 and a job id; poll /api/jobs/{id}.
+Vercel serverless function. Shared helpers live in api/_core.
 """
-import json
 import os
-import random
-import urllib.request
-import urllib.error
-import hashlib
-import time
-from http.server import BaseHTTPRequestHandler
-from urllib.parse import urlencode
+import sys
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _core import (  # noqa: E402
+    deadline, gen_cache, hashtag_index, near_dup, post_gen, profile_cache, supabase, write_behind,
+)
+from _core.handler import JSONHandler  # noqa: E402
 
-# ══════════════════════════════════════════════════════════════════════
-#  Inlined Supabase helpers
-# ══════════════════════════════════════════════════════════════════════
 
-def _sb_config():
-    url = os.environ.get("SUPABASE_URL", "").rstrip("/")
-    sk = os.environ.get("SUPABASE_SERVICE_KEY", "")
-    ak = os.environ.get("SUPABASE_ANON_KEY", "")
-    return url, sk, ak
-
-
-def _sb_request(method, path, data=None, token=None, use_service_key=False, params=None):
-    sb_url, sk, ak = _sb_config()
-    if not sb_url:
-        raise ValueError("SUPABASE_URL not configured")
-    full_url = f"{sb_url}{path}"
-    if params:
-        full_url += "?" + urlencode(params)
-    headers = {"Content-Type": "application/json", "apikey": ak, "Accept": "application/json"}
-    if use_service_key and sk:
-        headers["Authorization"] = f"Bearer {sk}"
-        headers["apikey"] = sk
-    elif token:
-        headers["Authorization"] = f"Bearer {token}"
-    body = json.dumps(data).encode("utf-8") if data is not None else None
-    req = urllib.request.Request(full_url, data=body, headers=headers, method=method)
-    try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            raw = resp.read().decode("utf-8")
-            return json.loads(raw) if raw.strip() else {}
-    except urllib.error.HTTPError as e:
-        raw = e.read().decode("utf-8") if e.fp else ""
-        try:
-            return {"_error": True, "_status": e.code, "_body": json.loads(raw)}
-        except Exception:
-            return {"_error": True, "_status": e.code, "_body": raw}
-
-
-def _verify_token(token):
-    if not token:
-        return None
-    resp = _sb_request("GET", "/auth/v1/user", token=token)
-    if resp and not resp.get("_error") and resp.get("id"):
-        return resp
-    return None
-
-
-def _get_user_profile(user_id):
-    resp = _sb_request("GET", "/rest/v1/profiles", use_service_key=True,
-                       params={"id": f"eq.{user_id}", "limit": "1"})
-    if isinstance(resp, list) and len(resp) > 0:
-        return resp[0]
-    if isinstance(resp, dict) and not resp.get("_error"):
-        return resp
-    return None
-
-
-def _check_tokens(user_id, required=1):
-    profile = _get_user_profile(user_id)
-    if not profile:
-        return False, None
-    plan = profile.get("plan", "free")
-    if plan == "pro":
-        return True, profile
-    if (profile.get("tokens_total", 0) - profile.get("tokens_used", 0)) >= required:
-        return True, profile
-    return False, profile
-
-
-def _update_user_tokens(user_id, increment):
-    profile = _get_user_profile(user_id)
-    if not profile:
-        return False
-    new_used = profile.get("tokens_used", 0) + increment
-    resp = _sb_request("PATCH", "/rest/v1/profiles",
-                       data={"tokens_used": new_used, "updated_at": "now()"},
-                       use_service_key=True, params={"id": f"eq.{user_id}"})
-    return not (resp and resp.get("_error"))
-
-
-def _log_generation(user_id, gen_type, platform=None, prompt_summary=None, tokens_consumed=1):
-    data = {"user_id": user_id, "type": gen_type, "tokens_consumed": tokens_consumed}
-    if platform:
-        data["platform"] = platform
-    if prompt_summary:
-        data["prompt_summary"] = prompt_summary
-    resp = _sb_request("POST", "/rest/v1/generations", data=data, use_service_key=True)
-    return not (resp and resp.get("_error"))
-
-
-# ===== CONFIG =====
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
-GEMINI_MODEL = "gemini-2.0-flash"
-GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
-
-
-class handler(BaseHTTPRequestHandler):
-
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.end_headers()
+class handler(JSONHandler):
 
     def do_GET(self):
+        profile_cache.begin_request()
         token = self._get_bearer_token()
         if token:
-            user = _verify_token(token)
+            user = supabase.verify_token(token)
             if user:
-                profile = _get_user_profile(user["id"]) or {}
+                profile = supabase.get_user_profile(user["id"]) or {}
                 result = {
                     "tokens_remaining": max(0, profile.get("tokens_total", 3) - profile.get("tokens_used", 0)),
                     "plan": profile.get("plan", "free"),
@@ -136,35 +37,37 @@ class handler(BaseHTTPRequestHandler):
         self._send_json(200, {"total_generations": 0, "today": 0})
 
     def do_POST(self):
+        profile_cache.begin_request()
         token = self._get_bearer_token()
         if not token:
             self._send_json(401, {"error": "Authentication required. Please log in."})
             return
-        user = _verify_token(token)
+        # Profile read overlaps token verification; see verify_and_check_tokens.
+        user, has_tokens, profile = supabase.verify_and_check_tokens(token, required=1)
         if not user:
             self._send_json(401, {"error": "Invalid or expired token. Please log in again."})
             return
 
         user_id = user["id"]
+        # Plan tier for model routing (see _core.model_router policy).
+        self._tier = (profile or {}).get("plan", "free")
 
         try:
-            content_length = int(self.headers.get('Content-Length', 0))
-            body_raw = self.rfile.read(content_length) if content_length > 0 else b'{}'
-            body = json.loads(body_raw)
+            body = self._read_json_body()
         except Exception as e:
             self._send_json(400, {"error": f"Invalid request: {str(e)}"})
             return
 
-        business_name = body.get("business_name", "").strip() or "My Business"
-        business_type = body.get("business_type", "general")
-        target_audience = body.get("target_audience", "").strip()
-        platforms = body.get("platforms", ["instagram"])
-        tone = body.get("tone", "friendly")
-        language = body.get("language", "both")
-        num_posts = min(max(int(body.get("num_posts", 7)), 1), 30)
+        try:
+            gen_args = post_gen.parse_spec(body)
+        except (TypeError, ValueError) as e:
+            self._send_json(400, {"error": f"Invalid request: {str(e)}"})
+            return
+        business_name, _, _, platforms, _, language, _ = gen_args
         mode = body.get("mode", "ai")
+        stream = bool(body.get("stream")) or self._wants_event_stream()
+        force_fresh = bool(body.get("fresh"))
 
-        has_tokens, profile = _check_tokens(user_id, required=1)
         if not has_tokens:
             plan = profile.get("plan", "free") if profile else "free"
             self._send_json(402, {
@@ -177,178 +80,213 @@ class handler(BaseHTTPRequestHandler):
             return
 
         if mode == "demo":
-            posts = get_demo_posts(business_name, language, platforms)
+            posts = post_gen.get_demo_posts(business_name, language, platforms)
             self._send_json(200, {"posts": posts, "mode": "demo"})
             return
 
-        used_mode = "ai"
-        debug_err = None
-        posts = []
-        try:
-            posts = generate_with_gemini(
-                business_name, business_type, target_audience,
-                platforms, tone, language, num_posts
-            )
-        except Exception as exc:
-            posts = generate_with_templates(
-                business_name, business_type, platforms, tone, language, num_posts
-            )
-            used_mode = "template"
-            debug_err = str(exc)
+        if body.get("async"):
+            self._run_async("generate", user_id, body)
+            return
 
-        _update_user_tokens(user_id, 1)
-        platform_str = platforms[0] if platforms else "instagram"
-        prompt_summary = f"{business_name} | {business_type} | {num_posts} posts"
-        _log_generation(user_id, "text", platform_str, prompt_summary, tokens_consumed=1)
+        cache_key = post_gen.cache_key(gen_args)
+        cached = None if force_fresh else gen_cache.get(cache_key)
+        # The user's past-post sketches load while the calendar is generated.
+        near_dup.prefetch(user_id)
+        if stream:
+            self._stream_posts(user_id, profile, gen_args, cache_key, cached)
+            return
+
+        if cached is not None:
+            posts, used_mode, debug_err = cached, "cache", None
+        else:
+            posts, used_mode, debug_err = post_gen.generate_calendar(gen_args, tier=self._tier)
+        regenerated, sketches = [], None
+        # Cached calendars are shared across users, so they are checked
+        # against this user's history too.
+        if used_mode in ("ai", "cache"):
+            posts, regenerated, sketches = post_gen.dedupe(user_id, gen_args, posts, tier=self._tier)
+
+        tokens_remaining, refusal = self._debit(user_id, gen_args, posts if used_mode == "ai" else None)
+        if refusal:
+            self._send_json(refusal.pop("status"), refusal)
+            return
 
         self._send_json(200, {
             "posts": posts, "mode": used_mode, "debug_error": debug_err,
-            "tokens_remaining": max(0, (profile.get("tokens_total", 3) - profile.get("tokens_used", 0)) - 1),
+            "regenerated_days": regenerated, "tokens_remaining": tokens_remaining,
         })
-
-    def _get_bearer_token(self):
-        auth = self.headers.get("Authorization", "")
-        if auth.startswith("Bearer "):
-            return auth[7:].strip()
-        return None
-
-    def _send_json(self, status_code, data):
-        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
-        self.send_response(status_code)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.send_header('Content-Length', str(len(body)))
-        self.end_headers()
-        self.wfile.write(body)
-
-
-# ══════════════════════════════════════════════════════════════════════
-#  Gemini generation
-# ══════════════════════════════════════════════════════════════════════
-
-def generate_with_gemini(name, btype, audience, platforms, tone, language, num_posts):
-    tone_map = {
-        "professional": ("احترافي ومصقول", "professional and polished"),
-        "friendly": ("ودّي وقريب", "warm and approachable"),
-        "formal": ("رسمي", "formal and corporate"),
-        "inspirational": ("ملهم وتحفيزي", "inspirational and motivational"),
-        "playful": ("مرح وخفيف", "fun and lighthearted")
+        if used_mode == "ai":
+            gen_cache.put(cache_key, posts)
+        near_dup.record(user_id, sketches)
+        write_behind.after_response()
+
+    def _run_job(self, user_id, body):
+        """The async form of do_POST; the job records each streamed post as it lands."""
+        profile = supabase.get_user_profile(user_id) or {}
+        self._tier = profile.get("plan", "free")
+        gen_args = post_gen.parse_spec(body)
+        cache_key = post_gen.cache_key(gen_args)
+        cached = None if body.get("fresh") else gen_cache.get(cache_key)
+        near_dup.prefetch(user_id)
+        self._stream_posts(user_id, profile, gen_args, cache_key, cached)
+
+    def _stream_posts(self, user_id, profile, gen_args, cache_key, cached):
+        """
+        Stream events: one "post" per post as it completes, then "done"
+        (mode, tokens_remaining). If Gemini fails or stops short, the
+        missing days are filled from templates. Large calendars stream
+        chunk by chunk as each concurrent chunk finishes. Days regenerated
+        as near-duplicates are sent again with "replaced". The token is
+        reserved before the first post and settled at the end, so a client
+        that leaves once posts reached it is billed and one refused a
+        reservation gets its 402 before any content.
+        """
+        num_posts = gen_args[-1]
+        reservation = supabase.reserve_tokens(user_id, 1)
+        if reservation is None:
+            self._send_json(503, {"error": "Token service unavailable. Please try again shortly."})
+            return
+        if not reservation.get("ok"):
+            self._send_json(402, _refusal(reservation))
+            return
+        self._start_stream()
+        self._streamed_posts = []
+        self._posts_sent = 0
+        settled = False
+        try:
+            if cached is not None:
+                for index, post in enumerate(cached):
+                    self._streamed_posts.append(post)
+                    self._send_post({"post": post, "index": index, "total": num_posts})
+                used_mode, debug_err, sent = "cache", None, len(cached)
+            elif num_posts > post_gen.GENERATE_CHUNK_SIZE:
+                used_mode, debug_err, sent = self._stream_chunks(gen_args)
+            else:
+                used_mode, debug_err, sent = self._stream_single(gen_args)
+
+            regenerated, sketches = [], None
+            if used_mode in ("ai", "cache"):
+                delivered = sorted(self._streamed_posts, key=lambda p: p.get("day", 0))
+                delivered, regenerated, sketches = post_gen.dedupe(user_id, gen_args, delivered, tier=self._tier)
+                for post in delivered:
+                    if post.get("day") in regenerated:
+                        self._send_post({"post": post, "index": post["day"] - 1, "total": num_posts,
+                                         "replaced": True})
+                self._streamed_posts = delivered
+
+            ai_posts = self._streamed_posts if used_mode == "ai" else None
+            settlement = supabase.settle_reservation(user_id, 1, [_billing_item(gen_args, ai_posts)])
+            settled = True
+            self._send_event("done", {
+                "mode": used_mode, "debug_error": debug_err, "count": sent, "regenerated_days": regenerated,
+                "tokens_remaining": (settlement or reservation)["tokens_remaining"],
+            })
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away before the calendar finished.
+            return
+        finally:
+            if not settled:
+                # Billed once any post reached the client, refunded otherwise.
+                supabase.settle_reservation(user_id, 1, [_billing_item(gen_args)] if self._posts_sent else [])
+        if used_mode == "ai":
+            gen_cache.put(cache_key, sorted(self._streamed_posts, key=lambda p: p.get("day", 0)))
+        near_dup.record(user_id, sketches)
+        write_behind.after_response()
+
+    def _send_post(self, data):
+        self._send_event("post", data)
+        self._posts_sent += 1
+
+    def _stream_single(self, gen_args):
+        business_name, business_type, _, platforms, tone, language, num_posts = gen_args
+        used_mode = "ai"
+        debug_err = None
+        sent = 0
+        posts = post_gen.stream_with_gemini(*gen_args, tier=self._tier)
+        try:
+            while sent < num_posts:
+                if deadline.near():
+                    # Stop reading while there is still time to fill and debit.
+                    debug_err = "request deadline reached"
+                    break
+                try:
+                    post = next(posts, None)
+                except Exception as exc:
+                    debug_err = str(exc)
+                    break
+                if post is None:
+                    break
+                self._streamed_posts.append(post)
+                self._send_post({"post": post, "index": sent, "total": num_posts})
+                sent += 1
+        finally:
+            posts.close()
+        if 0 < sent < num_posts:
+            # Stream cut short: re-request just the missing days.
+            plan = post_gen.plan_chunks(platforms, num_posts)[0][sent:]
+            for post in post_gen.rerequest_days(gen_args, plan, tier=self._tier):
+                self._streamed_posts.append(post)
+                self._send_post({"post": post, "index": sent, "total": num_posts})
+                sent += 1
+        if sent < num_posts:
+            used_mode = "template" if sent == 0 else "partial"
+            fill = post_gen.generate_with_templates(
+                business_name, business_type, platforms, tone, language, num_posts
+            )[sent:]
+            for post in fill:
+                self._send_post({"post": post, "index": sent, "total": num_posts})
+                sent += 1
+        return used_mode, debug_err, sent
+
+    def _stream_chunks(self, gen_args):
+        num_posts = gen_args[-1]
+        errors = []
+        chunks = sent = 0
+        for chunk_posts, error in post_gen.iter_calendar_chunks(gen_args, tier=self._tier):
+            chunks += 1
+            if error:
+                errors.append(error)
+            for post in chunk_posts:
+                self._streamed_posts.append(post)
+                self._send_post({"post": post, "index": post["day"] - 1, "total": num_posts})
+                sent += 1
+        return post_gen.chunked_mode(len(errors), chunks), "; ".join(errors) or None, sent
+
+    def _debit(self, user_id, gen_args, ai_posts=None):
+        """
+        Returns (tokens_remaining, refusal) — refusal is the error body with
+        its "status" (402, or 503 when the debit could not be recorded), or None.
+        ai_posts (model-written posts only) have their hashtags logged for
+        the offline hashtag index refresh.
+        """
+        item = _billing_item(gen_args, ai_posts)
+        debit = supabase.debit_tokens_and_log(user_id, item["tokens_consumed"], item["type"], item["platform"],
+                                              item["prompt_summary"], item.get("hashtags"))
+        if debit.get("error") == "billing_failed":
+            return 0, {"status": 503, "error": "Could not record token usage. Please try again."}
+        if not debit.get("ok"):
+            return 0, {"status": 402, **_refusal(debit)}
+        return debit["tokens_remaining"], None
+
+
+def _billing_item(gen_args, ai_posts=None):
+    """The generations row of one calendar (a settle_reservation item)."""
+    business_name, business_type, _, platforms, _, _, num_posts = gen_args
+    item = {
+        "type": "text", "platform": platforms[0] if platforms else "instagram",
+        "prompt_summary": f"{business_name} | {business_type} | {num_posts} posts", "tokens_consumed": 1,
     }
-    btype_map = {
-        "restaurant": "مطعم / Restaurant", "online_store": "متجر إلكتروني / Online Store",
-        "real_estate": "عقارات / Real Estate", "beauty": "تجميل / Beauty & Skincare",
-        "fashion": "أزياء / Fashion", "technology": "تقنية / Technology",
-        "education": "تعليم / Education", "health": "صحة / Health",
-        "tourism": "سياحة / Tourism", "general": "عام / General Business"
+    if ai_posts:
+        item["hashtags"] = hashtag_index.summarize(business_type, ai_posts)
+    return item
+
+
+def _refusal(debit):
+    """The 402 body for a debit or reservation the balance refused."""
+    return {
+        "error": "You've used all your tokens. Upgrade your plan to continue.",
+        "plan": debit.get("plan", "free"),
+        "tokens_used": debit.get("tokens_used", 0),
+        "tokens_total": debit.get("tokens_total", 0),
+        "upgrade_required": True,
     }
-    tone_ar, tone_en = tone_map.get(tone, ("ودّي", "friendly"))
-    btype_label = btype_map.get(btype, btype)
-    platform_str = ", ".join(platforms)
-
-    lang_instruction = {
-        "both": 'For EACH post provide BOTH "text_ar" (Gulf Saudi dialect, NOT formal MSA) and "text_en" (professional English). Also provide "hashtags_ar" and "hashtags_en".',
-        "ar": 'Write all posts in Arabic ONLY using Gulf/Saudi dialect. Provide "text_ar" and "hashtags_ar" only.',
-        "en": 'Write all posts in English ONLY. Provide "text_en" and "hashtags_en" only.'
-    }.get(language, 'Provide both Arabic and English.')
-
-    prompt = f"""You are an expert Saudi social media content strategist. Generate exactly {num_posts} social media posts.
-
-BUSINESS: {name}
-TYPE: {btype_label}
-AUDIENCE: {audience or 'General Saudi audience'}
-PLATFORMS: {platform_str}
-TONE: {tone_ar} / {tone_en}
-
-{lang_instruction}
-
-RULES:
-- Each post MUST be unique, creative, and engaging
-- 3-5 relevant hashtags per post
-- Mix content types: promotional, educational, behind-the-scenes, testimonial-style, engagement questions, seasonal content
-- Platform-appropriate lengths
-- Reference Saudi culture: Ramadan, Eid, National Day, Founding Day, Riyadh Season, coffee culture
-- NO emojis — clean text only
-- Distribute posts evenly across platforms
-- Arabic MUST be Gulf/Saudi dialect — natural and conversational, NOT formal MSA
-
-Return ONLY valid JSON:
-{{"posts":[{{"day":1,"platform":"instagram","text_ar":"...","text_en":"...","hashtags_ar":["#..."],"hashtags_en":["#..."]}}]}}
-
-Generate exactly {num_posts} posts, days 1 through {num_posts}."""
-
-    request_body = {
-        "contents": [{"parts": [{"text": prompt}]}],
-        "generationConfig": {"temperature": 0.95, "topP": 0.95, "maxOutputTokens": 8192, "responseMimeType": "application/json"}
-    }
-    url = f"{GEMINI_API_URL}?key={GEMINI_API_KEY}"
-    req = urllib.request.Request(url, data=json.dumps(request_body).encode("utf-8"),
-                                headers={"Content-Type": "application/json"}, method="POST")
-    with urllib.request.urlopen(req, timeout=55) as resp:
-        result = json.loads(resp.read().decode("utf-8"))
-
-    text = result["candidates"][0]["content"]["parts"][0]["text"].strip()
-    if text.startswith("```"):
-        text = text.split("\n", 1)[1] if "\n" in text else text[3:]
-    if text.endswith("```"):
-        text = text[:-3]
-    text = text.strip()
-    parsed = json.loads(text)
-    posts = parsed.get("posts", parsed) if isinstance(parsed, dict) else parsed
-    return posts
-
-
-def get_demo_posts(name, language, platforms):
-    name = name or "نشاطك التجاري"
-    p1 = platforms[0] if platforms else "instagram"
-    p2 = platforms[1] if len(platforms) > 1 else p1
-    p3 = platforms[2] if len(platforms) > 2 else p1
-    posts = [
-        {"day": 1, "platform": p1, "text_ar": f"في {name}، نؤمن بأن التميز مو مجرد كلام — هو أسلوب حياة.", "text_en": f"At {name}, we believe excellence isn't just a word — it's how we operate.", "hashtags_ar": ["#السعودية", "#تميز", "#جودة", "#الرياض", "#رؤية_2030"], "hashtags_en": ["#SaudiArabia", "#Excellence", "#Quality", "#Riyadh", "#Vision2030"]},
-        {"day": 2, "platform": p2, "text_ar": f"عملاؤنا الكرام هم سر نجاحنا. شكراً لثقتكم في {name}.", "text_en": f"Our valued customers are the secret to our success. Thank you for trusting {name}.", "hashtags_ar": ["#عملاء", "#ثقة", "#نجاح", "#الرياض", "#خدمات"], "hashtags_en": ["#CustomerFirst", "#Trust", "#Success", "#Riyadh", "#Services"]},
-        {"day": 3, "platform": p3, "text_ar": f"تبي جودة واحترافية؟ {name} وجهتك الأولى.", "text_en": f"Looking for quality and professionalism? {name} is your go-to.", "hashtags_ar": ["#جودة", "#احترافية", "#السعودية", "#تسوق", "#اعمال"], "hashtags_en": ["#Quality", "#Professional", "#SaudiArabia", "#Business", "#Growth"]},
-    ]
-    if language == "ar":
-        for p in posts:
-            p.pop("text_en", None); p.pop("hashtags_en", None)
-    elif language == "en":
-        for p in posts:
-            p.pop("text_ar", None); p.pop("hashtags_ar", None)
-    return posts
-
-
-def generate_with_templates(name, btype, platforms, tone, language, num_posts):
-    ar_templates = [
-        "في {name}، نؤمن بأن التميز ليس خياراً بل أسلوب حياة.",
-        "اكتشفوا الفرق مع {name}. جودة عالية وخدمة احترافية.",
-        "لأنكم تستاهلون الأفضل — {name} هنا عشان نحقق لكم تجربة مميزة.",
-        "{name} يقدم لكم حلول مبتكرة تناسب احتياجاتكم.",
-        "ثقة عملائنا هي أكبر إنجازاتنا. شكراً لكل من اختار {name}.",
-        "هل تبحثون عن الجودة والاحترافية؟ {name} وجهتكم الأولى.",
-        "مع {name}، كل يوم هو فرصة جديدة للتميز.",
-        "نفخر في {name} بتقديم خدمات تتجاوز توقعاتكم.",
-    ]
-    en_templates = [
-        "At {name}, we believe excellence isn't optional — it's a way of life.",
-        "Discover the difference with {name}. Premium quality and professional service.",
-        "Because you deserve the best — {name} is here to deliver an unforgettable experience.",
-        "{name} offers innovative solutions tailored to your needs.",
-        "Our clients' trust is our greatest achievement. Thank you for choosing {name}.",
-        "Looking for quality and professionalism? {name} is your go-to destination.",
-        "With {name}, every day is a new opportunity to excel.",
-        "At {name}, we pride ourselves on exceeding expectations.",
-    ]
-    ar_tags = ["#السعودية", "#الرياض", "#جدة", "#رؤية_2030", "#اعمال", "#ريادة_اعمال", "#نجاح", "#تميز", "#خدمات", "#جودة"]
-    en_tags = ["#SaudiArabia", "#Riyadh", "#Jeddah", "#Vision2030", "#Business", "#Entrepreneurship", "#Success", "#Quality", "#Services", "#Growth"]
-
-    posts = []
-    for i in range(num_posts):
-        post = {"day": i + 1, "platform": platforms[i % len(platforms)]}
-        if language in ("ar", "both"):
-            post["text_ar"] = ar_templates[i % len(ar_templates)].replace("{name}", name)
-            post["hashtags_ar"] = random.sample(ar_tags, 5)
-        if language in ("en", "both"):
-            post["text_en"] = en_templates[i % len(en_templates)].replace("{name}", name)
-            post["hashtags_en"] = random.sample(en_tags, 5)
-        posts.append(post)
-    return posts
@@ -1,143 +1,52 @@
 #!/usr/bin/env python3
 """
 Postir V2 — AI Image Generation Endpoint
-Uses Gemini 2.0 Flash (experimental) to generate social media images.
-Vercel serverless function. Supabase helpers inlined.
+Uses Gemini image models (routed by _core.model_router) to generate
+social media images. The image (PNG, or whatever type Gemini returned)
+is written to the content-addressed asset store and the reply carries
+its image_url (/api/assets/{key}); with Accept: image/* the image bytes
+are the response body, and "inline": true (or ?inline=true) adds the
+base64 image_data of earlier versions. With "async": true the reply is
+202 and a job id; poll /api/jobs/{id}.
+Vercel serverless function. Shared helpers live in api/_core.
 """
+import base64
+import binascii
 import json
 import os
-import urllib.request
-import urllib.error
-import base64
-from http.server import BaseHTTPRequestHandler
-from urllib.parse import urlencode
-
-
-# ══════════════════════════════════════════════════════════════════════
-#  Inlined Supabase helpers
-# ══════════════════════════════════════════════════════════════════════
-
-def _sb_config():
-    url = os.environ.get("SUPABASE_URL", "").rstrip("/")
-    sk = os.environ.get("SUPABASE_SERVICE_KEY", "")
-    ak = os.environ.get("SUPABASE_ANON_KEY", "")
-    return url, sk, ak
-
-
-def _sb_request(method, path, data=None, token=None, use_service_key=False, params=None):
-    sb_url, sk, ak = _sb_config()
-    if not sb_url:
-        raise ValueError("SUPABASE_URL not configured")
-    full_url = f"{sb_url}{path}"
-    if params:
-        full_url += "?" + urlencode(params)
-    headers = {"Content-Type": "application/json", "apikey": ak, "Accept": "application/json"}
-    if use_service_key and sk:
-        headers["Authorization"] = f"Bearer {sk}"
-        headers["apikey"] = sk
-    elif token:
-        headers["Authorization"] = f"Bearer {token}"
-    body = json.dumps(data).encode("utf-8") if data is not None else None
-    req = urllib.request.Request(full_url, data=body, headers=headers, method=method)
-    try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            raw = resp.read().decode("utf-8")
-            return json.loads(raw) if raw.strip() else {}
-    except urllib.error.HTTPError as e:
-        raw = e.read().decode("utf-8") if e.fp else ""
-        try:
-            return {"_error": True, "_status": e.code, "_body": json.loads(raw)}
-        except Exception:
-            return {"_error": True, "_status": e.code, "_body": raw}
-
-
-def _verify_token(token):
-    if not token:
-        return None
-    resp = _sb_request("GET", "/auth/v1/user", token=token)
-    if resp and not resp.get("_error") and resp.get("id"):
-        return resp
-    return None
-
-
-def _get_user_profile(user_id):
-    resp = _sb_request("GET", "/rest/v1/profiles", use_service_key=True,
-                       params={"id": f"eq.{user_id}", "limit": "1"})
-    if isinstance(resp, list) and len(resp) > 0:
-        return resp[0]
-    return None
-
-
-def _check_tokens(user_id, required=1):
-    profile = _get_user_profile(user_id)
-    if not profile:
-        return False, None
-    if profile.get("plan") == "pro":
-        return True, profile
-    if (profile.get("tokens_total", 0) - profile.get("tokens_used", 0)) >= required:
-        return True, profile
-    return False, profile
-
-
-def _update_user_tokens(user_id, increment):
-    profile = _get_user_profile(user_id)
-    if not profile:
-        return False
-    new_used = profile.get("tokens_used", 0) + increment
-    resp = _sb_request("PATCH", "/rest/v1/profiles",
-                       data={"tokens_used": new_used, "updated_at": "now()"},
-                       use_service_key=True, params={"id": f"eq.{user_id}"})
-    return not (resp and resp.get("_error"))
-
-
-def _log_generation(user_id, gen_type, platform=None, prompt_summary=None, tokens_consumed=1):
-    data = {"user_id": user_id, "type": gen_type, "tokens_consumed": tokens_consumed}
-    if platform:
-        data["platform"] = platform
-    if prompt_summary:
-        data["prompt_summary"] = prompt_summary
-    resp = _sb_request("POST", "/rest/v1/generations", data=data, use_service_key=True)
-    return not (resp and resp.get("_error"))
+import sys
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _core import (  # noqa: E402
+    asset_store, deadline, http_pool, model_router, profile_cache, supabase, tables, write_behind,
+)
+from _core.handler import JSONHandler  # noqa: E402
 
 
 # ===== CONFIG =====
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
-GEMINI_IMAGE_MODEL = "gemini-2.0-flash-exp"
-GEMINI_IMAGE_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_IMAGE_MODEL}:generateContent"
 TOKENS_PER_IMAGE = 1
 
-PLATFORM_SPECS = {
-    "instagram": {"aspect": "square (1:1, 1080x1080px)", "style": "vibrant, lifestyle-focused"},
-    "instagram_story": {"aspect": "portrait (9:16, 1080x1920px)", "style": "bold, full-bleed visual"},
-    "x": {"aspect": "landscape (16:9, 1200x675px)", "style": "clean, minimal, high contrast"},
-    "linkedin": {"aspect": "landscape (1.91:1, 1200x627px)", "style": "professional, corporate"},
-    "snapchat": {"aspect": "portrait (9:16, 1080x1920px)", "style": "playful, colorful, casual"},
-    "tiktok": {"aspect": "portrait (9:16, 1080x1920px)", "style": "trendy, dynamic, eye-catching"},
-    "facebook": {"aspect": "landscape (16:9, 1200x630px)", "style": "engaging, clear message"},
-}
-
 
-class handler(BaseHTTPRequestHandler):
+class handler(JSONHandler):
 
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.end_headers()
+    allowed_methods = "POST, OPTIONS"
+    exposed_headers = "Content-Location, X-Tokens-Remaining"
 
     def do_POST(self):
+        profile_cache.begin_request()
         token = self._get_bearer_token()
         if not token:
             self._send_json(401, {"error": "Authentication required. Please log in."})
             return
-        user = _verify_token(token)
+        # Profile read overlaps token verification; see verify_and_check_tokens.
+        user, has_tokens, profile = supabase.verify_and_check_tokens(token, required=TOKENS_PER_IMAGE)
         if not user:
             self._send_json(401, {"error": "Invalid or expired token. Please log in again."})
             return
 
         user_id = user["id"]
-        has_tokens, profile = _check_tokens(user_id, required=TOKENS_PER_IMAGE)
         if not has_tokens:
             self._send_json(402, {
                 "error": "Insufficient tokens for image generation. Upgrade your plan.",
@@ -146,64 +55,93 @@ class handler(BaseHTTPRequestHandler):
             return
 
         try:
-            content_length = int(self.headers.get('Content-Length', 0))
-            body_raw = self.rfile.read(content_length) if content_length > 0 else b'{}'
-            body = json.loads(body_raw)
+            body = self._read_json_body()
         except Exception as e:
             self._send_json(400, {"error": f"Invalid request: {str(e)}"})
             return
 
-        prompt = body.get("prompt", "").strip()
-        platform = body.get("platform", "instagram").lower()
-        style_override = body.get("style", "").strip()
-        business_name = body.get("business_name", "").strip()
-        language = body.get("language", "ar")
-
-        if not prompt:
+        image_args = _image_args(body)
+        if not image_args[0]:
             self._send_json(400, {"error": "prompt is required"})
             return
         if not GEMINI_API_KEY:
             self._send_json(500, {"error": "Gemini API key not configured"})
             return
 
+        query = parse_qs(urlparse(self.path).query)
+        inline = body.get("inline") in (True, "true", "1") or query.get("inline", [""])[0] in ("true", "1")
+        if body.get("async"):
+            self._run_async("image", user_id, {**body, "inline": inline})
+            return
+        self._make_image(user_id, profile, image_args, inline, binary="image/" in self.headers.get("Accept", ""))
+
+    def _run_job(self, user_id, body):
+        profile = supabase.get_user_profile(user_id) or {}
+        self._make_image(user_id, profile, _image_args(body), body.get("inline") is True)
+
+    def _make_image(self, user_id, profile, image_args, inline=False, binary=False):
+        prompt, platform = image_args[:2]
         try:
-            image_data, alt_text = generate_image_with_gemini(prompt, platform, business_name, style_override, language)
+            image_data, mime_type, alt_text = generate_image_with_gemini(*image_args, tier=(profile or {}).get("plan", "free"))
+        except deadline.DeadlineExceeded:
+            self._send_json(504, {"error": "Image generation timed out. Please try again."})
+            return
         except Exception as e:
             self._send_json(500, {"error": f"Image generation failed: {str(e)}"})
             return
 
-        if not image_data:
+        try:
+            image_bytes = base64.b64decode(image_data or "", validate=True)
+        except (binascii.Error, ValueError):
+            image_bytes = b""
+        if not image_bytes:
             self._send_json(500, {"error": "No image returned from Gemini."})
             return
+        try:
+            asset_key = asset_store.put(image_bytes, mime_type)
+        except asset_store.StoreUnavailable:
+            # Still deliver the image; it just goes out inline.
+            asset_key = None
+
+        debit = supabase.debit_tokens_and_log(user_id, TOKENS_PER_IMAGE, "image", platform, prompt[:200])
+        if debit.get("error") == "billing_failed":
+            self._send_json(503, {"error": "Could not record token usage. Please try again."})
+            return
+        if not debit.get("ok"):
+            self._send_json(402, {
+                "error": "Insufficient tokens for image generation. Upgrade your plan.",
+                "upgrade_required": True,
+            })
+            return
+        tokens_remaining = debit["tokens_remaining"]
+        if binary:
+            headers = {"Cache-Control": "private, no-store", "X-Tokens-Remaining": str(tokens_remaining)}
+            if asset_key:
+                headers["Content-Location"] = asset_store.url(asset_key)
+            etag = asset_store.etag_for(asset_key or asset_store.key_for(image_bytes, mime_type))
+            self._send_asset(image_bytes, mime_type, etag, headers=headers)
+        else:
+            result = {
+                "image_url": asset_store.url(asset_key) if asset_key else None, "asset_key": asset_key,
+                "mime_type": mime_type, "alt_text": alt_text,
+                "platform": platform, "tokens_remaining": tokens_remaining,
+            }
+            if inline or not asset_key:
+                result["image_data"] = image_data
+            self._send_json(200, result)
+        write_behind.after_response()
+
+
+def _image_args(body):
+    """(prompt, platform, business_name, style_override, language) of a request body."""
+    return (
+        body.get("prompt", "").strip(), body.get("platform", "instagram").lower(),
+        body.get("business_name", "").strip(), body.get("style", "").strip(), body.get("language", "ar"),
+    )
 
-        _update_user_tokens(user_id, TOKENS_PER_IMAGE)
-        _log_generation(user_id, "image", platform, prompt[:200], tokens_consumed=TOKENS_PER_IMAGE)
-
-        tokens_remaining = max(0, (profile.get("tokens_total", 3) - profile.get("tokens_used", 0)) - TOKENS_PER_IMAGE)
-        self._send_json(200, {
-            "image_data": image_data, "mime_type": "image/png", "alt_text": alt_text,
-            "platform": platform, "tokens_remaining": tokens_remaining,
-        })
-
-    def _get_bearer_token(self):
-        auth = self.headers.get("Authorization", "")
-        if auth.startswith("Bearer "):
-            return auth[7:].strip()
-        return None
-
-    def _send_json(self, status_code, data):
-        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
-        self.send_response(status_code)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.send_header('Content-Length', str(len(body)))
-        self.end_headers()
-        self.wfile.write(body)
-
-
-def generate_image_with_gemini(prompt, platform, business_name="", style_override="", language="ar"):
-    spec = PLATFORM_SPECS.get(platform, PLATFORM_SPECS["instagram"])
+
+def generate_image_with_gemini(prompt, platform, business_name="", style_override="", language="ar", tier=None):
+    spec = tables.PLATFORM_SPECS.get(platform, tables.PLATFORM_SPECS["instagram"])
     business_context = f" for {business_name}" if business_name else ""
     style = style_override if style_override else spec["style"]
 
@@ -220,14 +158,10 @@ def generate_image_with_gemini(prompt, platform, business_name="", style_overrid
         "generationConfig": {"responseModalities": ["TEXT", "IMAGE"]},
     }
 
-    url = f"{GEMINI_IMAGE_URL}?key={GEMINI_API_KEY}"
-    req = urllib.request.Request(url, data=json.dumps(request_body).encode("utf-8"),
-                                headers={"Content-Type": "application/json"}, method="POST")
-
-    with urllib.request.urlopen(req, timeout=60) as resp:
-        result = json.loads(resp.read().decode("utf-8"))
+    result = model_router.call("image", lambda model: _gemini_image_once(model, request_body), tier=tier)
 
     image_b64 = None
+    mime_type = "image/png"
     alt_text = ""
     candidates = result.get("candidates", [])
     if not candidates:
@@ -238,9 +172,24 @@ def generate_image_with_gemini(prompt, platform, business_name="", style_overrid
         inline = part.get("inlineData") or part.get("inline_data")
         if inline:
             image_b64 = inline.get("data")
+            mime_type = inline.get("mimeType") or inline.get("mime_type") or mime_type
         if part.get("text"):
             alt_text = part["text"].strip()
 
     if not alt_text:
         alt_text = f"AI-generated social media image for {platform}: {prompt[:100]}"
-    return image_b64, alt_text
+    return image_b64, mime_type, alt_text
+
+
+def _gemini_image_once(model, request_body):
+    url = f"{model_router.url(model)}?key={GEMINI_API_KEY}"
+    raw = http_pool.urlopen("POST", url, data=json.dumps(request_body).encode("utf-8"),
+                            headers={"Content-Type": "application/json"},
+                            timeout=deadline.timeout(60, reserve=deadline.DEADLINE_TAIL_RESERVE_SECONDS))
+    result = json.loads(raw.decode("utf-8"))
+    # A response without an image counts against the model, so the router
+    # can fail over to the next image model.
+    parts = ((result.get("candidates") or [{}])[0].get("content") or {}).get("parts") or []
+    if not any(part.get("inlineData") or part.get("inline_data") for part in parts):
+        raise ValueError("No image in Gemini response")
+    return result
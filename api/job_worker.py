@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Async Job Worker
+Runs the jobs that "async": true requests to /api/generate, /api/image
+and /api/video leave queued in generation_jobs (JOBS_BACKEND=supabase,
+the default on Vercel). Vercel Cron calls GET /api/job-worker every
+minute (vercel.json) with Authorization: Bearer $CRON_SECRET; another
+scheduler may call it the same way. Each invocation claims queued jobs
+one at a time and runs each under a deadline capped at what is left of
+the invocation, until less than JOBS_WORKER_MIN_SECONDS remains.
+Vercel serverless function. Shared helpers live in api/_core.
+"""
+import contextvars
+import hmac
+import importlib
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _core import deadline, jobs, profile_cache  # noqa: E402
+from _core.handler import JSONHandler  # noqa: E402
+
+
+# ===== CONFIG =====
+CRON_SECRET = os.environ.get("CRON_SECRET", "")
+JOB_ENDPOINTS = {"generate": "generate", "image": "image", "video": "video"}    # job kind -> endpoint module
+
+
+class handler(JSONHandler):
+
+    allowed_methods = "GET, POST, OPTIONS"
+
+    def do_GET(self):
+        token = self._get_bearer_token() or ""
+        if not CRON_SECRET or not hmac.compare_digest(token.encode(), CRON_SECRET.encode()):
+            self._send_json(401, {"error": "Unauthorized"})
+            return
+        if jobs.JOBS_BACKEND == "local":
+            self._send_json(200, {"ran": []})       # local jobs run on their own pool
+            return
+
+        ran = []
+        while not deadline.near(jobs.JOBS_WORKER_MIN_SECONDS):
+            job = jobs.claim()
+            if job is None:
+                break
+            # Each job gets its own context, so its deadline leaves the invocation's intact.
+            contextvars.copy_context().run(_run, job)
+            ran.append(job.id)
+        self._send_json(200, {"ran": ran})
+
+    def do_POST(self):
+        self.do_GET()
+
+
+def _run(job):
+    profile_cache.begin_request()
+    seconds = min(jobs.JOBS_DEADLINE_SECONDS, deadline.remaining() - deadline.DEADLINE_RESERVE_SECONDS)
+    endpoint = JOB_ENDPOINTS.get(job.kind)
+    if endpoint is None:
+        jobs.run(job, lambda: job.fail(f"Unknown job kind: {job.kind}"), seconds)
+        return
+    worker = importlib.import_module(endpoint).handler.for_job(job)
+    jobs.run(job, lambda: worker._run_job(job.user_id, job.request), seconds)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Async Job Status Endpoint
+GET /api/jobs/{id} returns a job started with "async": true on
+/api/generate, /api/video or /api/image: status (queued, running, done,
+failed), progress and partial results while it runs, and the payload the
+synchronous call would have returned once it finishes. Only the owner
+can read a job; finished jobs expire after JOBS_TTL_SECONDS.
+Vercel serverless function. Shared helpers live in api/_core.
+"""
+import os
+import sys
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _core import jobs, profile_cache, supabase  # noqa: E402
+from _core.handler import JSONHandler  # noqa: E402
+
+
+class handler(JSONHandler):
+
+    allowed_methods = "GET, OPTIONS"
+
+    def do_GET(self):
+        profile_cache.begin_request()
+        token = self._get_bearer_token()
+        if not token:
+            self._send_json(401, {"error": "Authentication required. Please log in."})
+            return
+        user = supabase.verify_token(token)
+        if not user:
+            self._send_json(401, {"error": "Invalid or expired token. Please log in again."})
+            return
+
+        job_id = urlparse(self.path).path.replace("/api/jobs", "").strip("/")
+        if not job_id or "/" in job_id:
+            self._send_json(404, {"error": "Not found"})
+            return
+
+        job = jobs.get(job_id, user["id"])
+        if job is None:
+            self._send_json(404, {"error": "Job not found or expired"})
+            return
+        if job.get("_error"):
+            self._send_json(503, {"error": "Job store unavailable. Please retry."})
+            return
+        headers = {"Cache-Control": "no-store"}
+        if job["status"] in (jobs.QUEUED, jobs.RUNNING):
+            headers["Retry-After"] = "2"
+        self._send_json(200, job, headers=headers)
@@ -2,147 +2,177 @@
 """
 Postir V2 — Usage Tracking Endpoint
 Returns user's current plan, token usage, and generation history.
-Vercel serverless function. Supabase helpers inlined.
+History is keyset-paginated on (created_at, id); responses carry an ETag.
+Vercel serverless function. Shared helpers live in api/_core.
 """
-import json
 import os
-from http.server import BaseHTTPRequestHandler
-from urllib.parse import urlencode
-import urllib.request
-import urllib.error
+import re
+import sys
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _core import profile_cache, supabase, workers  # noqa: E402
+from _core.handler import JSONHandler, etag_matches  # noqa: E402
+
+
+def _fetch_rows(path, params):
+    try:
+        resp = supabase.supabase_request("GET", path, use_service_key=True, params=params)
+    except Exception:
+        return []
+    return resp if isinstance(resp, list) else []
+
+
+# History reads run on a small shared pool while the handler thread reads
+# the profile, so the dashboard costs one upstream latency, not three.
+def _submit_fetch(path, params):
+    return workers.submit("supabase", _fetch_rows, path, params)
+
+
+USAGE_FIELDS = ("counters", "generations", "payments")
+HISTORY_SPECS = {
+    "generations": {"path": "/rest/v1/generations", "default_limit": 20, "max_limit": 100,
+                    "select": "id,type,platform,tokens_consumed,prompt_summary,created_at"},
+    "payments": {"path": "/rest/v1/payments", "default_limit": 5, "max_limit": 50,
+                 "select": "id,plan,amount_sar,status,created_at"},
+}
 
 
 # ══════════════════════════════════════════════════════════════════════
-#  Inlined Supabase helpers
+#  Keyset pagination
 # ══════════════════════════════════════════════════════════════════════
 
-def _sb_config():
-    url = os.environ.get("SUPABASE_URL", "").rstrip("/")
-    sk = os.environ.get("SUPABASE_SERVICE_KEY", "")
-    ak = os.environ.get("SUPABASE_ANON_KEY", "")
-    return url, sk, ak
-
-
-def _sb_request(method, path, data=None, token=None, use_service_key=False, params=None):
-    sb_url, sk, ak = _sb_config()
-    if not sb_url:
-        raise ValueError("SUPABASE_URL not configured")
-    full_url = f"{sb_url}{path}"
-    if params:
-        full_url += "?" + urlencode(params)
-    headers = {"Content-Type": "application/json", "apikey": ak, "Accept": "application/json"}
-    if use_service_key and sk:
-        headers["Authorization"] = f"Bearer {sk}"
-        headers["apikey"] = sk
-    elif token:
-        headers["Authorization"] = f"Bearer {token}"
-    body = json.dumps(data).encode("utf-8") if data is not None else None
-    req = urllib.request.Request(full_url, data=body, headers=headers, method=method)
+def _encode_cursor(row):
+    import base64
+    raw = f"{row.get('created_at', '')}|{row.get('id', '')}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+# Both cursor halves end up inside a PostgREST logic tree: only a
+# timestamptz as PostgREST prints it and a bigint or uuid id get through.
+_CREATED_AT_RE = re.compile(r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d{1,6})?(?:Z|[+-]\d{2}(?::?\d{2})?)?$")
+_ROW_ID_RE = re.compile(r"^(?:\d{1,19}|[0-9a-fA-F]{8}-(?:[0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12})$")
+
+
+def _decode_cursor(cursor):
+    """(created_at, id) from a cursor we issued, or None if it is not one."""
+    import base64
     try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            raw = resp.read().decode("utf-8")
-            return json.loads(raw) if raw.strip() else {}
-    except urllib.error.HTTPError as e:
-        raw = e.read().decode("utf-8") if e.fp else ""
-        try:
-            return {"_error": True, "_status": e.code, "_body": json.loads(raw)}
-        except Exception:
-            return {"_error": True, "_status": e.code, "_body": raw}
-
-
-def _verify_token(token):
-    if not token:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, row_id = raw.split("|", 1)
+    except Exception:
+        return None
+    if not _CREATED_AT_RE.fullmatch(created_at) or not _ROW_ID_RE.fullmatch(row_id):
         return None
-    resp = _sb_request("GET", "/auth/v1/user", token=token)
-    if resp and not resp.get("_error") and resp.get("id"):
-        return resp
-    return None
+    return created_at, row_id
 
 
-def _get_user_profile(user_id):
-    resp = _sb_request("GET", "/rest/v1/profiles", use_service_key=True,
-                       params={"id": f"eq.{user_id}", "limit": "1"})
-    if isinstance(resp, list) and len(resp) > 0:
-        return resp[0]
-    return None
+def _parse_limit(value, spec):
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return spec["default_limit"]
+    return min(max(limit, 1), spec["max_limit"])
+
+
+def _history_params(user_id, spec, limit, cursor):
+    """Page on (created_at, id) descending; one extra row tells us if more exist."""
+    params = {
+        "user_id": f"eq.{user_id}", "order": "created_at.desc,id.desc",
+        "limit": str(limit + 1), "select": spec["select"],
+    }
+    if cursor:
+        created_at, row_id = cursor
+        params["or"] = f'(created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{row_id}"))'
+    return params
+
+
+def _page(rows, limit):
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, _encode_cursor(rows[-1])
+    return rows, None
+
+
+def _make_etag(query, profile, pages):
+    """Latest row ids + token counters identify a dashboard state."""
+    import hashlib
+    parts = [query, str(profile.get("plan")), str(profile.get("tokens_total")),
+             str(profile.get("tokens_used")), str(profile.get("plan_expires_at"))]
+    for name in USAGE_FIELDS[1:]:
+        rows = pages.get(name, ([], None))[0]
+        parts.append(f"{name}:{rows[0].get('id') if rows else ''}")
+    digest = hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:32]
+    return f'W/"{digest}"'
 
 
 # ══════════════════════════════════════════════════════════════════════
 #  Handler
 # ══════════════════════════════════════════════════════════════════════
 
-class handler(BaseHTTPRequestHandler):
+class handler(JSONHandler):
 
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.end_headers()
+    allowed_methods = "GET, OPTIONS"
+    allowed_headers = "Content-Type, Authorization, If-None-Match"
+    exposed_headers = "ETag"
 
     def do_GET(self):
+        profile_cache.begin_request()
         token = self._get_bearer_token()
         if not token:
             self._send_json(401, {"error": "Authentication required. Please log in."})
             return
-        user = _verify_token(token)
+        user = supabase.verify_token(token)
         if not user:
             self._send_json(401, {"error": "Invalid or expired token. Please log in again."})
             return
 
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        fields = [f.strip() for f in query.get("fields", [",".join(USAGE_FIELDS)])[0].split(",")]
+        fields = [f for f in USAGE_FIELDS if f in fields] or list(USAGE_FIELDS)
+
         user_id = user["id"]
-        profile = _get_user_profile(user_id)
+        futures = {}
+        for name, spec in HISTORY_SPECS.items():
+            if name not in fields:
+                continue
+            cursor = None
+            cursor_raw = query.get(f"{name}_cursor", [""])[0]
+            if cursor_raw:
+                cursor = _decode_cursor(cursor_raw)
+                if cursor is None:
+                    self._send_json(400, {"error": f"Invalid {name}_cursor"})
+                    return
+            limit = _parse_limit(query.get(f"{name}_limit", [None])[0], spec)
+            params = _history_params(user_id, spec, limit, cursor)
+            futures[name] = (limit, _submit_fetch(spec["path"], params))
+
+        # The profile is read here while the history fetches run on the pool.
+        profile = supabase.get_user_profile(user_id)
         if not profile:
             self._send_json(404, {"error": "User profile not found."})
             return
 
-        plan = profile.get("plan", "free")
-        tokens_total = profile.get("tokens_total", 3)
-        tokens_used = profile.get("tokens_used", 0)
-        tokens_remaining = max(0, tokens_total - tokens_used)
+        pages = {name: _page(future.result(), limit) for name, (limit, future) in futures.items()}
 
-        generations = []
-        try:
-            resp = _sb_request("GET", "/rest/v1/generations", use_service_key=True, params={
-                "user_id": f"eq.{user_id}", "order": "created_at.desc", "limit": "20",
-                "select": "id,type,platform,tokens_consumed,prompt_summary,created_at",
-            })
-            if isinstance(resp, list):
-                generations = resp
-        except Exception:
-            generations = []
-
-        payments = []
-        try:
-            resp = _sb_request("GET", "/rest/v1/payments", use_service_key=True, params={
-                "user_id": f"eq.{user_id}", "order": "created_at.desc", "limit": "5",
-                "select": "id,plan,amount_sar,status,created_at",
+        etag = _make_etag(parsed.query, profile, pages)
+        if etag_matches(self.headers.get("If-None-Match", ""), etag):
+            self._send_not_modified(etag, headers={"Cache-Control": "private, no-cache"})
+            return
+
+        result = {}
+        if "counters" in fields:
+            tokens_total = profile.get("tokens_total", 3)
+            tokens_used = profile.get("tokens_used", 0)
+            result.update({
+                "plan": profile.get("plan", "free"), "tokens_total": tokens_total,
+                "tokens_used": tokens_used, "tokens_remaining": max(0, tokens_total - tokens_used),
+                "plan_started_at": profile.get("plan_started_at"),
+                "plan_expires_at": profile.get("plan_expires_at"),
             })
-            if isinstance(resp, list):
-                payments = resp
-        except Exception:
-            payments = []
-
-        self._send_json(200, {
-            "plan": plan, "tokens_total": tokens_total, "tokens_used": tokens_used,
-            "tokens_remaining": tokens_remaining,
-            "plan_started_at": profile.get("plan_started_at"),
-            "plan_expires_at": profile.get("plan_expires_at"),
-            "generations": generations, "payments": payments,
-        })
-
-    def _get_bearer_token(self):
-        auth = self.headers.get("Authorization", "")
-        if auth.startswith("Bearer "):
-            return auth[7:].strip()
-        return None
+        for name, (rows, next_cursor) in pages.items():
+            result[name] = rows
+            result[f"{name}_next_cursor"] = next_cursor
 
-    def _send_json(self, status_code, data):
-        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
-        self.send_response(status_code)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.send_header('Content-Length', str(len(body)))
-        self.end_headers()
-        self.wfile.write(body)
+        self._send_json(200, result, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
@@ -1020,34 +1020,68 @@
     genResults.classList.add('hidden');
     genLoading.classList.remove('hidden');
 
-    let pct = 0;
-    const pctInterval = setInterval(() => {
-      pct += Math.random() * 8;
-      if (pct > 90) pct = 90;
-      loadingPercent.textContent = Math.floor(pct) + '%';
-    }, 200);
-
+    loadingPercent.textContent = '0%';
+    payload.stream = true;
     const headers = { 'Content-Type': 'application/json', ...getAuthHeader() };
+    const posts = [];
+
+    // Posts arrive one per NDJSON line as Gemini finishes each of them;
+    // demo mode (and any non-streaming server) still answers with plain JSON.
+    function showPosts(tokensRemaining) {
+      genLoading.classList.add('hidden');
+      renderTextResults(posts, tokensRemaining);
+      genResults.classList.remove('hidden');
+    }
 
-    fetch(`${CGI_BIN}/generate`, { method: 'POST', headers, body: JSON.stringify(payload) })
-      .then(res => { if (!res.ok) throw new Error('API error'); return res.json(); })
-      .then(data => {
-        clearInterval(pctInterval);
-        loadingPercent.textContent = '100%';
-        if (data.tokens_remaining !== undefined) {
-          authState.tokens = data.tokens_remaining;
+    function handleEvent(evt) {
+      if (evt.event === 'post') {
+        posts[evt.index] = evt.post;
+        loadingPercent.textContent = Math.floor(100 * (evt.index + 1) / evt.total) + '%';
+        showPosts();
+      } else if (evt.event === 'done') {
+        if (evt.tokens_remaining !== undefined) {
+          authState.tokens = evt.tokens_remaining;
           updateAuthUI();
         }
-        setTimeout(() => {
-          genLoading.classList.add('hidden');
-          renderTextResults(data.posts || [], data.tokens_remaining);
-          genResults.classList.remove('hidden');
-        }, 500);
+        showPosts(evt.tokens_remaining);
+      } else if (evt.event === 'error') {
+        throw new Error(evt.error || 'API error');
+      }
+    }
+
+    async function readStream(res) {
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = '';
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+        let nl;
+        while ((nl = buffered.indexOf('\n')) >= 0) {
+          const line = buffered.slice(0, nl).trim();
+          buffered = buffered.slice(nl + 1);
+          if (line) handleEvent(JSON.parse(line));
+        }
+      }
+      if (buffered.trim()) handleEvent(JSON.parse(buffered));
+    }
+
+    fetch(`${CGI_BIN}/generate`, { method: 'POST', headers, body: JSON.stringify(payload) })
+      .then(res => {
+        if (!res.ok) throw new Error('API error');
+        if ((res.headers.get('Content-Type') || '').includes('ndjson') && res.body) return readStream(res);
+        return res.json().then(data => {
+          posts.push(...(data.posts || []));
+          handleEvent({ event: 'done', tokens_remaining: data.tokens_remaining });
+        });
       })
       .catch(err => {
-        clearInterval(pctInterval);
         genLoading.classList.add('hidden');
-        form.classList.remove('hidden');
+        if (posts.length === 0) {
+          genResults.classList.add('hidden');
+          form.classList.remove('hidden');
+        }
         alert(T[currentLang].error_api);
         console.error(err);
       });
@@ -1267,9 +1301,13 @@
   function renderImageResult(data, tokensRemaining) {
     imageResultCard.innerHTML = '';
 
-    if (data.image_data) {
+    // One URL (or, from older responses, one data URI) for both the preview and the download.
+    const imageSrc = data.image_url
+      || (data.image_data ? `data:${data.mime_type || 'image/png'};base64,${data.image_data}` : '');
+
+    if (imageSrc) {
       const img = document.createElement('img');
-      img.src = `data:${data.mime_type || 'image/png'};base64,${data.image_data}`;
+      img.src = imageSrc;
       img.alt = data.alt_text || '';
       img.loading = 'lazy';
       imageResultCard.appendChild(img);
@@ -1285,10 +1323,10 @@
     const actionsDiv = document.createElement('div');
     actionsDiv.className = 'image-result-actions';
 
-    if (data.image_data) {
+    if (imageSrc) {
       const dlBtn = document.createElement('a');
       dlBtn.className = 'copy-btn';
-      dlBtn.href = `data:${data.mime_type || 'image/png'};base64,${data.image_data}`;
+      dlBtn.href = imageSrc;
       dlBtn.download = 'postir-image.png';
       dlBtn.innerHTML = `<svg width="14" height="14" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round"><path d="M21 15v4a2 2 0 01-2 2H5a2 2 0 01-2-2v-4"/><polyline points="7 10 12 15 17 10"/><line x1="12" y1="15" x2="12" y2="3"/></svg>
         ${currentLang === 'ar' ? '\u062a\u062d\u0645\u064a\u0644' : 'Download'}`;
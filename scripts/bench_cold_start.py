@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Cold-start import benchmark
+Imports each Vercel function module in a fresh interpreter (so nothing is
+cached in sys.modules), records the median import time, and exits non-zero
+if any function goes over its budget.
+
+    python scripts/bench_cold_start.py [--runs 7] [--budget-ms 60] [function ...]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api")
+FUNCTIONS = ["auth", "generate", "batch", "image", "assets", "video", "usage", "payment", "jobs", "job_worker"]
+
+# Per-function import budgets in milliseconds. Measured after preloading
+# the stdlib modules every BaseHTTPRequestHandler function needs anyway, so
+# the number is the cost our own code adds to a cold start.
+DEFAULT_BUDGET_MS = 15.0
+BUDGETS_MS = {}
+RUNTIME_PRELOAD = ("http.server", "json")
+
+_PROBE = """
+import importlib, importlib.util, sys, time
+path = sys.argv[1]
+for name in sys.argv[2:]:
+    importlib.import_module(name)
+t0 = time.perf_counter()
+spec = importlib.util.spec_from_file_location("bench_target", path)
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+print(f"{(time.perf_counter() - t0) * 1000:.3f} {len(sys.modules)}")
+"""
+
+
+def measure(name, runs):
+    path = os.path.join(API_DIR, f"{name}.py")
+    samples, module_counts = [], []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE, path, *RUNTIME_PRELOAD],
+            capture_output=True, text=True, check=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": ""},
+        ).stdout.split()
+        samples.append(float(out[0]))
+        module_counts.append(int(out[1]))
+    return statistics.median(samples), max(module_counts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("functions", nargs="*", default=FUNCTIONS)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="override every per-function budget")
+    args = parser.parse_args(argv)
+
+    failed = []
+    print(f"{'function':<10} {'median ms':>10} {'budget ms':>10} {'modules':>8}")
+    for name in args.functions:
+        budget = args.budget_ms if args.budget_ms is not None else BUDGETS_MS.get(name, DEFAULT_BUDGET_MS)
+        median_ms, modules = measure(name, args.runs)
+        flag = "" if median_ms <= budget else "  OVER BUDGET"
+        print(f"{name:<10} {median_ms:>10.2f} {budget:>10.1f} {modules:>8}{flag}")
+        if flag:
+            failed.append(name)
+
+    if failed:
+        print(f"\nCold-start budget exceeded: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
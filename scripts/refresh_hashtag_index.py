@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Postir V2 — Offline hashtag index refresh
+Reads the hashtag summaries logged with recent generations (the
+generations.hashtags column), re-ranks every (business_type, platform,
+language) key with _core.hashtag_index.score_history and writes the packed
+index the API loads at import. Needs SUPABASE_URL and SUPABASE_SERVICE_KEY.
+
+    python scripts/refresh_hashtag_index.py [--days 90] [--min-count 3] [--out PATH] [--dry-run]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api")
+sys.path.insert(0, API_DIR)
+
+from _core import hashtag_index, supabase  # noqa: E402
+
+PAGE_SIZE = 1000
+
+
+def fetch_summaries(days):
+    """Every non-null generations.hashtags since `days` ago, keyset-paginated on (created_at, id)."""
+    since = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - days * 86400))
+    summaries, cursor = [], None
+    while True:
+        params = {
+            "select": "id,created_at,hashtags", "hashtags": "not.is.null",
+            "order": "created_at.asc,id.asc", "limit": str(PAGE_SIZE),
+        }
+        if cursor:
+            params["or"] = f'(created_at.gt."{cursor[0]}",and(created_at.eq."{cursor[0]}",id.gt."{cursor[1]}"))'
+        else:
+            params["created_at"] = f"gte.{since}"
+        rows = supabase.supabase_request("GET", "/rest/v1/generations", use_service_key=True, params=params)
+        if isinstance(rows, dict) and rows.get("_error"):
+            raise RuntimeError(f"generations read failed: {rows.get('_status')} {rows.get('_body')}")
+        summaries.extend(row["hashtags"] for row in rows if isinstance(row.get("hashtags"), dict))
+        if len(rows) < PAGE_SIZE:
+            return summaries
+        cursor = (rows[-1]["created_at"], rows[-1]["id"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--days", type=float, default=90)
+    parser.add_argument("--min-count", type=int, default=3,
+                        help="uses of a tag for a key before it is ranked from history")
+    parser.add_argument("--out", default=hashtag_index.HASHTAG_INDEX_PATH)
+    parser.add_argument("--dry-run", action="store_true", help="print the top tags instead of writing")
+    args = parser.parse_args(argv)
+
+    summaries = fetch_summaries(args.days)
+    packed = hashtag_index.pack(hashtag_index.score_history(summaries, min_count=args.min_count))
+    packed["generated_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    packed["source_rows"] = len(summaries)
+
+    if args.dry_run:
+        hashtag_index.load(packed)
+        for key in sorted(packed["spans"]):
+            btype, platform, lang = key.split("|")
+            print(f"{key:<32} {' '.join(hashtag_index.top(btype, platform, lang, 5))}")
+        return 0
+
+    tmp = f"{args.out}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(packed, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, args.out)
+    print(f"{len(summaries)} generations, {len(packed['spans'])} keys, "
+          f"{len(packed['tags'])} tags -> {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
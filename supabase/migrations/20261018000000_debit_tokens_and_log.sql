@@ -0,0 +1,61 @@
+-- Postir V2 — atomic token debit + generation log
+-- Called by api/generate.py, api/image.py and api/video.py through
+-- POST /rest/v1/rpc/debit_tokens_and_log with the service key.
+-- One round-trip: conditional increment of profiles.tokens_used, balance
+-- check, and the generations insert, all in a single transaction.
+
+create or replace function public.debit_tokens_and_log(
+    p_user_id        uuid,
+    p_tokens         integer,
+    p_type           text,
+    p_platform       text default null,
+    p_prompt_summary text default null
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_profile public.profiles%rowtype;
+begin
+    if p_tokens is null or p_tokens < 0 then
+        return jsonb_build_object('ok', false, 'error', 'invalid_amount');
+    end if;
+
+    update public.profiles
+       set tokens_used = tokens_used + p_tokens,
+           updated_at  = now()
+     where id = p_user_id
+       and (plan = 'pro' or tokens_total - tokens_used >= p_tokens)
+    returning * into v_profile;
+
+    if not found then
+        select * into v_profile from public.profiles where id = p_user_id;
+        if not found then
+            return jsonb_build_object('ok', false, 'error', 'profile_not_found');
+        end if;
+        return jsonb_build_object(
+            'ok', false, 'error', 'insufficient_tokens',
+            'plan', v_profile.plan,
+            'tokens_total', v_profile.tokens_total,
+            'tokens_used', v_profile.tokens_used,
+            'tokens_remaining', greatest(0, v_profile.tokens_total - v_profile.tokens_used)
+        );
+    end if;
+
+    insert into public.generations (user_id, type, tokens_consumed, platform, prompt_summary)
+    values (p_user_id, p_type, p_tokens, p_platform, p_prompt_summary);
+
+    return jsonb_build_object(
+        'ok', true,
+        'plan', v_profile.plan,
+        'tokens_total', v_profile.tokens_total,
+        'tokens_used', v_profile.tokens_used,
+        'tokens_remaining', greatest(0, v_profile.tokens_total - v_profile.tokens_used)
+    );
+end;
+$$;
+
+revoke all on function public.debit_tokens_and_log(uuid, integer, text, text, text) from public, anon, authenticated;
+grant execute on function public.debit_tokens_and_log(uuid, integer, text, text, text) to service_role;
@@ -0,0 +1,18 @@
+-- Postir V2 — persistent tier of the generation result cache
+-- Used by api/_core/gen_cache.py when GEN_CACHE_BACKEND=supabase.
+-- Rows are keyed by the sha256 of the normalized request and read/written
+-- with the service key only; expired rows are ignored on read and can be
+-- purged with: delete from public.generation_cache where expires_at < now();
+
+create table if not exists public.generation_cache (
+    key        text primary key,
+    value      jsonb not null,
+    expires_at timestamptz not null,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists generation_cache_expires_at_idx
+    on public.generation_cache (expires_at);
+
+alter table public.generation_cache enable row level security;
+revoke all on table public.generation_cache from anon, authenticated;
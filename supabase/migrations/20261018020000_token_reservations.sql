@@ -0,0 +1,107 @@
+-- Postir V2 — token reservations for bulk (multi-brand) generation
+-- Called by api/batch.py through /rest/v1/rpc/* with the service key.
+-- reserve_tokens holds the whole batch's tokens up front with the same
+-- conditional increment as debit_tokens_and_log (no generations row);
+-- settle_token_reservation refunds what was not used and logs one
+-- generations row per brand that succeeded, in a single transaction.
+
+create or replace function public.reserve_tokens(
+    p_user_id uuid,
+    p_tokens  integer
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_profile public.profiles%rowtype;
+begin
+    if p_tokens is null or p_tokens < 0 then
+        return jsonb_build_object('ok', false, 'error', 'invalid_amount');
+    end if;
+
+    update public.profiles
+       set tokens_used = tokens_used + p_tokens,
+           updated_at  = now()
+     where id = p_user_id
+       and (plan = 'pro' or tokens_total - tokens_used >= p_tokens)
+    returning * into v_profile;
+
+    if not found then
+        select * into v_profile from public.profiles where id = p_user_id;
+        if not found then
+            return jsonb_build_object('ok', false, 'error', 'profile_not_found');
+        end if;
+        return jsonb_build_object(
+            'ok', false, 'error', 'insufficient_tokens',
+            'plan', v_profile.plan,
+            'tokens_total', v_profile.tokens_total,
+            'tokens_used', v_profile.tokens_used,
+            'tokens_remaining', greatest(0, v_profile.tokens_total - v_profile.tokens_used)
+        );
+    end if;
+
+    return jsonb_build_object(
+        'ok', true,
+        'plan', v_profile.plan,
+        'tokens_total', v_profile.tokens_total,
+        'tokens_used', v_profile.tokens_used,
+        'tokens_remaining', greatest(0, v_profile.tokens_total - v_profile.tokens_used)
+    );
+end;
+$$;
+
+-- p_items: [{"type", "platform", "prompt_summary", "tokens_consumed"}, ...]
+-- for the brands that succeeded; their tokens stay debited, the rest of
+-- p_reserved is refunded.
+create or replace function public.settle_token_reservation(
+    p_user_id  uuid,
+    p_reserved integer,
+    p_items    jsonb
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_profile  public.profiles%rowtype;
+    v_consumed integer;
+begin
+    select coalesce(sum((item->>'tokens_consumed')::integer), 0) into v_consumed
+      from jsonb_array_elements(coalesce(p_items, '[]'::jsonb)) as item;
+
+    if p_reserved is null or p_reserved < 0 or v_consumed > p_reserved then
+        return jsonb_build_object('ok', false, 'error', 'invalid_amount');
+    end if;
+
+    update public.profiles
+       set tokens_used = greatest(0, tokens_used - (p_reserved - v_consumed)),
+           updated_at  = now()
+     where id = p_user_id
+    returning * into v_profile;
+
+    if not found then
+        return jsonb_build_object('ok', false, 'error', 'profile_not_found');
+    end if;
+
+    insert into public.generations (user_id, type, tokens_consumed, platform, prompt_summary)
+    select p_user_id, item->>'type', (item->>'tokens_consumed')::integer,
+           item->>'platform', item->>'prompt_summary'
+      from jsonb_array_elements(coalesce(p_items, '[]'::jsonb)) as item;
+
+    return jsonb_build_object(
+        'ok', true,
+        'plan', v_profile.plan,
+        'tokens_total', v_profile.tokens_total,
+        'tokens_used', v_profile.tokens_used,
+        'tokens_remaining', greatest(0, v_profile.tokens_total - v_profile.tokens_used)
+    );
+end;
+$$;
+
+revoke all on function public.reserve_tokens(uuid, integer) from public, anon, authenticated;
+grant execute on function public.reserve_tokens(uuid, integer) to service_role;
+revoke all on function public.settle_token_reservation(uuid, integer, jsonb) from public, anon, authenticated;
+grant execute on function public.settle_token_reservation(uuid, integer, jsonb) to service_role;
@@ -0,0 +1,27 @@
+-- Postir V2 — async generation jobs
+-- Used by api/_core/jobs.py when JOBS_BACKEND=supabase (the default on
+-- Vercel). One compact row per job: status, progress, partial items while
+-- running, the final payload once finished. Read and written with the
+-- service key only; api/jobs.py checks ownership. Finished rows expire
+-- after JOBS_TTL_SECONDS and are purged by the workers.
+
+create table if not exists public.generation_jobs (
+    id          text primary key,
+    user_id     uuid not null references public.profiles (id) on delete cascade,
+    kind        text not null,
+    status      text not null check (status in ('queued', 'running', 'done', 'failed')),
+    progress    jsonb,
+    partial     jsonb not null default '[]'::jsonb,
+    result      jsonb,
+    error       text,
+    http_status integer,
+    created_at  timestamptz not null default now(),
+    updated_at  timestamptz not null default now(),
+    expires_at  timestamptz not null
+);
+
+create index if not exists generation_jobs_expires_at_idx
+    on public.generation_jobs (expires_at);
+
+alter table public.generation_jobs enable row level security;
+revoke all on table public.generation_jobs from anon, authenticated;
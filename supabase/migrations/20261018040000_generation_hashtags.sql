@@ -0,0 +1,117 @@
+-- Postir V2 — hashtags used by each generation
+-- generations.hashtags holds the compact summary built by
+-- api/_core/hashtag_index.py (summarize): {"business_type", "posts":
+-- {platform: n}, "tags": {"platform|lang": {tag: count}}}. It is the input
+-- of scripts/refresh_hashtag_index.py, which re-ranks the hashtag index.
+-- debit_tokens_and_log and settle_token_reservation now take it along.
+
+alter table public.generations add column if not exists hashtags jsonb;
+
+create index if not exists generations_hashtags_created_at_idx
+    on public.generations (created_at) where hashtags is not null;
+
+drop function if exists public.debit_tokens_and_log(uuid, integer, text, text, text);
+
+create or replace function public.debit_tokens_and_log(
+    p_user_id        uuid,
+    p_tokens         integer,
+    p_type           text,
+    p_platform       text default null,
+    p_prompt_summary text default null,
+    p_hashtags       jsonb default null
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_profile public.profiles%rowtype;
+begin
+    if p_tokens is null or p_tokens < 0 then
+        return jsonb_build_object('ok', false, 'error', 'invalid_amount');
+    end if;
+
+    update public.profiles
+       set tokens_used = tokens_used + p_tokens,
+           updated_at  = now()
+     where id = p_user_id
+       and (plan = 'pro' or tokens_total - tokens_used >= p_tokens)
+    returning * into v_profile;
+
+    if not found then
+        select * into v_profile from public.profiles where id = p_user_id;
+        if not found then
+            return jsonb_build_object('ok', false, 'error', 'profile_not_found');
+        end if;
+        return jsonb_build_object(
+            'ok', false, 'error', 'insufficient_tokens',
+            'plan', v_profile.plan,
+            'tokens_total', v_profile.tokens_total,
+            'tokens_used', v_profile.tokens_used,
+            'tokens_remaining', greatest(0, v_profile.tokens_total - v_profile.tokens_used)
+        );
+    end if;
+
+    insert into public.generations (user_id, type, tokens_consumed, platform, prompt_summary, hashtags)
+    values (p_user_id, p_type, p_tokens, p_platform, p_prompt_summary, p_hashtags);
+
+    return jsonb_build_object(
+        'ok', true,
+        'plan', v_profile.plan,
+        'tokens_total', v_profile.tokens_total,
+        'tokens_used', v_profile.tokens_used,
+        'tokens_remaining', greatest(0, v_profile.tokens_total - v_profile.tokens_used)
+    );
+end;
+$$;
+
+revoke all on function public.debit_tokens_and_log(uuid, integer, text, text, text, jsonb) from public, anon, authenticated;
+grant execute on function public.debit_tokens_and_log(uuid, integer, text, text, text, jsonb) to service_role;
+
+-- p_items entries may now carry "hashtags" as well.
+create or replace function public.settle_token_reservation(
+    p_user_id  uuid,
+    p_reserved integer,
+    p_items    jsonb
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_profile  public.profiles%rowtype;
+    v_consumed integer;
+begin
+    select coalesce(sum((item->>'tokens_consumed')::integer), 0) into v_consumed
+      from jsonb_array_elements(coalesce(p_items, '[]'::jsonb)) as item;
+
+    if p_reserved is null or p_reserved < 0 or v_consumed > p_reserved then
+        return jsonb_build_object('ok', false, 'error', 'invalid_amount');
+    end if;
+
+    update public.profiles
+       set tokens_used = greatest(0, tokens_used - (p_reserved - v_consumed)),
+           updated_at  = now()
+     where id = p_user_id
+    returning * into v_profile;
+
+    if not found then
+        return jsonb_build_object('ok', false, 'error', 'profile_not_found');
+    end if;
+
+    insert into public.generations (user_id, type, tokens_consumed, platform, prompt_summary, hashtags)
+    select p_user_id, item->>'type', (item->>'tokens_consumed')::integer,
+           item->>'platform', item->>'prompt_summary', item->'hashtags'
+      from jsonb_array_elements(coalesce(p_items, '[]'::jsonb)) as item;
+
+    return jsonb_build_object(
+        'ok', true,
+        'plan', v_profile.plan,
+        'tokens_total', v_profile.tokens_total,
+        'tokens_used', v_profile.tokens_used,
+        'tokens_remaining', greatest(0, v_profile.tokens_total - v_profile.tokens_used)
+    );
+end;
+$$;
@@ -0,0 +1,20 @@
+-- Postir V2 — near-duplicate sketches of delivered posts
+-- Written by api/_core/near_dup.py: one row per delivered calendar with the
+-- MinHash signatures of its model-written posts, per language, as base64
+-- little-endian uint16 (60 values = 120 bytes per post). Loaded per user
+-- (most recent NEAR_DUP_MAX_ROWS within NEAR_DUP_HISTORY_DAYS) to flag new
+-- posts that repeat old ones. Service key only.
+
+create table if not exists public.generation_sketches (
+    id         bigserial primary key,
+    user_id    uuid not null references public.profiles (id) on delete cascade,
+    posts      integer not null default 0,
+    signatures jsonb not null,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists generation_sketches_user_created_idx
+    on public.generation_sketches (user_id, created_at desc);
+
+alter table public.generation_sketches enable row level security;
+revoke all on table public.generation_sketches from anon, authenticated;
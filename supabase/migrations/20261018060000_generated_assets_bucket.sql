@@ -0,0 +1,10 @@
+-- Postir V2 — content-addressed asset bucket
+-- Private Storage bucket used by api/_core/asset_store.py when
+-- ASSET_STORE_BACKEND=supabase (the default on Vercel). Objects are named
+-- <sha256>.<ext> and never change; they are written and read with the
+-- service key only and served to clients by /api/assets/{key}.
+
+insert into storage.buckets (id, name, public, file_size_limit, allowed_mime_types)
+values ('generated-assets', 'generated-assets', false, 20971520,
+        array['image/png', 'image/jpeg', 'image/webp'])
+on conflict (id) do nothing;
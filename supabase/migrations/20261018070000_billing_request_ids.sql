@@ -0,0 +1,168 @@
+-- Postir V2 — idempotent billing RPCs
+-- debit_tokens_and_log and settle_token_reservation take a p_request_id
+-- generated once per call by api/_core/supabase.py. The same id travels
+-- with the call when it is queued and replayed from the write-behind
+-- spill file, so a call that timed out client-side but committed is not
+-- applied a second time: a repeated id returns the first call's result
+-- with "duplicate": true and changes nothing.
+
+create table if not exists public.billing_requests (
+    request_id uuid primary key,
+    user_id    uuid not null,
+    function   text not null,
+    result     jsonb,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists billing_requests_created_at_idx
+    on public.billing_requests (created_at);
+
+alter table public.billing_requests enable row level security;
+revoke all on table public.billing_requests from anon, authenticated;
+
+drop function if exists public.debit_tokens_and_log(uuid, integer, text, text, text, jsonb);
+
+create or replace function public.debit_tokens_and_log(
+    p_user_id        uuid,
+    p_tokens         integer,
+    p_type           text,
+    p_platform       text default null,
+    p_prompt_summary text default null,
+    p_hashtags       jsonb default null,
+    p_request_id     uuid default null
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_profile public.profiles%rowtype;
+    v_result  jsonb;
+begin
+    if p_tokens is null or p_tokens < 0 then
+        return jsonb_build_object('ok', false, 'error', 'invalid_amount');
+    end if;
+
+    if p_request_id is not null then
+        -- A concurrent call with the same id waits here for the first to commit.
+        insert into public.billing_requests (request_id, user_id, function)
+        values (p_request_id, p_user_id, 'debit_tokens_and_log')
+        on conflict (request_id) do nothing;
+        if not found then
+            select result into v_result from public.billing_requests where request_id = p_request_id;
+            return coalesce(v_result, jsonb_build_object('ok', true)) || jsonb_build_object('duplicate', true);
+        end if;
+    end if;
+
+    update public.profiles
+       set tokens_used = tokens_used + p_tokens,
+           updated_at  = now()
+     where id = p_user_id
+       and (plan = 'pro' or tokens_total - tokens_used >= p_tokens)
+    returning * into v_profile;
+
+    if not found then
+        select * into v_profile from public.profiles where id = p_user_id;
+        if not found then
+            v_result := jsonb_build_object('ok', false, 'error', 'profile_not_found');
+        else
+            v_result := jsonb_build_object(
+                'ok', false, 'error', 'insufficient_tokens',
+                'plan', v_profile.plan,
+                'tokens_total', v_profile.tokens_total,
+                'tokens_used', v_profile.tokens_used,
+                'tokens_remaining', greatest(0, v_profile.tokens_total - v_profile.tokens_used)
+            );
+        end if;
+    else
+        insert into public.generations (user_id, type, tokens_consumed, platform, prompt_summary, hashtags)
+        values (p_user_id, p_type, p_tokens, p_platform, p_prompt_summary, p_hashtags);
+
+        v_result := jsonb_build_object(
+            'ok', true,
+            'plan', v_profile.plan,
+            'tokens_total', v_profile.tokens_total,
+            'tokens_used', v_profile.tokens_used,
+            'tokens_remaining', greatest(0, v_profile.tokens_total - v_profile.tokens_used)
+        );
+    end if;
+
+    if p_request_id is not null then
+        update public.billing_requests set result = v_result where request_id = p_request_id;
+    end if;
+    return v_result;
+end;
+$$;
+
+revoke all on function public.debit_tokens_and_log(uuid, integer, text, text, text, jsonb, uuid)
+    from public, anon, authenticated;
+grant execute on function public.debit_tokens_and_log(uuid, integer, text, text, text, jsonb, uuid) to service_role;
+
+drop function if exists public.settle_token_reservation(uuid, integer, jsonb);
+
+create or replace function public.settle_token_reservation(
+    p_user_id    uuid,
+    p_reserved   integer,
+    p_items      jsonb,
+    p_request_id uuid default null
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_profile  public.profiles%rowtype;
+    v_consumed integer;
+    v_result   jsonb;
+begin
+    select coalesce(sum((item->>'tokens_consumed')::integer), 0) into v_consumed
+      from jsonb_array_elements(coalesce(p_items, '[]'::jsonb)) as item;
+
+    if p_reserved is null or p_reserved < 0 or v_consumed > p_reserved then
+        return jsonb_build_object('ok', false, 'error', 'invalid_amount');
+    end if;
+
+    if p_request_id is not null then
+        insert into public.billing_requests (request_id, user_id, function)
+        values (p_request_id, p_user_id, 'settle_token_reservation')
+        on conflict (request_id) do nothing;
+        if not found then
+            select result into v_result from public.billing_requests where request_id = p_request_id;
+            return coalesce(v_result, jsonb_build_object('ok', true)) || jsonb_build_object('duplicate', true);
+        end if;
+    end if;
+
+    update public.profiles
+       set tokens_used = greatest(0, tokens_used - (p_reserved - v_consumed)),
+           updated_at  = now()
+     where id = p_user_id
+    returning * into v_profile;
+
+    if not found then
+        v_result := jsonb_build_object('ok', false, 'error', 'profile_not_found');
+    else
+        insert into public.generations (user_id, type, tokens_consumed, platform, prompt_summary, hashtags)
+        select p_user_id, item->>'type', (item->>'tokens_consumed')::integer,
+               item->>'platform', item->>'prompt_summary', item->'hashtags'
+          from jsonb_array_elements(coalesce(p_items, '[]'::jsonb)) as item;
+
+        v_result := jsonb_build_object(
+            'ok', true,
+            'plan', v_profile.plan,
+            'tokens_total', v_profile.tokens_total,
+            'tokens_used', v_profile.tokens_used,
+            'tokens_remaining', greatest(0, v_profile.tokens_total - v_profile.tokens_used)
+        );
+    end if;
+
+    if p_request_id is not null then
+        update public.billing_requests set result = v_result where request_id = p_request_id;
+    end if;
+    return v_result;
+end;
+$$;
+
+revoke all on function public.settle_token_reservation(uuid, integer, jsonb, uuid) from public, anon, authenticated;
+grant execute on function public.settle_token_reservation(uuid, integer, jsonb, uuid) to service_role;
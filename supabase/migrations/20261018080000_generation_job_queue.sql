@@ -0,0 +1,42 @@
+-- Postir V2 — queue for async generation jobs
+-- With JOBS_BACKEND=supabase a job is stored queued with the request that
+-- made it, and api/job_worker.py (Vercel Cron) claims and runs it in its
+-- own invocation. claim_generation_job marks the oldest queued job running
+-- and returns it; FOR UPDATE SKIP LOCKED keeps concurrent workers from
+-- claiming the same job. Jobs queued longer than p_max_age_seconds are
+-- reported failed by the API and are no longer claimed.
+
+alter table public.generation_jobs add column if not exists request jsonb;
+
+create index if not exists generation_jobs_queued_idx
+    on public.generation_jobs (created_at)
+    where status = 'queued';
+
+create or replace function public.claim_generation_job(
+    p_max_age_seconds integer
+)
+returns setof public.generation_jobs
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    return query
+    update public.generation_jobs as j
+       set status     = 'running',
+           updated_at = now()
+     where j.id = (
+               select q.id
+                 from public.generation_jobs as q
+                where q.status = 'queued'
+                  and q.created_at > now() - make_interval(secs => p_max_age_seconds)
+                order by q.created_at
+                limit 1
+                  for update skip locked
+           )
+    returning j.*;
+end;
+$$;
+
+revoke all on function public.claim_generation_job(integer) from public, anon, authenticated;
+grant execute on function public.claim_generation_job(integer) to service_role;
@@ -0,0 +1,76 @@
+-- Postir V2 — idempotent token reservations
+-- reserve_tokens takes a p_request_id like debit_tokens_and_log and
+-- settle_token_reservation (20261018070000_billing_request_ids.sql), so a
+-- retried reservation holds the batch's tokens once: a repeated id returns
+-- the first call's result with "duplicate": true and changes nothing.
+
+drop function if exists public.reserve_tokens(uuid, integer);
+
+create or replace function public.reserve_tokens(
+    p_user_id    uuid,
+    p_tokens     integer,
+    p_request_id uuid default null
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_profile public.profiles%rowtype;
+    v_result  jsonb;
+begin
+    if p_tokens is null or p_tokens < 0 then
+        return jsonb_build_object('ok', false, 'error', 'invalid_amount');
+    end if;
+
+    if p_request_id is not null then
+        -- A concurrent call with the same id waits here for the first to commit.
+        insert into public.billing_requests (request_id, user_id, function)
+        values (p_request_id, p_user_id, 'reserve_tokens')
+        on conflict (request_id) do nothing;
+        if not found then
+            select result into v_result from public.billing_requests where request_id = p_request_id;
+            return coalesce(v_result, jsonb_build_object('ok', true)) || jsonb_build_object('duplicate', true);
+        end if;
+    end if;
+
+    update public.profiles
+       set tokens_used = tokens_used + p_tokens,
+           updated_at  = now()
+     where id = p_user_id
+       and (plan = 'pro' or tokens_total - tokens_used >= p_tokens)
+    returning * into v_profile;
+
+    if not found then
+        select * into v_profile from public.profiles where id = p_user_id;
+        if not found then
+            v_result := jsonb_build_object('ok', false, 'error', 'profile_not_found');
+        else
+            v_result := jsonb_build_object(
+                'ok', false, 'error', 'insufficient_tokens',
+                'plan', v_profile.plan,
+                'tokens_total', v_profile.tokens_total,
+                'tokens_used', v_profile.tokens_used,
+                'tokens_remaining', greatest(0, v_profile.tokens_total - v_profile.tokens_used)
+            );
+        end if;
+    else
+        v_result := jsonb_build_object(
+            'ok', true,
+            'plan', v_profile.plan,
+            'tokens_total', v_profile.tokens_total,
+            'tokens_used', v_profile.tokens_used,
+            'tokens_remaining', greatest(0, v_profile.tokens_total - v_profile.tokens_used)
+        );
+    end if;
+
+    if p_request_id is not null then
+        update public.billing_requests set result = v_result where request_id = p_request_id;
+    end if;
+    return v_result;
+end;
+$$;
+
+revoke all on function public.reserve_tokens(uuid, integer, uuid) from public, anon, authenticated;
+grant execute on function public.reserve_tokens(uuid, integer, uuid) to service_role;